@@ -4,6 +4,9 @@
 # Import standard libraries.
 import os, sys, string, re, time, random, select, errno
 
+# Import kpython modules.
+import kcodec, ktoken
+
 # This class creates an object having the specified attributes.
 # Example: person = Namespace(name="Mickey", age=18)
 class Namespace(object):
@@ -62,44 +65,22 @@ def fill_string(s, min):
     while len(s) < min: s += ' '
     return s
     
-# This function converts a string to hexadecimal. Function taken from the Python
-# Cookbook.
+# This function converts a string to hexadecimal. See kcodec.
 def str_to_hex(s):
-    lst = []
-    for ch in s:
-        hv = hex(ord(ch)).replace('0x', '')
-        if len(hv) == 1:
-            hv = '0'+hv
-        lst.append(hv)
-    
-    return reduce(lambda x,y:x+y, lst)
+    return kcodec.hex_encode(s)
 
-# This function converts an hexadecimal number to a string.
+# This function converts an hexadecimal number to a string. See kcodec.
 def hex_to_str(s):
-    return s and chr(string.atoi(s[:2], base=16)) + hex_to_str(s[2:]) or ''
+    return kcodec.hex_decode(s)
 
-# This function converts an ISO-8859-1 string to an UTF8 string.
+# This function converts an ISO-8859-1 string to an UTF8 string. See kcodec.
 def latin1_to_utf8(name):
-    res = ""
-    for c in name:
-        o = ord(c)
-        if (o < 128):
-            res += c
-        else:
-            res += chr(0xC0 | ((o & 0xC0) >> 6))
-            res += chr(0x80 | (o & 0x3F))
-    return res
+    return kcodec.latin1_to_utf8(name)
 
 # This function generates a random string, suitable for a username or password.
+# See ktoken.
 def gen_random(nb):
-    generator = random.SystemRandom()
-    s = ""
-    
-    for i in range(nb):
-        s += generator.choice(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm', 
-                               'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z',
-                               '0', '1', '2', '3', '4', '5', '6', '7', '8', '9'])
-    return s
+    return ktoken.gen_token(nb)
 
 # This function checks if the exception specified corresponds to EINTR or
 # EAGAIN. If not, the exception is raised.
@@ -119,6 +100,8 @@ def select_wrapper(rlist, wlist, xlist, timeout):
 #   (tested only with those types yet: bool, int, list, str, dict
 # - allows attributes of any types if attribute name is in self._attr_any_type_definitions
 # - doesn't allow non-defined attributes
+# The sub-classes that know their attributes in advance should derive from
+# StaticAttributesStore instead.
 class DefinedAttributesStore(object):
     ## SUPER ME ##
     def __init__(self):
@@ -154,6 +137,93 @@ class DefinedAttributesStore(object):
         # no chance
         raise AttributeError, name
 
+# This function returns the __setattr__ method of a StaticAttributesStore
+# sub-class, given its lookup table: the type of the writable attributes (None
+# for any type), AttributeError for the others.
+def _static_attributes_setattr(attr_checks):
+    get_check = attr_checks.get
+    def __setattr__(self, name, value):
+        attr_type = get_check(name, AttributeError)
+        if attr_type != None:
+            if attr_type is AttributeError:
+                raise AttributeError, name
+            if type(value) != attr_type:
+                raise TypeError, "Attribute '%s' expects values of type '%s'." % ( name, attr_type )
+        object.__setattr__(self, name, value)
+    return __setattr__
+
+# This metaclass compiles the attribute definitions of the StaticAttributesStore
+# sub-classes, declared as class attributes (_attr_read_only,
+# _attr_type_definitions and _attr_any_type_definitions), into a single
+# name-to-type table merged with those of the base classes. The attributes are
+# stored in generated __slots__.
+class StaticAttributesStoreType(type):
+    def __new__(meta, name, bases, d):
+        attr_types = {}
+        attr_read_only = set()
+        for base in bases:
+            attr_types.update(getattr(base, "_attr_types", {}))
+            attr_read_only |= getattr(base, "_attr_read_only_set", set())
+        inherited = set(attr_types.keys()) | attr_read_only
+
+        for attr_type, attr_list in d.get("_attr_type_definitions", {}).items():
+            for attr_name in attr_list: attr_types[attr_name] = attr_type
+        for attr_name in d.get("_attr_any_type_definitions", []):
+            attr_types[attr_name] = None
+        attr_read_only |= set(d.get("_attr_read_only", []))
+
+        # Generate the slots of the attributes not stored by the base classes.
+        # The sub-classes that declare nothing get empty slots, so that their
+        # instances have no __dict__ either.
+        new_attrs = (set(attr_types.keys()) | attr_read_only) - inherited
+        d["__slots__"] = tuple(d.get("__slots__", ())) + tuple(sorted(new_attrs))
+        d["_attr_types"] = attr_types
+        d["_attr_read_only_set"] = attr_read_only
+
+        # Single lookup table for __setattr__.
+        attr_checks = attr_types.copy()
+        for attr_name in attr_read_only: attr_checks[attr_name] = AttributeError
+        d["_attr_checks"] = attr_checks
+
+        # Generate __setattr__, unless the class defines its own. When python
+        # runs optimized (-O), the types are not checked: the classes without
+        # read-only attributes use object.__setattr__ (the slots still reject
+        # the undefined attributes).
+        if not d.has_key("__setattr__"):
+            if __debug__ or attr_read_only: d["__setattr__"] = _static_attributes_setattr(attr_checks)
+            else: d["__setattr__"] = object.__setattr__
+
+        return type.__new__(meta, name, bases, d)
+
+# This is an attribute store like DefinedAttributesStore, for the classes that
+# declare their attributes statically, as class attributes:
+#   class Foo(StaticAttributesStore):
+#       _attr_type_definitions = { int : [ "count" ] }
+#       _attr_any_type_definitions = [ "value" ]
+#       _attr_read_only = [ "id" ]
+# The definitions are compiled once per class (see StaticAttributesStoreType):
+# the instances have no __dict__ and each write is checked with a single
+# lookup, unless python runs optimized (-O). Read-only attributes are
+# initialized with _init_read_only(). The sub-classes can add definitions; they
+# cannot use another metaclass.
+class StaticAttributesStore(object):
+    __metaclass__ = StaticAttributesStoreType
+
+    # initialize a read-only attribute
+    def _init_read_only(self, name, value):
+        object.__setattr__(self, name, value)
+
+    # pickling support (needed with __slots__ for the protocols < 2, and to
+    # restore the read-only attributes)
+    def __getstate__(self):
+        state = {}
+        for name in self._attr_checks.keys():
+            if hasattr(self, name): state[name] = getattr(self, name)
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
 
 # This function validates that string does not contains a character in the provided list.
 # Characters list must contain integers representing characters.
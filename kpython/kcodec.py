@@ -0,0 +1,197 @@
+# This module contains the binary/text conversion functions: hexadecimal
+# encoding and ISO-8859-1 <-> UTF-8 transcoding. The work is done by binascii
+# and by the codecs of the standard library, which run in C and in linear time.
+#
+# The streaming variants convert large buffers by chunks. A coder object is fed
+# the chunks with process() and keeps the partial input that cannot be
+# converted yet (half of a hexadecimal digit pair, part of an UTF-8 sequence)
+# for the next chunk. kcodec_stream() connects a coder to file objects.
+
+import binascii, codecs
+
+# Default size of the chunks read by kcodec_stream().
+KCODEC_CHUNK_SIZE = 64 * 1024
+
+# This function returns the lowercase hexadecimal representation of the
+# string specified. Unicode strings are encoded in ISO-8859-1 first.
+def hex_encode(s):
+    if isinstance(s, unicode): s = s.encode('latin-1')
+    return binascii.hexlify(s)
+
+# This function converts a hexadecimal string, in lower or upper case, back to
+# a string. A trailing odd digit is decoded as a single digit, as kbase always
+# did. A ValueError is raised if the string contains other characters.
+def hex_decode(s):
+    if not s: return ''
+    try:
+        if len(s) % 2: return binascii.unhexlify(s[:-1]) + chr(int(s[-1], 16))
+        return binascii.unhexlify(s)
+    except TypeError, e:
+        raise ValueError("invalid hexadecimal string: %s" % (str(e)))
+
+# This function converts an ISO-8859-1 string to an UTF-8 string. Unicode
+# strings are simply encoded in UTF-8.
+def latin1_to_utf8(s):
+    if isinstance(s, unicode): return s.encode('utf-8')
+    return s.decode('latin-1').encode('utf-8')
+
+# This function converts an UTF-8 string to an ISO-8859-1 string. 'errors' is
+# the error handling scheme of the codecs ('strict', 'replace' or 'ignore'); it
+# applies both to the invalid UTF-8 sequences and to the characters that have
+# no ISO-8859-1 equivalent.
+def utf8_to_latin1(s, errors='strict'):
+    return s.decode('utf-8', errors).encode('latin-1', errors)
+
+# Streaming hexadecimal encoder.
+class HexEncoder(object):
+
+    # This method returns the encoded version of the chunk specified.
+    def process(self, data, final=False):
+        return binascii.hexlify(data)
+
+# Streaming hexadecimal decoder. An odd digit at the end of a chunk is kept
+# for the next chunk.
+class HexDecoder(object):
+
+    def __init__(self):
+        self.pending = ''
+
+    # This method returns the decoded version of the chunk specified, minus the
+    # trailing odd digit. When 'final' is true, a trailing odd digit is decoded
+    # alone, as hex_decode() does.
+    def process(self, data, final=False):
+        data = self.pending + data
+        if final:
+            self.pending = ''
+            return hex_decode(data)
+        if len(data) % 2:
+            self.pending = data[-1]
+            data = data[:-1]
+        else:
+            self.pending = ''
+        return hex_decode(data)
+
+# Streaming ISO-8859-1 to UTF-8 transcoder. Every byte stands for a character,
+# so no state is kept.
+class Latin1ToUtf8(object):
+
+    def process(self, data, final=False):
+        return data.decode('latin-1').encode('utf-8')
+
+# Streaming UTF-8 to ISO-8859-1 transcoder. The UTF-8 sequences split between
+# two chunks are kept by the incremental decoder of the codecs module.
+class Utf8ToLatin1(object):
+
+    def __init__(self, errors='strict'):
+        self.errors = errors
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors)
+
+    def process(self, data, final=False):
+        return self.decoder.decode(data, final).encode('latin-1', self.errors)
+
+# This function converts the content of the file object 'input' with the coder
+# specified and writes the result to the file object 'output', by chunks of
+# 'chunk_size' bytes. It returns the number of bytes written.
+def kcodec_stream(coder, input, output, chunk_size=KCODEC_CHUNK_SIZE):
+    written = 0
+    while 1:
+        data = input.read(chunk_size)
+        if not data: break
+        result = coder.process(data)
+        if result:
+            output.write(result)
+            written += len(result)
+    result = coder.process('', final=True)
+    if result:
+        output.write(result)
+        written += len(result)
+    return written
+
+
+# non-exhaustive tests
+if __name__ == "__main__":
+    import sys, time, string, StringIO
+
+    # Reference implementations (the former kbase functions).
+    def old_str_to_hex(s):
+        lst = []
+        for ch in s:
+            hv = hex(ord(ch)).replace('0x', '')
+            if len(hv) == 1:
+                hv = '0'+hv
+            lst.append(hv)
+        return reduce(lambda x,y:x+y, lst)
+
+    def old_hex_to_str(s):
+        return s and chr(string.atoi(s[:2], base=16)) + old_hex_to_str(s[2:]) or ''
+
+    def old_latin1_to_utf8(name):
+        res = ""
+        for c in name:
+            o = ord(c)
+            if (o < 128):
+                res += c
+            else:
+                res += chr(0xC0 | ((o & 0xC0) >> 6))
+                res += chr(0x80 | (o & 0x3F))
+        return res
+
+    samples = [ "a", "/tmp/kas.sock", "".join(map(chr, range(256))), "caf\xe9 cr\xe8me", "\x00\xff" * 100 ]
+    for s in samples:
+        assert hex_encode(s) == old_str_to_hex(s)
+        assert hex_decode(hex_encode(s)) == s == old_hex_to_str(hex_encode(s))
+        assert hex_decode(hex_encode(s).upper()) == s
+        assert latin1_to_utf8(s) == old_latin1_to_utf8(s)
+        assert utf8_to_latin1(latin1_to_utf8(s)) == s
+    assert hex_decode("abc") == old_hex_to_str("abc")
+    assert hex_encode("") == "" and hex_decode("") == ""
+    try:
+        hex_decode("zz")
+        print "ERROR: got no exception but should have."
+    except ValueError:
+        pass
+    assert utf8_to_latin1("a\xe2\x82\xacb", 'replace') == "a?b"
+
+    # Streaming, with chunks that split the digit pairs and the UTF-8 sequences.
+    data = "".join(map(chr, range(256))) * 50
+    for chunk_size in (1, 3, 7, 4096):
+        for coder, decoder, encode in ((HexEncoder(), HexDecoder(), hex_encode),
+                                       (Latin1ToUtf8(), Utf8ToLatin1(), latin1_to_utf8)):
+            encoded = StringIO.StringIO()
+            kcodec_stream(coder, StringIO.StringIO(data), encoded, chunk_size)
+            assert encoded.getvalue() == encode(data)
+            decoded = StringIO.StringIO()
+            kcodec_stream(decoder, StringIO.StringIO(encoded.getvalue()), decoded, chunk_size)
+            assert decoded.getvalue() == data
+    print "Output identical to the reference implementations."
+
+    def bench(name, func, nb):
+        start = time.time()
+        for i in range(nb): func()
+        print "%-40s %.2f us" % (name, (time.time() - start) * 1000000.0 / nb)
+
+    path = "/var/run/teambox/kasmond.sock"
+    bench("socket path to hex (old)", lambda: old_str_to_hex(path), 10000)
+    bench("socket path to hex", lambda: hex_encode(path), 10000)
+    hex_path = hex_encode(path)
+    bench("hex to socket path (old)", lambda: old_hex_to_str(hex_path), 10000)
+    bench("hex to socket path", lambda: hex_decode(hex_path), 10000)
+
+    # The old hex_to_str() recurses once per byte: it fails on large strings.
+    block = "".join(map(chr, range(256))) * 3
+    hex_block = hex_encode(block)
+    bench("768 bytes to hex (old)", lambda: old_str_to_hex(block), 200)
+    bench("768 bytes to hex", lambda: hex_encode(block), 200)
+    bench("hex to 768 bytes (old)", lambda: old_hex_to_str(hex_block), 200)
+    bench("hex to 768 bytes", lambda: hex_decode(hex_block), 200)
+    bench("768 bytes latin1 to utf8 (old)", lambda: old_latin1_to_utf8(block), 200)
+    bench("768 bytes latin1 to utf8", lambda: latin1_to_utf8(block), 200)
+    try:
+        old_hex_to_str(hex_encode("x" * (sys.getrecursionlimit() + 10)))
+    except RuntimeError:
+        print "old hex_to_str() hits the recursion limit above %i bytes" % (sys.getrecursionlimit())
+
+    big = block * 10000
+    bench("7.5 MB hex encode + streamed decode",
+          lambda: kcodec_stream(HexDecoder(), StringIO.StringIO(hex_encode(big)), StringIO.StringIO()), 3)
+
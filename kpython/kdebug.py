@@ -19,9 +19,25 @@ For this and for the pluggable feature to work, every module must use the same k
 >   import kdebug
 instead of:
 >   from kdebug import *  # which appears to load a kdebug "instance" for every module
+
+Messages are formatted lazily, only when they are output: pass the format arguments after the debug_id, or
+pass a callable returning the message. Calls for disabled levels then cost a function call and a dict lookup.
+> kdebug.debug(3, "value='%s'", "dummy", value)
+> kdebug.debug(3, lambda: expensive_dump(value), "dummy")
+Use enabled() to skip computing expensive debug information.
+
+The flight recorder keeps the last debug events of a debug_id in memory, whether they are output or not, so
+that the recent history can be dumped when something breaks:
+> kdebug.set_record_level(5, "dummy")
+> kdebug.install_recorder_excepthook()  # dump on uncaught exceptions
+> kdebug.install_recorder_signal(signal.SIGUSR1)  # dump on signal
+> kdebug.dump_recorder()  # dump on demand
+The messages of the recorded events are formatted when they are recorded, and truncated to
+RECORDER_MESSAGE_SIZE characters, so that the recorder uses bounded memory and keeps no reference to the
+arguments.
 """
 
-import sys, inspect
+import sys, inspect, time, collections
 
 # default ID
 DEFAULT_ID="main"
@@ -30,6 +46,31 @@ DEFAULT_ID="main"
 last_debug_level = {DEFAULT_ID : None}
 debug_level = {DEFAULT_ID : None} 
 
+# current debug level of every debug_id for which debug is enabled
+# updated by set_debug_level()
+enabled_levels = {}
+
+# number of events kept by default by the flight recorder, per debug_id
+RECORDER_SIZE = 256
+
+# maximum length of the messages kept by the flight recorder
+RECORDER_MESSAGE_SIZE = 1024
+
+# recorded level and recorded events (ring buffers) of every debug_id for which the flight recorder is enabled
+# updated by set_record_level()
+record_levels = {}
+recorders = {}
+
+# highest level output or recorded for every debug_id - see enabled()
+active_levels = {}
+
+def _update_active_level(debug_id):
+    level = max(enabled_levels.get(debug_id, 0), record_levels.get(debug_id, 0))
+    if level > 0:
+        active_levels[debug_id] = level
+    elif active_levels.has_key(debug_id):
+        del active_levels[debug_id]
+
 def enable_debug(debug_id=DEFAULT_ID):
     """
     Enable debug for debug_id
@@ -80,6 +121,13 @@ def set_debug_level(level, debug_id=DEFAULT_ID):
             last_debug_level[debug_id] = debug_level[debug_id]
     debug_level[debug_id]= level
 
+    # update the enabled levels table
+    if level > 0:
+        enabled_levels[debug_id] = int(level)
+    elif enabled_levels.has_key(debug_id):
+        del enabled_levels[debug_id]
+    _update_active_level(debug_id)
+
 def set_debug_levels(d):
     """
     Sets current debug levels with a dictionnary.
@@ -111,14 +159,130 @@ def would_debug(level, debug_id=DEFAULT_ID):
         return True
     return False
 
-def debug(level, message, debug_id=DEFAULT_ID):
+def enabled(level, debug_id=DEFAULT_ID):
+    """
+    Returns wheither a message of this level would be output or recorded for debug_id
+    Cheap check: a single lookup in a table updated by set_debug_level and set_record_level.
+    """
+
+    if type(debug_id) is not str:
+        debug_id = str(debug_id)
+    return level <= active_levels.get(debug_id, 0) and level > 0
+
+def debug(level, message, debug_id=DEFAULT_ID, *args):
     """
     Default function
+    message is formatted with args, or called if it is a callable, only when it is output.
+    """
+
+    # the tables are indexed by strings (str() is only called for the other types, e.g. ints)
+    if type(debug_id) is not str:
+        debug_id = str(debug_id)
+
+    # fast path: debug and recording disabled for this level
+    if level > active_levels.get(debug_id, 0):
+        return
+
+    if level < 1:
+        raise Exception("You must use a level > 0.")
+    if level <= record_levels.get(debug_id, 0):
+        recorders[debug_id].append((time.time(), level, _record_message(message, args)))
+    if level <= enabled_levels.get(debug_id, 0):
+        debug_output_callable("debug:%i:%s:%s" % (level, debug_id, _format_message(message, args)) )
+
+def _format_message(message, args):
+    if args:
+        return message % args
+    elif callable(message):
+        return message()
+    return message
+
+def _record_message(message, args):
+    try:
+        message = "%s" % ( _format_message(message, args), )
+    except Exception, e:
+        message = "%r %r (formatting failed: %s)" % ( message, args, e )
+    if len(message) > RECORDER_MESSAGE_SIZE:
+        message = message[:RECORDER_MESSAGE_SIZE] + "..."
+    return message
+
+def set_record_level(level, debug_id=DEFAULT_ID, size=RECORDER_SIZE):
+    """
+    Sets the level of the debug events recorded by the flight recorder for debug_id
+    The last <size> events are kept. Set to 0 to stop recording (the recorded events are kept).
     """
 
     debug_id = str(debug_id)
-    if would_debug(level, debug_id):
-        debug_output_callable("debug:%i:%s:%s" % (level, debug_id, message) )
+    if level < 0:
+        raise Exception("Invalid level. Must be an positive integer (including 0).")
+    if level > 0:
+        record_levels[debug_id] = int(level)
+        if not recorders.has_key(debug_id) or recorders[debug_id].maxlen != size:
+            recorders[debug_id] = collections.deque(recorders.get(debug_id, []), size)
+    elif record_levels.has_key(debug_id):
+        del record_levels[debug_id]
+    _update_active_level(debug_id)
+
+def get_recorded_events(debug_id=None):
+    """
+    Returns the events recorded for debug_id (or for all debug_ids), oldest first, as formatted lines
+    """
+
+    events = []
+    for recorder_id, recorder in recorders.items():
+        if debug_id == None or recorder_id == str(debug_id):
+            events += [ ( event, recorder_id ) for event in list(recorder) ]
+    events.sort(key=lambda e: e[0][0])
+
+    lines = []
+    for ( t, level, message ), recorder_id in events:
+        lines.append("record:%s.%03i:%i:%s:%s" % \
+            ( time.strftime("%H:%M:%S", time.localtime(t)), int(t * 1000) % 1000, level, recorder_id, message ))
+    return lines
+
+def dump_recorder(debug_id=None, output=None, clear=False):
+    """
+    Outputs the events recorded for debug_id (or for all debug_ids) with the output callable
+    (the debug output callable by default)
+    """
+
+    if output == None:
+        output = debug_output_callable
+    lines = get_recorded_events(debug_id)
+    if len(lines):
+        output("flight recorder: %i events" % ( len(lines) ))
+        for line in lines:
+            output(line)
+    if clear:
+        clear_recorder(debug_id)
+
+def clear_recorder(debug_id=None):
+    """
+    Forgets the events recorded for debug_id (or for all debug_ids)
+    """
+
+    for recorder_id, recorder in recorders.items():
+        if debug_id == None or recorder_id == str(debug_id):
+            recorder.clear()
+
+def install_recorder_excepthook():
+    """
+    Dumps the flight recorder when an exception is not caught
+    """
+
+    previous_excepthook = sys.excepthook
+    def excepthook(*exc_info):
+        dump_recorder()
+        previous_excepthook(*exc_info)
+    sys.excepthook = excepthook
+
+def install_recorder_signal(signum):
+    """
+    Dumps the flight recorder when the signal specified is received (e.g. signal.SIGUSR1)
+    """
+
+    import signal
+    signal.signal(signum, lambda signum, frame: dump_recorder())
 
 def debug_default_callable(m):
     """
@@ -163,5 +327,48 @@ if __name__ == "__main__":
     debug(5, "You should not see this 11", "libx")
     set_debug_level(5, "libx")
     debug(5, "You should see this - 12.", "libx")
+    debug(5, "You should see this - %i (%s).", "libx", 13, "lazy")
+    debug(5, lambda: "You should see this - 14 (callable).", "libx")
+    print "enabled(5, 'libx'): %s, enabled(6, 'libx'): %s" % ( enabled(5, "libx"), enabled(6, "libx") )
+    disable_debug("libx")
+    debug(5, "You should not see this - %i.", "libx", 15)
+    set_debug_level(1, 42)
+    debug(1, "You should see this - 16 (integer debug_id).", 42)
+    print "enabled(1, 42): %s" % ( enabled(1, 42) )
+    disable_debug(42)
+
+    # flight recorder
+    set_record_level(3, "liby", size=3)
+    for i in range(5): debug(3, "recorded event %i", "liby", i)
+    debug(4, "not recorded", "liby")
+    debug(3, "recorded event with a large argument: %s", "liby", "x" * 100000)
+    debug(3, "recorded event %i %i (bad format)", "liby", 6)
+    print "enabled(3, 'liby'): %s, enabled(4, 'liby'): %s" % ( enabled(3, "liby"), enabled(4, "liby") )
+    assert len(get_recorded_events("liby")[-2]) < RECORDER_MESSAGE_SIZE + 100
+    dump_recorder(clear=True)
+    dump_recorder()
+
+    # benchmark of the disabled calls
+    import time
+    class Expensive:
+        def __str__(self): return "x" * 1000
+    value = Expensive()
+    nb = 200000
+    start = time.time()
+    for i in xrange(nb): debug(3, "value='%s'" % ( str(value) ), "libx")
+    eager = time.time() - start
+    start = time.time()
+    for i in xrange(nb): debug(3, "value='%s'", "libx", value)
+    lazy = time.time() - start
+    start = time.time()
+    for i in xrange(nb):
+        if enabled(3, "libx"): debug(3, "value='%s'", "libx", value)
+    guarded = time.time() - start
+    print "disabled debug call: %.3f us eager formatting, %.3f us lazy, %.3f us guarded by enabled()" % \
+        ( eager * 1000000.0 / nb, lazy * 1000000.0 / nb, guarded * 1000000.0 / nb )
+    set_record_level(3, "libx")
+    start = time.time()
+    for i in xrange(nb): debug(3, "value='%s'", "libx", value)
+    print "recorded debug call: %.3f us" % ( (time.time() - start) * 1000000.0 / nb )
 
 
@@ -8,10 +8,12 @@ Every filter can decide wheither to continue to the next filter or not.
 Filters must:
     - accept a single <value> parameter
     - return a FilterResult instance
+
+Filters decorated with fast_filter may return the new value instead: see fast_filter.
 """
 
 # kpython lib
-import logging
+import logging, types
 import kbase
 import kodict
 import koptions
@@ -19,6 +21,14 @@ import koptions
 log = logging.getLogger(__name__)
 
 class ValidationException(object):
+    """
+    Validation exception
+    The options are available as read-only attributes. Sub-classes should declare "__slots__ = ()" to keep
+    their instances free of a __dict__.
+    """
+
+    __slots__ = ( "message", "string_id", "_options" )
+
     def __init__(self, message=None, string_id=None, **options):
         # store custom message
         self.message = message
@@ -29,17 +39,31 @@ class ValidationException(object):
         # store options
         self._options = options
 
-        # store options as read-only attributes too
-        for k, v in self._options.items():
-            self.__dict__[k] = v
-
-    # render all attributes read-only, except "message" and "_options"
-    def __setattr__(self, name, value):
-        if name == "message" or name == "string_id" or name == "_options":
-            self.__dict__[name] = value
-        else:
+    # options as read-only attributes
+    def __getattr__(self, name):
+        try:
+            return object.__getattribute__(self, "_options")[name]
+        except KeyError:
             raise AttributeError, name
 
+    # render all attributes read-only, except "message", "string_id" and "_options"
+    # (the slots already do this, but not for the sub-classes that have no __slots__)
+    if __debug__:
+        def __setattr__(self, name, value):
+            if name == "message" or name == "string_id" or name == "_options":
+                object.__setattr__(self, name, value)
+            else:
+                raise AttributeError, name
+
+    # pickling support (needed with __slots__ for the protocols < 2)
+    def __getstate__(self):
+        return ( self.message, self.string_id, self._options )
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "message", state[0])
+        object.__setattr__(self, "string_id", state[1])
+        object.__setattr__(self, "_options", state[2])
+
     def __str__(self):
         if self.message:
             # custom message set.. fill it with call-time parameters
@@ -62,12 +86,12 @@ class ValidationException(object):
         return self.__class__.__name__
 
 class ValidationNoneValueException(ValidationException):
-    pass
+    __slots__ = ()
 
 class ValidationNotPositiveNumberException(ValidationException):
-     pass
+    __slots__ = ()
 
-class FilterResult(kbase.DefinedAttributesStore):
+class FilterResult(kbase.StaticAttributesStore):
     """
     Filter result
     Attributes:
@@ -75,9 +99,13 @@ class FilterResult(kbase.DefinedAttributesStore):
         validation_exceptions(list): list of ValidationException (sub-)classes
         continue_filtering(boolean): continue or stop filtering
 
-    This class derives from DefinedAttributesStore: it allows basic parameters validation
+    This class derives from StaticAttributesStore: only these attributes can be set (__slots__), and the
+    types of validation_exceptions and continue_filtering are checked, unless python runs optimized (-O).
     """
 
+    _attr_any_type_definitions = [ "value" ]
+    _attr_type_definitions = { list : [ "validation_exceptions" ], bool : [ "continue_filtering" ] }
+
     def __init__(self, value=None, validation_exceptions=None, continue_filtering=None):
         # Default parameters
         # Had problem using validation_exceptions=None, continue_filtering=None
@@ -85,14 +113,6 @@ class FilterResult(kbase.DefinedAttributesStore):
         if validation_exceptions == None: validation_exceptions = []
         if continue_filtering == None: continue_filtering = True
 
-        # super!
-        super(FilterResult, self).__init__()
-
-        # parameter definitions for basic validation
-        self._attr_any_type_definitions += [ "value" ]
-        self._attr_type_definitions[list] += [ "validation_exceptions" ]
-        self._attr_type_definitions[bool] += [ "continue_filtering" ]
-
         self.value = value
         self.validation_exceptions = validation_exceptions
         self.continue_filtering = continue_filtering
@@ -102,88 +122,167 @@ class FilterResult(kbase.DefinedAttributesStore):
             ( str(self.value), type(self.value), str(self.validation_exceptions), str(self.continue_filtering) )
 
 
-def run_filters(value, filter_callables, raise_on_exception=False):
+def fast_filter(func):
     """
-    Run a list of filters on a given value
-    Paramameters:
-        value(any type): value to filter (can be of any type, including null)
-        filter_callables(list): list of filter functions or class methods (callables)
-    Returns:
-        FilterResult object
+    Decorator for the filters that usually only transform the value
+    The decorated function (or method) returns the new value, or a FilterResult instance when it reports
+    validation exceptions or stops filtering. The decorated filter still returns a FilterResult in all
+    cases, but a FilterPipeline calls the function directly: no FilterResult is created for plain values.
+    """
+
+    def filter_callable(*args):
+        result = func(*args)
+        if isinstance(result, FilterResult):
+            return result
+        return FilterResult(value=result)
+    filter_callable.fast = func
+    filter_callable.__name__ = func.__name__
+    filter_callable.__doc__ = func.__doc__
+    return filter_callable
+
+def _get_fast_callable(filter_callable):
     """
+    Returns the function of a filter decorated with fast_filter, bound to the same object, or None
+    """
+
+    fast = getattr(filter_callable, "fast", None)
+    if fast != None and getattr(filter_callable, "im_self", None) != None:
+        fast = types.MethodType(fast, filter_callable.im_self)
+    return fast
 
-    fresult = FilterResult(value=value)
 
-    log.debug( 
-        "run_filters: filters='%s', input_value='%s', type='%s'" % ( filter_callables, str(value), type(value) ))
+class FilterPipeline(object):
+    """
+    Compiled list of filters
+    The filter callables are checked once, when the pipeline is created. Running the pipeline has the
+    same result as run_filters(), but:
+        - a single FilterResult is created per run, and none by the filters decorated with fast_filter
+          while they return plain values
+        - the debug messages are only formatted when the DEBUG level is enabled for this module's logger
+    """
 
-    i = 0
-    for filter_callable in filter_callables:
-        i += 1
+    def __init__(self, filter_callables):
+        self.filter_callables = tuple(filter_callables)
 
         # Raise on invalid filter.
-        if not callable(filter_callable):
-            raise Exception("run_filters: filter_loop=%i: not a callable: '%s'" % ( i, str(filter_callable) ) )
+        i = 0
+        for filter_callable in self.filter_callables:
+            i += 1
+            if not callable(filter_callable):
+                raise Exception("run_filters: filter_loop=%i: not a callable: '%s'" % ( i, str(filter_callable) ) )
+
+        # (fast function or None, filter callable) of each filter
+        self._steps = tuple([ ( _get_fast_callable(c), c ) for c in self.filter_callables ])
+
+    def run(self, value):
+        """
+        Run the filters on a given value
+        Returns:
+            FilterResult object
+        """
+
+        if log.isEnabledFor(logging.DEBUG):
+            return self._run_debug(value)
+
+        validation_exceptions = []
+        for fast, filter_callable in self._steps:
+            if fast != None:
+                tmp_fresult = fast(value)
+                if not isinstance(tmp_fresult, FilterResult):
+                    value = tmp_fresult
+                    continue
+            else:
+                tmp_fresult = filter_callable(value)
+            value = tmp_fresult.value
+            if tmp_fresult.validation_exceptions:
+                validation_exceptions.extend(tmp_fresult.validation_exceptions)
+
+            # Stop filtering if last validator said so
+            if not tmp_fresult.continue_filtering:
+                return FilterResult(value=value, validation_exceptions=validation_exceptions, continue_filtering=False)
+
+        return FilterResult(value=value, validation_exceptions=validation_exceptions)
+
+    def _run_debug(self, value):
+        """
+        Same as run(), with debug messages
+        """
+
+        fresult = FilterResult(value=value)
+
+        log.debug("run_filters: filters='%s', input_value='%s', type='%s'", self.filter_callables, value, type(value))
+
+        i = 0
+        for filter_callable in self.filter_callables:
+            i += 1
+
+            # Filter.
+            tmp_fresult = filter_callable(fresult.value)
+            log.debug("run_filter: loop=%i, filter_result='%s'", i, tmp_fresult)
+            fresult.value = tmp_fresult.value
+            fresult.validation_exceptions += tmp_fresult.validation_exceptions
+            fresult.continue_filtering = tmp_fresult.continue_filtering
+            log.debug("run_filter: loop=%i, resulting_filter_result='%s'", i, fresult)
+
+            # Stop filtering if last validator said so
+            if not fresult.continue_filtering:
+                break
+
+        log.debug("run_filter: filter_result='%s'", fresult)
+
+        return fresult
+
 
-        # Filter.
-        tmp_fresult = filter_callable(fresult.value)
-        log.debug("run_filter: loop=%i, filter_result='%s'" % ( i, str(tmp_fresult) ))
-        fresult.value = tmp_fresult.value
-        fresult.validation_exceptions += tmp_fresult.validation_exceptions
-        fresult.continue_filtering = tmp_fresult.continue_filtering
-        log.debug("run_filter: loop=%i, resulting_filter_result='%s'" % ( i, str(fresult) ))
- 
-        # Stop filtering if last validator said so
-        if not fresult.continue_filtering:
-            break
+def run_filters(value, filter_callables, raise_on_exception=False):
+    """
+    Run a list of filters on a given value
+    Paramameters:
+        value(any type): value to filter (can be of any type, including null)
+        filter_callables(list): list of filter functions or class methods (callables)
+    Returns:
+        FilterResult object
 
-    log.debug("run_filter: filter_result='%s'" % ( str(fresult) ))
+    Use a FilterPipeline instead when the same filters are run many times.
+    """
 
-    return fresult
+    return FilterPipeline(filter_callables).run(value)
 
 
 
+@fast_filter
 def filter_not_none(value):
     """
     Check that value is not none
     """
 
-    in_value = value
-
-    log.debug("filter_not_none: input_value='%s'" % ( str(value) ) )
-
-    fresult = FilterResult(value=value)
+    log.debug("filter_not_none: input_value='%s'", value)
 
     if value == None:
-        fresult.continue_filtering = False
-        fresult.validation_exceptions.append(ValidationNoneValueException())
+        return FilterResult(value=value, validation_exceptions=[ValidationNoneValueException()],
+                            continue_filtering=False)
 
-    log.debug("filter_not_none: input_value='%s', output_value='%s'" % ( str(in_value), str(value) ))
-
-    return fresult
+    return value
 
 
+@fast_filter
 def filter_booleanize(value):
     """
     Filter - booleanize value - except if value is None
     """
 
-    in_value = value
-
-    log.debug("filter_booleanize: input value='%s'" % ( str(value) ))
+    log.debug("filter_booleanize: input value='%s'", value)
 
     if value == None:
         # no None-to-false conversion here! python normally handles None as False
-        return FilterResult(value=None)
+        return None
 
     if value:
-        return FilterResult(value=True)
+        return True
 
-    log.debug("filter_booleanize: input value='%s', output value='%s'" % ( str(in_value), str(value) ))
-
-    return FilterResult(value=False)
+    return False
 
 
+@fast_filter
 def filter_booleanize_none(value):
     """
     Filter - booleanize value - including if value is None
@@ -191,8 +290,9 @@ def filter_booleanize_none(value):
 
     if value == None:
         value = False
-    return filter_booleanize(value)
+    return filter_booleanize.fast(value)
 
+@fast_filter
 def filter_none_to_empty_str(value):
     """
     Filter - replace a None value with ""
@@ -200,20 +300,21 @@ def filter_none_to_empty_str(value):
 
     in_value = value
 
-    log.debug("filter_none_to_empty_str: input value='%s'" % ( str(value) ))
+    log.debug("filter_none_to_empty_str: input value='%s'", value)
 
     if not value:
         value = ""
 
-    log.debug("filter_none_to_empty_str: input value='%s', output value='%s'" % ( str(in_value), str(value) ))
+    log.debug("filter_none_to_empty_str: input value='%s', output value='%s'", in_value, value)
 
-    return FilterResult(value=value)
+    return value
 
+@fast_filter
 def filter_positive_number(value):
     try:
         value = long(value)
         if value < 0: return FilterResult(value=value, validation_exceptions=[ValidationNotPositiveNumberException()])
-        return FilterResult(value=value)
+        return value
 
     except Exception:
         return FilterResult(value=value, validation_exceptions=[ValidationNotPositiveNumberException()])
@@ -231,4 +332,91 @@ if __name__ == "__main__":
     fr = run_filters(None, [filter_booleanize])
     print str(fr)
 
-
+    # FilterResult and its sub-classes have no __dict__, check their attributes and can be pickled, read-only
+    # attributes included
+    import pickle, sys
+    class TimedFilterResult(FilterResult):
+        _attr_type_definitions = { float : [ "duration" ] }
+        _attr_read_only = [ "filter_name" ]
+
+        def __init__(self, filter_name, **kwargs):
+            FilterResult.__init__(self, **kwargs)
+            self._init_read_only("filter_name", filter_name)
+
+    fr = TimedFilterResult("f", value=3, validation_exceptions=[ValidationNoneValueException()])
+    fr.duration = 0.5
+    assert not hasattr(fr, "__dict__")
+    for name, value in [ ( "filter_name", "g" ), ( "duration", 1 ), ( "continue_filtering", 1 ), ( "other", 1 ) ]:
+        try:
+            setattr(fr, name, value)
+            if __debug__ or name == "filter_name" or name == "other":
+                print "ERROR: setting '%s' got no exception but should have." % ( name )
+        except (AttributeError, TypeError):
+            pass
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        for obj in [ FilterResult(value="x", continue_filtering=False), fr ]:
+            copy = pickle.loads(pickle.dumps(obj, protocol))
+            assert type(copy) == type(obj) and copy.value == obj.value and \
+                copy.continue_filtering == obj.continue_filtering and \
+                map(str, copy.validation_exceptions) == map(str, obj.validation_exceptions)
+        assert copy.filter_name == "f" and copy.duration == 0.5
+    print "FilterResult: %i bytes, no __dict__, pickled with protocols 0 to %i" % \
+        ( sys.getsizeof(FilterResult()), pickle.HIGHEST_PROTOCOL )
+
+    # compiled pipeline, against the former run_filters() (one FilterResult per filter, plus the filters' own)
+    import time
+
+    def old_run_filters(value, filter_callables, raise_on_exception=False):
+        fresult = FilterResult(value=value)
+
+        log.debug(
+            "run_filters: filters='%s', input_value='%s', type='%s'" % ( filter_callables, str(value), type(value) ))
+
+        i = 0
+        for filter_callable in filter_callables:
+            i += 1
+
+            # Raise on invalid filter.
+            if not callable(filter_callable):
+                raise Exception("run_filters: filter_loop=%i: not a callable: '%s'" % ( i, str(filter_callable) ) )
+
+            # Filter.
+            tmp_fresult = filter_callable(fresult.value)
+            log.debug("run_filter: loop=%i, filter_result='%s'" % ( i, str(tmp_fresult) ))
+            fresult.value = tmp_fresult.value
+            fresult.validation_exceptions += tmp_fresult.validation_exceptions
+            fresult.continue_filtering = tmp_fresult.continue_filtering
+            log.debug("run_filter: loop=%i, resulting_filter_result='%s'" % ( i, str(fresult) ))
+
+            # Stop filtering if last validator said so
+            if not fresult.continue_filtering:
+                break
+
+        log.debug("run_filter: filter_result='%s'" % ( str(fresult) ))
+
+        return fresult
+
+    def same_result(a, b):
+        return a.value == b.value and a.continue_filtering == b.continue_filtering and \
+            map(type, a.validation_exceptions) == map(type, b.validation_exceptions)
+
+    filters = [filter_none_to_empty_str, filter_not_none, filter_booleanize]
+    pipeline = FilterPipeline(filters)
+    for value in [ None, "", "x", 0 ]:
+        assert same_result(pipeline.run(value), old_run_filters(value, filters))
+    for value in [ None, "3", "-3", "x" ]:
+        assert same_result(run_filters(value, [filter_not_none, filter_positive_number]),
+                           old_run_filters(value, [filter_not_none, filter_positive_number]))
+    print str(pipeline.run(None))
+
+    # the same pipeline, without the fast path: every filter returns a FilterResult
+    plain_pipeline = FilterPipeline(filters)
+    plain_pipeline._steps = tuple([ ( None, c ) for c in filters ])
+
+    nb = 20000
+    for name, run in [ ( "old run_filters", lambda: old_run_filters("x", filters) ),
+                       ( "FilterPipeline.run", lambda: pipeline.run("x") ),
+                       ( "FilterPipeline.run, no fast path", lambda: plain_pipeline.run("x") ) ]:
+        start = time.time()
+        for i in xrange(nb): run()
+        print "%-35s %.2f us per run" % ( name, (time.time() - start) * 1000000.0 / nb )
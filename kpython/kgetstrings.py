@@ -9,8 +9,8 @@ import kdebug
 # This function gets a translated and "non-altered" string for <application>. If string is not existant,
 # it will be replaced by "MISSING:<key>" or by None (depending on <none_if_missing> value).
 def get_string(strings, key, app=None, none_if_missing=False):
-    kdebug.debug(1, "set_strings(key='%s', app='%s', none_if_missing='%s'" % \
-        ( key, str(app), str(none_if_missing) ), "kgetstrings" )
+    kdebug.debug(1, "set_strings(key='%s', app='%s', none_if_missing='%s'",
+        "kgetstrings", key, app, none_if_missing)
 
     if strings and strings.has_key(app) and strings[app].has_key(key):
         return strings[app][key]
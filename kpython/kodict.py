@@ -4,8 +4,20 @@ might not be fully compatible with dict yet
 """
 
 class odict(dict):
+    """
+    Insertion-ordered dict
+    The order of the keys is kept in a circular doubly linked list of [prev, next, key] links, indexed by key,
+    so inserting, deleting and looking up a key take constant time.
+    """
+
+    # the links are created here rather than in __init__, which unpickling
+    # does not call
+    def __new__(cls, *args, **kwargs):
+        self = dict.__new__(cls)
+        self.__init_links()
+        return self
+
     def __init__(self, data=None):
-        self._keys = []
         dict.__init__(self)
 
         if data:
@@ -21,8 +33,15 @@ class odict(dict):
             else:
                 raise Exception("expected a dict or a tuple list")
 
+    def __init_links(self):
+        # sentinel of the linked list and links by key
+        self.__root = root = []
+        root[:] = [root, root, None]
+        self.__map = {}
+
     def append_from_dict(self, dict):
-        map(self.__setitem__, dict.keys(), dict.values())
+        for k, v in dict.items():
+            self.__setitem__(k, v)
 
     def append_from_plist(self, plist):
         for pair in plist:
@@ -32,51 +51,138 @@ class odict(dict):
             self.__setitem__(k, v)
 
     def __delitem__(self, key):
-        if not key in self._keys:
-            raise KeyError, key
         dict.__delitem__(self, key)
-        self._keys.remove(key)
+        link_prev, link_next, key = self.__map.pop(key)
+        link_prev[1] = link_next
+        link_next[0] = link_prev
 
     def __setitem__(self, key, item):
+        if not dict.__contains__(self, key):
+            root = self.__root
+            last = root[0]
+            last[1] = root[0] = self.__map[key] = [last, root, key]
         dict.__setitem__(self, key, item)
-        if key not in self._keys:
-            self._keys.append(key)
+
+    def __iter__(self):
+        root = self.__root
+        link = root[1]
+        while link is not root:
+            yield link[2]
+            link = link[1]
+
+    def __reversed__(self):
+        root = self.__root
+        link = root[0]
+        while link is not root:
+            yield link[2]
+            link = link[0]
 
     def clear(self):
         dict.clear(self)
-        self._keys = []
+        self.__init_links()
 
     def copy(self):
         return odict(self.plist())
 
+    def iterkeys(self):
+        return iter(self)
+
+    def itervalues(self):
+        for k in self:
+            yield self[k]
+
+    def iteritems(self):
+        for k in self:
+            yield (k, self[k])
+
     def items(self):
-        return zip(self._keys, self.values())
+        return [ (k, self[k]) for k in self ]
 
     def keys(self):
-        return list(self._keys) # return a copy of the list
+        return list(self)
 
     def values(self):
-        return map(self.get, self._keys)
+        return [ self[k] for k in self ]
+
+    def update(self, other=None, **kwargs):
+        if other != None:
+            if hasattr(other, "keys"):
+                for k in other.keys():
+                    self[k] = other[k]
+            else:
+                for k, v in other:
+                    self[k] = v
+        for k, v in kwargs.items():
+            self[k] = v
+
+    def pop(self, key, *default):
+        if dict.__contains__(self, key):
+            value = self[key]
+            del self[key]
+            return value
+        if default:
+            return default[0]
+        raise KeyError, key
+
+    def popitem(self, last=True):
+        if not self:
+            raise KeyError, "dictionary is empty"
+        if last:
+            key = self.__root[0][2]
+        else:
+            key = self.__root[1][2]
+        return key, self.pop(key)
+
+    def setdefault(self, key, default=None):
+        if not dict.__contains__(self, key):
+            self[key] = default
+        return self[key]
+
+    # same as dict.fromkeys, but ordered
+    def fromkeys(cls, keys, value=None):
+        d = cls()
+        for k in keys:
+            d[k] = value
+        return d
+    fromkeys = classmethod(fromkeys)
+
+    # read-only copy of the keys list, for compatibility with the previous implementation
+    def _get_keys(self):
+        return self.keys()
+    _keys = property(_get_keys)
 
     def plist(self):
-        p = []
-        for k, v in self.items():
-            p.append( (k, v) )
-        return p
+        return self.items()
+
+    # pickling: the ordered pairs and the attributes of the sub-classes, if
+    # any (the links would be pickled recursively)
+    def __reduce__(self):
+        state = self.__dict__.copy()
+        del state["_odict__root"]
+        del state["_odict__map"]
+        return (self.__class__, (self.items(),), state or None)
+
+    def __setstate__(self, state):
+        if state.has_key("_keys"):
+            # odict pickled by the previous implementation, which stored the
+            # keys list in the _keys attribute: the linked list is rebuilt from
+            # that list, so the items are restored in their original order
+            values = dict(dict.items(self))
+            dict.clear(self)
+            self.__init_links()
+            for k in state.pop("_keys"):
+                self[k] = values[k]
+        self.__dict__.update(state)
 
     def __str__(self):
-        s = "{"
-        l = len(self._keys)
+        l = []
         for k, v in self.items():
-            l -= 1
             strkey = str(k)
             if isinstance(k, basestring): strkey = "'"+strkey+"'"
             strval = str(v)
             if isinstance(v, basestring): strval = "'"+strval+"'"
-            s += strkey + ":" + strval
-            if l > 0: s += ", "
-        s += "}"
-        return s
+            l.append(strkey + ":" + strval)
+        return "{" + ", ".join(l) + "}"
 
 # non-exhaustive tests
 if __name__ == "__main__":
@@ -115,3 +221,17 @@ if __name__ == "__main__":
     print t
 
 
+
+    # scaling: insertions, lookups, iteration and deletions should take
+    # linear time overall
+    import time
+    for n in [ 1000, 10000, 100000 ]:
+        start = time.time()
+        d = odict()
+        for i in xrange(n): d[i] = i
+        for i in xrange(n): d[i] = i + 1
+        for i in xrange(n): i in d
+        for k, v in d.iteritems(): pass
+        for i in xrange(0, n, 2): del d[i]
+        assert d.keys() == range(1, n, 2)
+        print "%i keys: %.3f seconds" % ( n, time.time() - start )
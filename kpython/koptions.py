@@ -2,6 +2,11 @@
 Class with a custom parameters checker (when they are used as __optional__ parameters)
 
 All options must be specified as option=value... see the test at the end of file.
+
+The options can also be declared at the class level in options_spec, as (option name, attribute name,
+default value, required flag) tuples. The declarations are compiled once per class (with those of the
+base classes) and load_options() then sets all the attributes in a single pass. The attributes already
+set (by a sub-class, before calling the constructor of its base class) are kept.
 """
 
 class OptionNotSet(Exception):
@@ -18,6 +23,10 @@ class BadOption(Exception):
 
 
 class Options(object):
+    # Options declared by the class - the declarations of the base classes are inherited
+    # The default values are shared by all the instances: use None or immutable values
+    options_spec = []
+
     def store_options(self, options):
         """
         Store options in a private attribute for later processing
@@ -25,7 +34,59 @@ class Options(object):
 
         if not self.__dict__.has_key("_options"):
             self._options = options
-            self._used_options = []
+            self._used_options = set()
+
+
+    def load_options(self, options):
+        """
+        Store options and set the attribute of every declared option (see options_spec), in a single pass
+        The attributes already set by a sub-class are not overwritten
+        Raise if a required option is not set
+        """
+
+        self.store_options(options)
+
+        try:
+            compiled_spec = self.__class__.__dict__["_compiled_options_spec"]
+        except KeyError:
+            compiled_spec = self.__class__._compile_options_spec()
+        attributes, defaults, names, required = compiled_spec
+
+        values = defaults.copy()
+        used = names.intersection(self._options)
+        for option_name in used:
+            values[attributes[option_name]] = self._options[option_name]
+        for option_name in required:
+            if not option_name in used:
+                raise OptionNotSet(option_name)
+
+        for attribute_name in values.viewkeys() & self.__dict__.viewkeys():
+            del values[attribute_name]
+        self.__dict__.update(values)
+        self._used_options |= used
+
+
+    @classmethod
+    def _compile_options_spec(cls):
+        """
+        Compile the options declared by the class and its base classes
+        Returns:
+            tuple: option name to attribute name dict, attribute name to default value dict,
+                   set of the option names and tuple of the required option names
+        """
+
+        attributes = {}
+        defaults = {}
+        required = {}
+        for base in reversed(cls.__mro__):
+            for option_name, attribute_name, default_value, option_required in base.__dict__.get("options_spec", []):
+                attributes[option_name] = attribute_name
+                defaults[attribute_name] = default_value
+                required[option_name] = option_required
+
+        compiled_spec = ( attributes, defaults, frozenset(attributes), tuple([ n for n, r in required.items() if r ]) )
+        cls._compiled_options_spec = compiled_spec
+        return compiled_spec
 
 
     def is_option_set(self, option_name):
@@ -44,24 +105,21 @@ class Options(object):
         By default, options are not required and have 'None' as the default value
         """
 
-        required = False
-        if options.has_key("required"):
-            required = options["required"]
-        default_value = None
-        if options.has_key("default_value"):
-            default_value = options["default_value"]
-              
-        if self.is_option_set(option_name):
-            self._used_options.append(option_name)
-            return self._options[option_name]
-        if required:
-            raise OptionNotSet(option_name)
-        return default_value
+        try:
+            value = self._options[option_name]
+        except KeyError:
+            if options.get("required", False):
+                raise OptionNotSet(option_name)
+            return options.get("default_value")
+
+        self._used_options.add(option_name)
+        return value
             
 
     def check_unused_options(self):
-        for option in self._options.keys():
-            if not option in self._used_options:
+        used_options = self._used_options
+        for option in self._options:
+            if not option in used_options:
                 raise BadOption(option)
 
 
@@ -102,5 +160,61 @@ if __name__ == "__main__":
         print "ERROR: got no exception but should have."
     except BadOption, e:
         print "Got exception BadOption for the option '%s', which is correct." % ( str(e) )
+    print
 
 
+    print "Test 5"
+    class SpecDemo(Options):
+        options_spec = [ ("x", "x", 5, False), ("y", "y", None, True) ]
+
+        def __init__(self, **options):
+            self.load_options(options)
+            self.check_unused_options()
+
+    class SubSpecDemo(SpecDemo):
+        options_spec = [ ("z", "_z", "z", False) ]
+
+    c = SubSpecDemo(y="y is a great letter.")
+    print "x value: %s, y value: %s, z value: %s" % ( c.x, c.y, c._z )
+
+    # attribute set by a sub-class before calling the constructor of its base class
+    class PresetSpecDemo(SpecDemo):
+        def __init__(self, **options):
+            self.x = "preset"
+            SpecDemo.__init__(self, **options)
+
+    c = PresetSpecDemo(x=1, y=2)
+    assert c.x == "preset" and c.y == 2
+    for options, exception_class in ( ({}, OptionNotSet), ({"y" : 1, "bad_option" : 3}, BadOption) ):
+        try:
+            c = SubSpecDemo(**options)
+            print "ERROR: got no exception but should have."
+        except exception_class, e:
+            print "Got exception %s for the option '%s', which is correct." % ( exception_class.__name__, str(e) )
+    print
+
+
+    print "Test 6"
+    import time
+    class GetDemo(Options):
+        def __init__(self, **options):
+            self.store_options(options)
+            self.a = self.get_option("a")
+            self.b = self.get_option("b", default_value=2)
+            self.c = self.get_option("c", default_value=3)
+            self.d = self.get_option("d")
+            self.e = self.get_option("e", default_value=False)
+            self.check_unused_options()
+
+    class LoadDemo(Options):
+        options_spec = [ ("a", "a", None, False), ("b", "b", 2, False), ("c", "c", 3, False), ("d", "d", None, False),
+                         ("e", "e", False, False) ]
+        def __init__(self, **options):
+            self.load_options(options)
+            self.check_unused_options()
+
+    for cls in (GetDemo, LoadDemo):
+        nb = 100000
+        start = time.time()
+        for i in xrange(nb): cls(a=1, c=4, e=True)
+        print "%s: %.2f us per construction" % ( cls.__name__, (time.time() - start) * 1000000.0 / nb )
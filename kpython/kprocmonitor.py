@@ -5,9 +5,10 @@
 # Starts processes that do not detach from the terminal, and respawn them when
 # they die, after a short delay.
 
-import sys, getopt, signal, socket
+import sys, getopt, signal
 
 from kbase import *
+from kreactor import *
 from kfile import *
 from kout import *
 from kdaemonize import *
@@ -23,15 +24,20 @@ term_timeout = 5
 
 # Globals.
 
+# The command run by the child.
+child_command = None
+
 # The PID of the child, if any.
 child_pid = None
 
 # The time at which the child last exited.
 child_last_exit_time = 0
 
-# The socket pair created to wake up the main thread when a signal is received.
-# Write to the first socket, read from the second.
-wakeup_pair = None
+# The reactor waiting for the signals and the respawn timer.
+reactor = None
+
+# The timer of the next respawn of the child, if any.
+respawn_timer = None
 
 # This flag is set when SIGTERM has been received.
 got_sigterm = 0
@@ -56,7 +62,7 @@ def wait_for_exit(pid, timeout):
 	if time_to_wait < 0: return 0
 	
 	# Wait for signal to happen.
-	try: select_wrapper([], [], [], time_to_wait + 0.01)
+	try: reactor.run_once(time_to_wait + 0.01)
 	except: pass
 
 # This function stops the current child if it is running, first by sending it
@@ -83,30 +89,20 @@ def stop_child():
     call_waitpid(child_pid)
     child_pid = None
 
-# This function is the signal handler for SIGTERM.
-def sigterm_handler(signum, frame):
+# This function is called by the reactor when SIGTERM is received.
+def sigterm_handler():
     global got_sigterm
-    global wakeup_pair
-    
+
     out("Caught SIGTERM.")
-    
-    # Set the sigterm flag first.
+
+    # Set the sigterm flag and leave the loop.
     got_sigterm = 1
-    
-    # Wake up the main thread.
-    try: wakeup_pair[0].write('a')
-    except: pass
+    reactor.stop()
 
-# This function is the signal handler for SIGCHLD.
-def sigchld_handler(signum, frame):
-    global got_sigterm
-    global wakeup_pair
-    
+# This function is called by the reactor when SIGCHLD is received.
+def sigchld_handler():
     debug("Caught SIGCHLD.")
-    
-    # Wake up the main thread.
-    try: wakeup_pair[0].write('a')
-    except: pass
+    check_child()
 
 # This function runs the command specified.
 def run_command(command):
@@ -124,67 +120,62 @@ def run_command(command):
     elif pid > 0:
 	child_pid = pid
 
-# This function monitors the process specified, respawning it when it fails.
-def monitor_process(command):
-    global wakeup_pair
+# This function checks whether the child has exited, and spawns it again or
+# schedules its respawn.
+def check_child():
     global child_pid
     global child_last_exit_time
+    global respawn_timer
 
-    # Register the signal handlers.
-    signal.signal(signal.SIGTERM, sigterm_handler)
-    signal.signal(signal.SIGCHLD, sigchld_handler)
-    
-    # Create the socket pair.
-    wakeup_pair = socket.socketpair()
-    wakeup_pair[0].setblocking(0)
-    wakeup_pair[1].setblocking(0)
-    
-    # Loop until we're done.
-    while 1:
-	# Time to wait in select().
-	time_to_wait = 0
-	
-	# A child was spawned.
-	if child_pid != None:
-	
-	    # The child has exited. Re-run the loop immediately.
-	    if call_waitpid(child_pid):
-		err("Child %d exited unexpectedly." % (child_pid))
-		child_pid = None
-		child_last_exit_time = time.time()
-	    
-	    # Wait for something to happen.
-	    else:
-		time_to_wait = 10000
-	
-	# No child was spawned.
-	else:
-	    # Compute the time elapsed since the child exited.
-	    ttw = child_last_exit_time + child_respawn_delay - time.time()
-	    
-	    # It is time to spawn the child.
-	    if ttw <= 0:
-		out("Running command %s, params: %s." % (command[0], command[1:]))
-		run_command(command)
-	    
-	    # We must wait a bit before respawning the child.
-	    else:
-		time_to_wait = ttw
-	
-	# Wait for something to happen.
-	select_wrapper([wakeup_pair[1]], [], [], time_to_wait + 0.01)
-	
-	# Read everything written on the wakeup socket.
-	while 1:
-	    try: wakeup_pair[1].recv(100)
-	    except socket.error, e:
-		check_interrupted_ex(e)
-		break
-	
-        # We must exit. Stop the child if it is running, and return.
-	if got_sigterm:
-	    stop_child()
-	    return
+    # We are exiting: the child must not be respawned.
+    if got_sigterm: return
+
+    # A child was spawned.
+    if child_pid != None:
+
+	# The child is still running. Wait for SIGCHLD.
+	if not call_waitpid(child_pid): return
+
+	err("Child %d exited unexpectedly." % (child_pid))
+	child_pid = None
+	child_last_exit_time = time.time()
+
+    # The respawn is already scheduled.
+    if respawn_timer != None and not respawn_timer.cancelled: return
+
+    # Compute the time elapsed since the child exited.
+    ttw = child_last_exit_time + child_respawn_delay - time.time()
+
+    # It is time to spawn the child.
+    if ttw <= 0:
+	out("Running command %s, params: %s." % (child_command[0], child_command[1:]))
+	run_command(child_command)
+
+    # We must wait a bit before respawning the child.
+    else:
+	respawn_timer = reactor.call_later(ttw + 0.01, check_child)
+
+# This function monitors the process specified, respawning it when it fails.
+def monitor_process(command):
+    global reactor
+    global child_command
+
+    # Create the reactor and register the signal handlers.
+    reactor = Reactor()
+    reactor.add_signal(signal.SIGTERM, sigterm_handler)
+    reactor.add_signal(signal.SIGCHLD, sigchld_handler)
+
+    # Spawn the child, then loop until SIGTERM is received.
+    child_command = command
+    try:
+	check_child()
+	reactor.run()
+
+	# We must exit. Stop the child if it is running, and return.
+	stop_child()
+
+    finally:
+	reactor.close()
 
 def usage():
     s = "Usage: " + sys.argv[0] + " [options] <command> [command_params]\n" +\
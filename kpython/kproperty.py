@@ -39,8 +39,28 @@
 #    - a new instance of the defined model (if any)
 #    - or
 #    - the defined default value
-
-import types, re, string
+#
+# On the first instantiation, the PropContainer class also generates, with
+# exec, a getter, a setter and a deleter for each property. These functions
+# inline only the checks the property actually configures and are installed in
+# the class as PropAccessor objects (property() objects that keep a reference
+# to their Prop object), in place of the Prop objects. A reset
+# function is generated the same way: the default values are checked once and
+# then stored directly. The configuration of the properties must therefore not
+# be changed after the first instantiation of their container.
+#
+# When the 'prop_slots' class attribute is set, the values are stored in slots
+# instead of the instance dictionary. The slots are generated when the class is
+# created, so the properties must be defined in the class body.
+#
+# A property created with lazy=True is not set to its initial value when the
+# container is instantiated: the 'prop_lazy_value' marker is stored instead and
+# the model instance or the default value is created on the first read. A
+# lazy value that fails the checks of the property raises the exception on
+# that first read. The prop_lazy_stats() method of the containers reports how
+# many lazy values were deferred and how many were actually materialized.
+
+import types, re, string, operator
 from kodict import odict
 
 # Property set.
@@ -57,8 +77,63 @@ class PropModel(object):
     def instantiate(self):
         return self.cls(*self.cls_args, **self.cls_kwargs)
 
+# Marker stored in place of the value of a lazy property until it is read.
+# The marker is a singleton: it is checked by identity, so pickling and copying
+# must give back the module instance.
+class PropLazyValue(object):
+    def __repr__(self):
+        return "<lazy property value>"
+
+    def __reduce__(self):
+        return "prop_lazy_value"
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+prop_lazy_value = PropLazyValue()
+
+# Internal: regular expression matching the property names that can be used
+# in the generated source code.
+prop_identifier_re = re.compile("^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Generated accessors of a property, installed in its container class in place
+# of the Prop object. The Prop object is available as the 'prop' attribute, and
+# its attributes (name, doc, null, default, ...) can be read directly from the
+# accessors.
+class PropAccessor(property):
+    def __init__(self, prop, fget, fset, fdel):
+        property.__init__(self, fget, fset, fdel, prop.doc)
+        self.prop = prop
+
+    def __getattr__(self, name):
+        if name == "prop": raise AttributeError(name)
+        return getattr(self.prop, name)
+
+# Metaclass of the property containers. It generates the slots of the
+# properties of the classes that set 'prop_slots'. The sub-classes of these
+# classes get slots too, so that they need no __dict__.
+class PropContainerType(type):
+    def __new__(meta, name, bases, d):
+        prop_slots = d.get("prop_slots")
+        if prop_slots == None: prop_slots = True in [ getattr(b, "prop_slots", False) for b in bases ]
+        if prop_slots and not d.has_key("__slots__"):
+            slots = []
+            if d.has_key("prop_set"):
+                for prop_name in d["prop_set"].keys():
+                    if not prop_identifier_re.match(prop_name): continue
+                    store_key = "_prop_%s" % ( prop_name )
+                    if [ b for b in bases if hasattr(b, store_key) ]: continue
+                    slots.append(store_key)
+            d["__slots__"] = tuple(slots)
+        return type.__new__(meta, name, bases, d)
+
 # Property container.
 class PropContainer(object):
+    __metaclass__ = PropContainerType
+    __slots__ = ()
 
     # Initialized flag
     initialized = False
@@ -71,6 +146,13 @@ class PropContainer(object):
     # prop_set['name'] = StrProp(default='', doc='Name')
     # prop_set['name'] = StrProp(default='', doc='Address')
 
+    # Flag: generate the accessors of the properties. When false, the Prop
+    # objects are used directly, which is slower but handy for debugging.
+    prop_compile = True
+
+    # Flag: store the property values in slots.
+    prop_slots = False
+
     def __init__(self):
         # Initialize properties (on the first instantiation ONLY).
         self._init_properties()
@@ -78,31 +160,89 @@ class PropContainer(object):
         # Set properties to their initial values.
         self._reset_properties_values()
 
-    # Initialize properties (on the first instantiation ONLY).
-    def _init_properties(self):
-        if not self.__class__.initialized:
-            for name, prop in self.prop_set.items():
-                # Set property name.
-                prop._set_name(name)
-
-                # Add property in class attributes.
-                setattr(self.__class__, name, prop)
+    # Initialize properties (on the first instantiation ONLY). The flag is
+    # looked up in the class dictionary since every class has its own
+    # accessors.
+    @classmethod
+    def _init_properties(cls):
+        if not cls.__dict__.get('initialized'):
+            cls._compile_properties()
 
             # Set the initialized flag to true.
-            self.__class__.initialized = True
+            cls.initialized = True
+
+    # Internal: add the properties to the class attributes, with generated
+    # accessors when possible, and generate the reset function of the class.
+    # The namespace of the generated code and, for each property, its name
+    # prefix, whether it was compiled and its reset lines are kept for
+    # props_from_rows().
+    @classmethod
+    def _compile_properties(cls):
+        ns = {}
+        for exception_class in (PropBadType, PropBadInstance, PropNullException, PropReadOnlyException,
+                                PropValidatorException, PropMinLengthException, PropMaxLengthException,
+                                PropRegexpException):
+            ns[exception_class.__name__] = exception_class
+        getters = {}
+        setters = {}
+        code = {}
+        reset_lines = []
+
+        for i, (name, prop) in enumerate(cls.prop_set.items()):
+            # Set property name.
+            prop._set_name(name)
+
+            p = "p%i_" % ( i )
+            ns[p + "prop"] = prop
+
+            if cls.prop_compile and prop_identifier_re.match(name) and prop._compilable():
+                exec prop._accessors_code(ns, p) in ns
+                getters[name] = ns[p + "get"]
+                setters[name] = ns[p + "set"]
+                setattr(cls, name, PropAccessor(prop, ns[p + "get"], ns[p + "set"], ns[p + "delete"]))
+                code[name] = (p, True, prop._reset_code(ns, p))
+
+            else:
+                # Add property in class attributes.
+                getters[name] = prop.__get__
+                setters[name] = prop.__set__
+                setattr(cls, name, prop)
+                code[name] = (p, False, [ "%sprop.reset(obj)" % ( p ) ])
+
+            reset_lines += code[name][2]
+
+        exec "def reset(obj):\n" + "".join([ "    %s\n" % ( l ) for l in reset_lines + ["pass"] ]) in ns
+        cls._prop_getters = getters
+        cls._prop_setters = setters
+        cls._prop_namespace = ns
+        cls._prop_code = code
+        cls._prop_reset = staticmethod(ns["reset"])
+
+    # Return the statistics of the lazy properties of the class: an odict
+    # mapping the name of each lazy property to a tuple (number of values
+    # deferred, number of values materialized). The counters belong to the Prop
+    # objects and are not updated atomically by concurrent threads.
+    @classmethod
+    def prop_lazy_stats(cls):
+        return odict([ (name, tuple(prop.lazy_stats)) for name, prop in cls.prop_set.items() if prop.lazy ])
+
+    # Reset the statistics of the lazy properties of the class.
+    @classmethod
+    def prop_lazy_stats_reset(cls):
+        for prop in cls.prop_set.values():
+            prop.lazy_stats[:] = [0, 0]
 
     # Set properties to their initial value.
     def _reset_properties_values(self):
-         for obj in self.prop_set.values():
-            obj.reset(self)
+        self._prop_reset(self)
 
     # Give read access to properties with the [] syntax.
     def __getitem__(self, key):
-        return self.prop_set[key].__get__(self)
+        return self._prop_getters[key](self)
 
     # Give write access to properties with the [] syntax.
     def __setitem__(self, key, value):
-        self.prop_set[key].__set__(self, value)
+        self._prop_setters[key](self, value)
 
 # Property exceptions
 class PropBadType(Exception):
@@ -172,7 +312,7 @@ class PropRegexpException(Exception):
 # the top of this file.
 class Prop(object):
     def __init__(self, doc="", null=True, read_only=False, default=None, model=None,
-                 valid_types=None, valid_instances=None, validator=None):
+                 valid_types=None, valid_instances=None, validator=None, lazy=False):
         self.name = None                        # property name
         self._store_key = None                  # internal: store key
         self.doc = doc                          # documentation string
@@ -184,6 +324,8 @@ class Prop(object):
         self.valid_types = valid_types          # list of types the value can be
         self.valid_instances = valid_instances  # list of base class the value can be an instance of
         self.validator = validator              # validator callable
+        self.lazy = lazy                        # flag: create the initial value on the first read
+        self.lazy_stats = [0, 0]                # number of lazy values deferred and materialized
 
         if self.model != None:
             # Validate model.
@@ -194,7 +336,13 @@ class Prop(object):
 
     # [Re-]set property to its initial state.
     def reset(self, obj):
-        if self.model:
+        if self.lazy:
+            # Defer the initial value to the first read.
+            self._set_read_only_check(obj)
+            setattr(obj, self._store_key, prop_lazy_value)
+            self.lazy_stats[0] += 1
+
+        elif self.model:
             # Set property value to a new instance of its model, if defined.
             instance = self.model.instantiate()
             self.__set__(obj, instance)
@@ -216,11 +364,28 @@ class Prop(object):
 
     # Get the property value. 
     def __get__(self, obj, objtype=None):
+        if obj is None: return self
         self._store_key_check()
-        if not obj.__dict__.has_key(self._store_key):
+        try:
+            value = getattr(obj, self._store_key)
+        except AttributeError:
             if self.null: return None
             else: raise PropNullException(self.name)
-        return obj.__dict__[self._store_key]
+        if value is prop_lazy_value: value = self._materialize(obj)
+        return value
+
+    # Internal: set a lazy property to its initial value, which is checked like
+    # any other value, and return it. The marker is kept if the check fails.
+    def _materialize(self, obj):
+        delattr(obj, self._store_key)
+        try:
+            if self.model: self.__set__(obj, self.model.instantiate())
+            else: self.__set__(obj, self.default)
+        except:
+            setattr(obj, self._store_key, prop_lazy_value)
+            raise
+        self.lazy_stats[1] += 1
+        return getattr(obj, self._store_key)
 
     # Set the property value.
     def __set__(self, obj, value):
@@ -234,11 +399,11 @@ class Prop(object):
             # Value is not an instance of the model.
 
             # Reset property.
-            self.reset(obj)
+            self._reset_for_import(obj)
 
             try:
                 # Try to get the import_data method.
-                import_data_method = getattr(obj.__dict__[self._store_key], 'import_data')
+                import_data_method = getattr(self.__get__(obj), 'import_data')
 
             except AttributeError:
                 # No import_data method... raise exception.
@@ -248,14 +413,26 @@ class Prop(object):
             import_data_method(value)
 
         else:
-            obj.__dict__[self._store_key] = value
+            setattr(obj, self._store_key, value)
  
+    # Internal: set the property to a new instance of its model, in which
+    # __set__() imports a value. A lazy property is not deferred again: its
+    # deferred value, if any, counts as materialized.
+    def _reset_for_import(self, obj):
+        if not self.lazy:
+            self.reset(obj)
+            return
+        if getattr(obj, self._store_key, None) is prop_lazy_value:
+            delattr(obj, self._store_key)
+            self.lazy_stats[1] += 1
+        self.__set__(obj, self.model.instantiate())
+
     # Delete the property value.
     def __delete__(self, obj):
         self._store_key_check()
         self._set_null_check(None)
         self._set_read_only_check(obj)
-        del obj.__dict__[self._store_key]
+        delattr(obj, self._store_key)
 
     # Check that the null constraint is respected.
     def _set_null_check(self, value):
@@ -265,7 +442,7 @@ class Prop(object):
     # Check that the read-only constraint is respected.
     def _set_read_only_check(self, obj):
         if self.read_only:
-            if obj.__dict__.has_key(self._store_key):
+            if hasattr(obj, self._store_key):
                 raise PropReadOnlyException(self.name)
 
     # Check that the type of the value is at least one of the defined types list.
@@ -291,6 +468,130 @@ class Prop(object):
                 except Exception, e:
                     raise PropValidatorException(self.name, value, e)
 
+    # Internal: return true if accessors can be generated for this property.
+    # This is not the case when a sub-class overrides __get__, __set__ or
+    # __delete__ without overriding the matching code generation method.
+    def _compilable(self):
+        def definer(name):
+            for i, c in enumerate(self.__class__.__mro__):
+                if c.__dict__.has_key(name): return i
+        return definer('__get__') >= definer('_get_return_code') and \
+               definer('__set__') >= definer('_set_code') and \
+               definer('__delete__') == self.__class__.__mro__.index(Prop)
+
+    # Internal: return the source lines that check (and convert) 'value'
+    # before it is stored, in the same order as __set__(). The objects used by
+    # the lines are added to the namespace 'ns', with names starting with the
+    # prefix 'p'. The read-only check needs 'obj' and is omitted when
+    # 'obj_checks' is false.
+    def _set_code(self, ns, p, obj_checks=True):
+        ns[p + "name"] = self.name
+        lines = []
+        if not self.null:
+            lines.append("if value is None: raise PropNullException(%sname)" % ( p ))
+        if self.read_only and obj_checks:
+            lines.append("if hasattr(obj, '%s'): raise PropReadOnlyException(%sname)" % ( self._store_key, p ))
+
+        checks = []
+        if self.valid_types != None:
+            ns[p + "types"] = tuple(self.valid_types)
+            checks.append("if type(value) not in %stypes: raise PropBadType(%sname, value)" % ( p, p ))
+        if self.valid_instances != None:
+            ns[p + "instances"] = tuple(self.valid_instances)
+            checks.append("if not isinstance(value, %sinstances): raise PropBadInstance(%sname, value)" % ( p, p ))
+        if self.validator != None:
+            ns[p + "validator"] = self.validator
+            checks.append("try: %svalidator(value)" % ( p ))
+            checks.append("except Exception, e: raise PropValidatorException(%sname, value, e)" % ( p ))
+        if checks:
+            lines.append("if value is not None:")
+            lines += [ "    " + l for l in checks ]
+        return lines
+
+    # Internal: return the source line returning the value read by the
+    # generated getter.
+    def _get_return_code(self, ns, p):
+        return "return value"
+
+    # Internal: return the source of the getter, setter and deleter generated
+    # for this property, named <p>get, <p>set and <p>delete.
+    def _accessors_code(self, ns, p):
+        key = self._store_key
+        src = []
+
+        src.append("def %sget(obj):" % ( p ))
+        src.append("    try: value = obj.%s" % ( key ))
+        if self.null: src.append("    except AttributeError: value = None")
+        else: src.append("    except AttributeError: raise PropNullException(%sname)" % ( p ))
+        if self.lazy: src.append("    if value is prop_lazy_value: value = %smaterialize(obj)" % ( p ))
+        src.append("    " + self._get_return_code(ns, p))
+
+        src.append("def %sset(obj, value):" % ( p ))
+        src += [ "    " + l for l in self._set_code(ns, p) ]
+        if self.model:
+            # Values which are not instances of the model are imported in a new
+            # instance, as in __set__().
+            ns[p + "model"] = self.model
+            src.append("    if value is not None and not isinstance(value, %smodel.cls):" % ( p ))
+            if self.lazy: src.append("        %sprop._reset_for_import(obj)" % ( p ))
+            else: src.append("        %sprop.reset(obj)" % ( p ))
+            src.append("        try: import_data_method = %sget(obj).import_data" % ( p ))
+            src.append("        except AttributeError: raise PropBadInstance(%sname, value)" % ( p ))
+            src.append("        import_data_method(value)")
+            src.append("        return")
+        src.append("    obj.%s = value" % ( key ))
+
+        src.append("def %sdelete(obj):" % ( p ))
+        if not self.null: src.append("    raise PropNullException(%sname)" % ( p ))
+        if self.read_only: src.append("    if hasattr(obj, '%s'): raise PropReadOnlyException(%sname)" % ( key, p ))
+        src.append("    del obj.%s" % ( key ))
+
+        if self.lazy:
+            ns["prop_lazy_value"] = prop_lazy_value
+            ns[p + "stats"] = self.lazy_stats
+            src.append("def %smaterialize(obj):" % ( p ))
+            src.append("    try: " + self._initial_value_code(ns, p))
+            src.append("    except: obj.%s = prop_lazy_value; raise" % ( key ))
+            src.append("    %sstats[1] += 1" % ( p ))
+            src.append("    return obj.%s" % ( key ))
+
+        return "\n".join(src) + "\n"
+
+    # Internal: return the source lines resetting this property in the reset
+    # function generated for its container. A lazy property gets the marker.
+    def _reset_code(self, ns, p):
+        if self.__class__.reset.im_func is not Prop.reset.im_func:
+            return [ "%sprop.reset(obj)" % ( p ) ]
+        if self.lazy:
+            lines = [ "obj.%s = prop_lazy_value; %sstats[0] += 1" % ( self._store_key, p ) ]
+            if self.read_only:
+                lines.insert(0, "if hasattr(obj, '%s'): raise PropReadOnlyException(%sname)" % ( self._store_key, p ))
+            return lines
+        return [ self._initial_value_code(ns, p) ]
+
+    # Internal: return the source line setting the property to its initial
+    # value, when it is reset or when a lazy value is materialized (the
+    # marker is removed first so that the read-only check passes). A default
+    # value that passes the checks is stored directly, unless the checks
+    # depend on the object or on a validator.
+    def _initial_value_code(self, ns, p):
+        unset = ""
+        if self.lazy: unset = "del obj.%s; " % ( self._store_key )
+        if self.model:
+            return unset + "%sset(obj, %smodel.instantiate())" % ( p, p )
+
+        ns[p + "default"] = self.default
+        if self.read_only or self.validator != None:
+            return unset + "%sset(obj, %sdefault)" % ( p, p )
+        exec "def %scheck(value):\n" % ( p ) + \
+             "".join([ "    %s\n" % ( l ) for l in self._set_code(ns, p, obj_checks=False) + ["return value"] ]) in ns
+        try:
+            ns[p + "default"] = ns[p + "check"](self.default)
+        except Exception:
+            # Let the setter raise the exception every time.
+            return unset + "%sset(obj, %sdefault)" % ( p, p )
+        return "obj.%s = %sdefault" % ( self._store_key, p )
+
 # Integer property, which inherits from Prop class.
 class IntProp(Prop):
     def __init__(self, convert_from_string=False, *args, **kwargs):
@@ -307,6 +608,15 @@ class IntProp(Prop):
                 pass
         Prop.__set__(self, obj, value)
 
+    def _set_code(self, ns, p, obj_checks=True):
+        lines = []
+        if self.convert_from_string:
+            ns["atoi"] = string.atoi
+            lines += [ "if isinstance(value, basestring):",
+                       "    try: value = atoi(value)",
+                       "    except Exception: pass" ]
+        return lines + Prop._set_code(self, ns, p, obj_checks)
+
 # Long property, which inherits from Prop class.
 class LongProp(Prop):
     def __init__(self, convert_from_string=False, *args, **kwargs):
@@ -326,6 +636,18 @@ class LongProp(Prop):
                 pass
         Prop.__set__(self, obj, value)
 
+    def _get_return_code(self, ns, p):
+        return "return long(value)"
+
+    def _set_code(self, ns, p, obj_checks=True):
+        lines = []
+        if self.convert_from_string:
+            ns["atol"] = string.atol
+            lines += [ "if isinstance(value, basestring):",
+                       "    try: value = atol(value)",
+                       "    except Exception: pass" ]
+        return lines + Prop._set_code(self, ns, p, obj_checks)
+
 # String property, which inherits from the Prop class.
 class StrProp(Prop):
     def __init__(self, min_length=None, max_length=None, regexp=None, *args, **kwargs):
@@ -360,6 +682,101 @@ class StrProp(Prop):
         # Super
         Prop.__set__(self, obj, value) 
 
+    def _set_code(self, ns, p, obj_checks=True):
+        ns[p + "name"] = self.name
+        ns[p + "instances"] = tuple(self.valid_instances)
+        lines = [ "if value is not None and not isinstance(value, %sinstances): raise PropBadInstance(%sname, value)" % ( p, p ) ]
+        if self.min_length:
+            ns[p + "min_length"] = self.min_length
+            lines.append("if len(value) < %smin_length: raise PropMinLengthException(%sname, value, %smin_length)" % ( p, p, p ))
+        if self.max_length:
+            ns[p + "max_length"] = self.max_length
+            lines.append("if len(value) > %smax_length: raise PropMaxLengthException(%sname, value, %smax_length)" % ( p, p, p ))
+        if self.regexp:
+            ns[p + "regexp"] = self.regexp
+            ns[p + "regexp_match"] = re.compile(self.regexp).match
+            lines.append("if not %sregexp_match(value): raise PropRegexpException(%sname, value, %sregexp)" % ( p, p, p ))
+        return lines + Prop._set_code(self, ns, p, obj_checks)
+
+# Internal: cache of the functions generated by props_from_rows(), indexed by
+# container class, columns and trusted flag.
+prop_row_loaders = {}
+
+# Build a list of instances of the container class 'cls' from 'rows'.
+# 'columns' is either a list of property names, in the order of the fields of
+# the rows (tuples or lists), or a dictionary mapping the keys of the rows
+# (dictionaries) to property names. The properties that are not in the columns
+# get their initial value.
+#
+# A loader function is generated and cached for each class and columns: it
+# inlines the checks of each column and resets only the properties that are
+# not loaded. When 'trusted' is true, the values are stored as is, without
+# checks nor conversion, except for the properties having a model. This is
+# meant for values that are already typed, such as the values fetched from the
+# database.
+def props_from_rows(cls, rows, columns, trusted=False):
+    if isinstance(columns, dict): column_keys = tuple(sorted(columns.items()))
+    else: column_keys = tuple(enumerate(columns))
+    cache_key = (cls, column_keys, trusted)
+    try:
+        loader = prop_row_loaders[cache_key]
+    except KeyError:
+        loader = prop_row_loaders[cache_key] = _prop_row_loader(cls, column_keys, trusted)
+    return loader(rows)
+
+# Internal: generate the loader function used by props_from_rows().
+def _prop_row_loader(cls, column_keys, trusted):
+    cls._init_properties()
+    ns = cls._prop_namespace.copy()
+    ns["cls"] = cls
+    ns["new"] = cls.__new__
+
+    # The instances are created without calling __init__() unless a sub-class
+    # overrides it.
+    fresh = cls.__init__.im_func is PropContainer.__init__.im_func
+
+    loaded = {}
+    column_lines = []
+    for row_key, name in column_keys:
+        if loaded.has_key(name): raise Exception("Property '%s' is mapped to several columns." % ( name ))
+        loaded[name] = True
+        prop = cls.prop_set[name]
+        p, compiled, reset_lines = cls._prop_code[name]
+        value = "row[%r]" % ( row_key, )
+        if trusted and not prop.model and compiled:
+            column_lines.append("obj.%s = %s" % ( prop._store_key, value ))
+        elif trusted and not prop.model:
+            column_lines.append("setattr(obj, %r, %s)" % ( prop._store_key, value ))
+        elif compiled and not prop.model:
+            column_lines.append("value = " + value)
+            column_lines += prop._set_code(ns, p, obj_checks=not fresh)
+            column_lines.append("obj.%s = value" % ( prop._store_key ))
+        elif compiled:
+            column_lines.append("%sset(obj, %s)" % ( p, value ))
+        else:
+            column_lines.append("%sprop.__set__(obj, %s)" % ( p, value ))
+
+    lines = [ "def load(rows):", "    objs = []", "    append = objs.append", "    for row in rows:" ]
+    if fresh:
+        lines.append("        obj = new(cls)")
+        for name in cls.prop_set.keys():
+            if not loaded.has_key(name): lines += [ "        " + l for l in cls._prop_code[name][2] ]
+    else:
+        lines.append("        obj = cls()")
+    lines += [ "        " + l for l in column_lines ]
+    lines += [ "        append(obj)", "    return objs" ]
+    exec "\n".join(lines) + "\n" in ns
+    return ns["load"]
+
+# Return the list of the tuples of the values of the properties 'columns' of
+# the containers 'objs'.
+def props_to_rows(objs, columns):
+    if len(columns) == 0: return [ () for obj in objs ]
+    if len(columns) == 1:
+        get_value = operator.attrgetter(columns[0])
+        return [ (get_value(obj),) for obj in objs ]
+    return map(operator.attrgetter(*columns), objs)
+
 
 # Non-exhaustive tests
 if __name__ == "__main__":
@@ -405,6 +822,12 @@ if __name__ == "__main__":
             print c1.__class__.__dict__['prop_set']
             print c2.__class__.__dict__['prop_set']
 
+            print "PRINTING CLASS PROPERTIES"
+            for cls in (B, C):
+                for name, prop in cls.prop_set.items():
+                    assert cls.__dict__[name].prop is prop and getattr(cls, name).name == name
+                    print cls.__name__, name, type(getattr(cls, name)).__name__, getattr(cls, name).default
+
             print "PRINTING ALL PROPERTIES"
             print "b1.a", b1.a
             print "b1.b", b1.b
@@ -449,3 +872,161 @@ if __name__ == "__main__":
 
     test_properties()
 
+    # Mass instantiation of a typical record, with the Prop objects, the
+    # generated accessors and the slot storage.
+    def bench_properties():
+        import time
+
+        def record_class(compile_flag, slots_flag):
+            class R(PropContainer):
+                prop_compile = compile_flag
+                prop_slots = slots_flag
+                prop_set = PropSet()
+                prop_set['id'] = IntProp(default=0, null=False)
+                prop_set['name'] = StrProp(default='', max_length=64)
+                prop_set['email'] = StrProp(default='')
+                prop_set['size'] = LongProp(default=0)
+                prop_set['enabled'] = Prop(default=True, valid_types=[bool])
+                prop_set['note'] = Prop()
+            return R
+
+        nb = 20000
+        for label, compile_flag, slots_flag in (("Prop objects", False, False), ("generated accessors", True, False),
+                                                ("generated accessors, slots", True, True)):
+            R = record_class(compile_flag, slots_flag)
+            start = time.time()
+            l = [ R() for i in range(nb) ]
+            instantiate_time = time.time() - start
+            start = time.time()
+            for r in l:
+                r.id = 1
+                r.name = 'John Smith'
+                r.size = r.id
+            set_time = time.time() - start
+            print "%-30s instantiate: %.2f us, set/get: %.2f us" % \
+                  (label, instantiate_time * 1000000.0 / nb, set_time * 1000000.0 / nb)
+
+    bench_properties()
+
+    # Instantiation of a tree of containers whose nested models are rarely
+    # read, with eager and lazy models.
+    def bench_lazy_properties():
+        import time
+
+        def tree_classes(lazy_flag):
+            class Leaf(PropContainer):
+                prop_set = PropSet()
+                prop_set['a'] = IntProp(default=0)
+                prop_set['b'] = StrProp(default='')
+            class Node(PropContainer):
+                prop_set = PropSet()
+                prop_set['name'] = StrProp(default='')
+                prop_set['left'] = Prop(model=PropModel(cls=Leaf), lazy=lazy_flag)
+                prop_set['right'] = Prop(model=PropModel(cls=Leaf), lazy=lazy_flag)
+            class Root(PropContainer):
+                prop_set = PropSet()
+                prop_set['first'] = Prop(model=PropModel(cls=Node), lazy=lazy_flag)
+                prop_set['second'] = Prop(model=PropModel(cls=Node), lazy=lazy_flag)
+            return Root, Node
+
+        nb = 5000
+        for label, lazy_flag in (("eager models", False), ("lazy models", True)):
+            Root, Node = tree_classes(lazy_flag)
+            start = time.time()
+            l = [ Root() for i in range(nb) ]
+            for r in l[::10]: r.first.left.a = 1
+            elapsed = time.time() - start
+            print "%-30s %.2f us per tree" % (label, elapsed * 1000000.0 / nb)
+            if lazy_flag: print "Root", Root.prop_lazy_stats(), "Node", Node.prop_lazy_stats()
+
+    bench_lazy_properties()
+
+    # Statistics of the lazy properties: each value is counted once as deferred,
+    # and once as materialized when it is read or replaced by imported data.
+    # Containers with lazy properties, defined at module level to be picklable.
+    class LazyHolder(PropContainer):
+        prop_set = PropSet()
+        prop_set['items'] = Prop(model=PropModel(cls=list), lazy=True)
+        prop_set['count'] = Prop(default=5, lazy=True)
+
+    class LazyHolderNoCompile(PropContainer):
+        prop_compile = False
+        prop_set = PropSet()
+        prop_set['items'] = Prop(model=PropModel(cls=list), lazy=True)
+        prop_set['count'] = Prop(default=5, lazy=True)
+
+    def test_lazy_stats():
+        class Data(PropContainer):
+            prop_set = PropSet()
+            prop_set['a'] = IntProp(default=0)
+            def import_data(self, value):
+                self.a = value['a']
+        for compile_flag in (True, False):
+            class Holder(PropContainer):
+                prop_compile = compile_flag
+                prop_set = PropSet()
+                prop_set['data'] = Prop(model=PropModel(cls=Data), lazy=True)
+            h = Holder()
+            h.data = { 'a' : 3 }
+            assert h.data.a == 3 and Holder.prop_lazy_stats()['data'] == (1, 1)
+            h.data = { 'a' : 4 }
+            Holder()
+            assert h.data.a == 4 and Holder.prop_lazy_stats()['data'] == (2, 1)
+        # The marker survives pickling and copying of unread lazy properties.
+        import pickle, copy
+        for holder_class in (LazyHolder, LazyHolderNoCompile):
+            copies = [ pickle.loads(pickle.dumps(holder_class(), protocol)) for protocol in (0, 2) ]
+            copies.append(copy.deepcopy(holder_class()))
+            copies.append(copy.copy(holder_class()))
+            for h in copies:
+                assert h.items == [] and h.count == 5
+        print "Lazy statistics OK."
+
+    test_lazy_stats()
+
+    # Loading of a list page: rows fetched from the database converted to
+    # containers and back.
+    def bench_rows():
+        import time
+
+        class User(PropContainer):
+            prop_set = PropSet()
+            prop_set['id'] = IntProp(default=0, null=False)
+            prop_set['name'] = StrProp(default='', max_length=64)
+            prop_set['email'] = StrProp(default='')
+            prop_set['size'] = LongProp(default=0)
+            prop_set['enabled'] = Prop(default=True, valid_types=[bool])
+            prop_set['note'] = Prop()
+
+        columns = ['id', 'name', 'email', 'size', 'enabled']
+        rows = [ (i, "User %i" % (i), "user%i@example.com" % (i), i * 1000L, True) for i in range(500) ]
+
+        def per_row_load():
+            objs = []
+            for row in rows:
+                obj = User()
+                for i, name in enumerate(columns): obj[name] = row[i]
+                objs.append(obj)
+            return objs
+
+        def per_row_dump(objs):
+            return [ tuple([ obj[name] for name in columns ]) for obj in objs ]
+
+        assert per_row_dump(per_row_load()) == props_to_rows(props_from_rows(User, rows, columns), columns) == \
+               props_to_rows(props_from_rows(User, rows, columns, trusted=True), columns) == rows
+
+        def bench(name, func):
+            nb = 50
+            start = time.time()
+            for i in range(nb): func()
+            print "%-30s %.3f ms per 500 rows" % (name, (time.time() - start) * 1000.0 / nb)
+
+        objs = per_row_load()
+        bench("load, per row", per_row_load)
+        bench("load, props_from_rows", lambda: props_from_rows(User, rows, columns))
+        bench("load, trusted", lambda: props_from_rows(User, rows, columns, trusted=True))
+        bench("dump, per row", lambda: per_row_dump(objs))
+        bench("dump, props_to_rows", lambda: props_to_rows(objs, columns))
+
+    bench_rows()
+
@@ -0,0 +1,401 @@
+# This module contains an event reactor: a loop that waits for file descriptors
+# to become ready, for timers to expire and for signals, and calls the
+# callbacks registered for them.
+#
+# The file descriptors are watched with epoll when it is available, otherwise
+# with poll() or select(). With epoll, the cost of an event does not depend on
+# the number of watched file descriptors, and there is no 1024 descriptors
+# limit. The timers are kept in a heap. The signals are delivered through a
+# self-pipe: the signal handler only writes the signal number to the pipe, and
+# the callback runs in the loop, like any other event.
+#
+# Usage:
+#   reactor = Reactor()
+#   reactor.add_reader(sock, handle_connection, sock)
+#   reactor.call_later(60, cleanup)
+#   reactor.add_signal(signal.SIGTERM, reactor.stop)
+#   reactor.run()
+#
+# The callbacks are called from the thread that runs the reactor. The reactor
+# is not thread-safe.
+
+import os, time, heapq, select, signal, errno, fcntl
+
+from kbase import check_interrupted_ex
+
+# Events of the file descriptors.
+KREACTOR_READ = 1
+KREACTOR_WRITE = 2
+
+# This function returns the file descriptor of the integer or of the object
+# having a fileno() method specified.
+def kreactor_fileno(fd):
+    if isinstance(fd, (int, long)): return fd
+    return fd.fileno()
+
+# Internal: epoll backend.
+class _EpollBackend(object):
+    name = "epoll"
+
+    def __init__(self):
+        self.epoll = select.epoll()
+
+    def _epoll_mask(self, mask):
+        epoll_mask = 0
+        if mask & KREACTOR_READ: epoll_mask |= select.EPOLLIN | select.EPOLLPRI
+        if mask & KREACTOR_WRITE: epoll_mask |= select.EPOLLOUT
+        return epoll_mask
+
+    def register(self, fd, mask):
+        self.epoll.register(fd, self._epoll_mask(mask))
+
+    def modify(self, fd, mask):
+        self.epoll.modify(fd, self._epoll_mask(mask))
+
+    def unregister(self, fd):
+        self.epoll.unregister(fd)
+
+    # Return the list of the ready file descriptors, as (fd, mask) tuples.
+    # The errors and hang-ups are reported as both events, so that the
+    # callbacks see them when they read or write.
+    def poll(self, timeout):
+        if timeout == None: timeout = -1
+        try: events = self.epoll.poll(timeout)
+        except (IOError, select.error), e:
+            check_interrupted_ex(e)
+            return []
+        result = []
+        for fd, epoll_mask in events:
+            mask = 0
+            if epoll_mask & (select.EPOLLIN | select.EPOLLPRI | select.EPOLLERR | select.EPOLLHUP): mask |= KREACTOR_READ
+            if epoll_mask & (select.EPOLLOUT | select.EPOLLERR | select.EPOLLHUP): mask |= KREACTOR_WRITE
+            result.append((fd, mask))
+        return result
+
+    def close(self):
+        self.epoll.close()
+
+# Internal: poll() backend.
+class _PollBackend(object):
+    name = "poll"
+
+    def __init__(self):
+        self.poller = select.poll()
+
+    def _poll_mask(self, mask):
+        poll_mask = 0
+        if mask & KREACTOR_READ: poll_mask |= select.POLLIN | select.POLLPRI
+        if mask & KREACTOR_WRITE: poll_mask |= select.POLLOUT
+        return poll_mask
+
+    def register(self, fd, mask):
+        self.poller.register(fd, self._poll_mask(mask))
+
+    def modify(self, fd, mask):
+        self.poller.register(fd, self._poll_mask(mask))
+
+    def unregister(self, fd):
+        self.poller.unregister(fd)
+
+    def poll(self, timeout):
+        if timeout != None: timeout = int(timeout * 1000)
+        try: events = self.poller.poll(timeout)
+        except select.error, e:
+            check_interrupted_ex(e)
+            return []
+        result = []
+        for fd, poll_mask in events:
+            mask = 0
+            if poll_mask & (select.POLLIN | select.POLLPRI | select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                mask |= KREACTOR_READ
+            if poll_mask & (select.POLLOUT | select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                mask |= KREACTOR_WRITE
+            result.append((fd, mask))
+        return result
+
+    def close(self):
+        pass
+
+# Internal: select() backend.
+class _SelectBackend(object):
+    name = "select"
+
+    def __init__(self):
+        self.readers = set()
+        self.writers = set()
+
+    def register(self, fd, mask):
+        if mask & KREACTOR_READ: self.readers.add(fd)
+        if mask & KREACTOR_WRITE: self.writers.add(fd)
+
+    def modify(self, fd, mask):
+        self.unregister(fd)
+        self.register(fd, mask)
+
+    def unregister(self, fd):
+        self.readers.discard(fd)
+        self.writers.discard(fd)
+
+    def poll(self, timeout):
+        try: rlist, wlist, xlist = select.select(self.readers, self.writers, [], timeout)
+        except select.error, e:
+            check_interrupted_ex(e)
+            return []
+        masks = {}
+        for fd in rlist: masks[fd] = KREACTOR_READ
+        for fd in wlist: masks[fd] = masks.get(fd, 0) | KREACTOR_WRITE
+        return masks.items()
+
+    def close(self):
+        pass
+
+# Timer returned by Reactor.call_later(). A cancelled timer stays in the heap
+# until it expires or reaches the top of the heap, and is then dropped.
+class KReactorTimer(object):
+    __slots__ = ( "deadline", "callback", "args", "cancelled" )
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+# Event reactor.
+class Reactor(object):
+
+    # 'backend' forces the backend ('epoll', 'poll' or 'select'). By default,
+    # the best backend available is used.
+    def __init__(self, backend=None):
+        if backend == None:
+            if hasattr(select, "epoll"): backend = "epoll"
+            elif hasattr(select, "poll"): backend = "poll"
+            else: backend = "select"
+        self._backend = { "epoll" : _EpollBackend, "poll" : _PollBackend, "select" : _SelectBackend }[backend]()
+
+        # Callbacks of the file descriptors: fd -> [ mask, read callback and
+        # arguments, write callback and arguments ].
+        self._handlers = {}
+
+        # Heap of (deadline, sequence number, timer).
+        self._timers = []
+        self._timer_seq = 0
+
+        # Self-pipe written by the signal handlers, callbacks of the signals
+        # and signal handlers replaced.
+        self._signal_pipe = None
+        self._signal_callbacks = {}
+        self._old_signal_handlers = {}
+
+        self._running = False
+
+    # This method returns the name of the backend used.
+    def backend_name(self):
+        return self._backend.name
+
+    # This method calls 'callback' with the arguments specified when the file
+    # descriptor (or object having a fileno() method) specified is readable.
+    # The callback replaces the previous read callback of the descriptor.
+    def add_reader(self, fd, callback, *args):
+        self._add_handler(kreactor_fileno(fd), KREACTOR_READ, (callback, args))
+
+    # This method calls 'callback' when the file descriptor specified is
+    # writable.
+    def add_writer(self, fd, callback, *args):
+        self._add_handler(kreactor_fileno(fd), KREACTOR_WRITE, (callback, args))
+
+    # These methods stop watching the file descriptor specified for reading
+    # or writing. They return true if the descriptor was watched.
+    def remove_reader(self, fd):
+        return self._remove_handler(kreactor_fileno(fd), KREACTOR_READ)
+
+    def remove_writer(self, fd):
+        return self._remove_handler(kreactor_fileno(fd), KREACTOR_WRITE)
+
+    def _add_handler(self, fd, event, callback):
+        handler = self._handlers.get(fd)
+        if handler == None:
+            handler = self._handlers[fd] = [ event, None, None ]
+            self._backend.register(fd, event)
+        elif not handler[0] & event:
+            handler[0] |= event
+            self._backend.modify(fd, handler[0])
+        handler[event] = callback
+
+    def _remove_handler(self, fd, event):
+        handler = self._handlers.get(fd)
+        if handler == None or not handler[0] & event: return False
+        handler[0] &= ~event
+        handler[event] = None
+        if handler[0]:
+            self._backend.modify(fd, handler[0])
+        else:
+            del self._handlers[fd]
+            self._backend.unregister(fd)
+        return True
+
+    # This method calls 'callback' with the arguments specified after 'delay'
+    # seconds. It returns a timer object, which can be cancelled.
+    def call_later(self, delay, callback, *args):
+        timer = KReactorTimer(time.time() + delay, callback, args)
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (timer.deadline, self._timer_seq, timer))
+        return timer
+
+    # This method calls 'callback' with the arguments specified, from the
+    # loop, when the signal specified is received. It must be called from the
+    # main thread.
+    def add_signal(self, signum, callback, *args):
+        if self._signal_pipe == None:
+            self._signal_pipe = os.pipe()
+            for fd in self._signal_pipe:
+                fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+                fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.fcntl(fd, fcntl.F_GETFD) | fcntl.FD_CLOEXEC)
+            self.add_reader(self._signal_pipe[0], self._read_signals)
+        if not self._old_signal_handlers.has_key(signum):
+            self._old_signal_handlers[signum] = signal.signal(signum, self._signal_handler)
+        self._signal_callbacks[signum] = (callback, args)
+
+    # This method restores the handler that the signal specified had before
+    # add_signal() was called.
+    def remove_signal(self, signum):
+        if not self._signal_callbacks.has_key(signum): return False
+        del self._signal_callbacks[signum]
+        signal.signal(signum, self._old_signal_handlers.pop(signum))
+        return True
+
+    # Internal: signal handler. It only wakes up the loop.
+    def _signal_handler(self, signum, frame):
+        try: os.write(self._signal_pipe[1], chr(signum))
+        except OSError, e:
+            # The pipe is full: the loop will wake up anyway.
+            if e.args[0] != errno.EAGAIN: raise
+
+    # Internal: call the callbacks of the signals written on the self-pipe.
+    # A signal received many times before the loop wakes up is reported once.
+    def _read_signals(self):
+        data = ""
+        while 1:
+            try: chunk = os.read(self._signal_pipe[0], 4096)
+            except OSError, e:
+                check_interrupted_ex(e)
+                break
+            if not chunk: break
+            data += chunk
+        for signum in sorted(set(map(ord, data))):
+            callback = self._signal_callbacks.get(signum)
+            if callback: callback[0](*callback[1])
+
+    # This method waits for events for at most 'timeout' seconds (forever if
+    # None, as long as there is something to wait for) and calls the callbacks
+    # of the events received and of the timers expired.
+    def run_once(self, timeout=None):
+        timers = self._timers
+        while timers and timers[0][2].cancelled: heapq.heappop(timers)
+        if timers:
+            timer_timeout = max(0, timers[0][0] - time.time())
+            if timeout == None or timer_timeout < timeout: timeout = timer_timeout
+
+        for fd, mask in self._backend.poll(timeout):
+            handler = self._handlers.get(fd)
+            if handler == None: continue
+            if mask & KREACTOR_READ and handler[1]:
+                handler[1][0](*handler[1][1])
+            # The read callback may have removed the write callback.
+            if mask & KREACTOR_WRITE and handler[2]:
+                handler[2][0](*handler[2][1])
+
+        now = time.time()
+        while timers and timers[0][0] <= now:
+            timer = heapq.heappop(timers)[2]
+            if not timer.cancelled:
+                timer.cancelled = True
+                timer.callback(*timer.args)
+
+    # This method runs the loop until stop() is called or nothing is left to
+    # wait for.
+    def run(self):
+        self._running = True
+        while self._running and (self._handlers or self._timers):
+            self.run_once()
+        self._running = False
+
+    # This method makes run() return after the current iteration.
+    def stop(self):
+        self._running = False
+
+    # This method restores the signal handlers and releases the resources of
+    # the reactor. The file descriptors watched are not closed.
+    def close(self):
+        for signum in self._signal_callbacks.keys(): self.remove_signal(signum)
+        if self._signal_pipe != None:
+            self.remove_reader(self._signal_pipe[0])
+            for fd in self._signal_pipe: os.close(fd)
+            self._signal_pipe = None
+        self._backend.close()
+
+
+# non-exhaustive tests
+if __name__ == "__main__":
+    import socket
+
+    for backend in ("epoll", "poll", "select"):
+        reactor = Reactor(backend)
+        events = []
+
+        # Timers, in order, and a cancelled timer.
+        reactor.call_later(0.03, events.append, "timer 3")
+        reactor.call_later(0.01, events.append, "timer 1")
+        reactor.call_later(0.02, events.append, "timer 2")
+        reactor.call_later(0.015, events.append, "cancelled").cancel()
+
+        # Socket pair: write, then read and stop.
+        a, b = socket.socketpair()
+        def on_writable():
+            a.send("ping")
+            reactor.remove_writer(a)
+        def on_readable():
+            events.append("read %s" % (b.recv(100)))
+        reactor.add_writer(a, on_writable)
+        reactor.add_reader(b, on_readable)
+
+        # Signal.
+        reactor.add_signal(signal.SIGUSR1, events.append, "SIGUSR1")
+        reactor.call_later(0.005, os.kill, os.getpid(), signal.SIGUSR1)
+
+        reactor.call_later(0.05, reactor.stop)
+        reactor.run()
+        reactor.close()
+        assert events == [ "read ping", "SIGUSR1", "timer 1", "timer 2", "timer 3" ], events
+        assert signal.getsignal(signal.SIGUSR1) == signal.SIG_DFL
+        print "%-8s OK" % (reactor.backend_name())
+
+    # Benchmark: one active socket pair among many idle ones, as many as the
+    # file descriptors limit allows (and select() is limited to 1024).
+    import resource
+    max_fds = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    for backend in ("epoll", "poll", "select"):
+        for nb_idle in (10, 500, 5000):
+            if nb_idle * 2 + 50 > max_fds or (backend == "select" and nb_idle * 2 + 50 > 1024): continue
+            reactor = Reactor(backend)
+            pairs = [ socket.socketpair() for i in range(nb_idle) ]
+            for x, y in pairs: reactor.add_reader(y, lambda: None)
+            a, b = socket.socketpair()
+            count = [0]
+            def on_readable():
+                b.recv(1)
+                count[0] += 1
+                if count[0] < 2000: a.send("x")
+                else: reactor.stop()
+            reactor.add_reader(b, on_readable)
+            a.send("x")
+            start = time.time()
+            reactor.run()
+            print "%-8s %5i idle fds: %.2f us per event" % (backend, nb_idle, (time.time() - start) * 1000000.0 / count[0])
+            reactor.close()
+            for x, y in pairs + [ (a, b) ]:
+                x.close()
+                y.close()
+
@@ -0,0 +1,189 @@
+# This module generates random tokens (session IDs, passwords) from the
+# operating system entropy source.
+#
+# The entropy is read from os.urandom() by large blocks rather than once per
+# character. Each byte is mapped to a character of the alphabet with a
+# translation table; the bytes that would make some characters more likely than
+# others (the bytes above the largest multiple of the alphabet size) are
+# rejected. The mapping is done by str.translate(), which runs in C.
+#
+# The characters not yet used are kept in a buffer, which can be filled ahead
+# of time with prefetch() when many tokens are about to be generated. The
+# generators are thread-safe. The buffer is discarded in a forked child, so
+# that the parent and the child never hand out the same tokens.
+
+import os, string, threading
+
+# Default alphabet: lowercase letters and digits.
+KTOKEN_ALPHABET = string.ascii_lowercase + string.digits
+
+# Number of bytes read from the entropy source at once.
+KTOKEN_BLOCK_SIZE = 4096
+
+# Random token generator.
+class TokenGenerator(object):
+
+    def __init__(self, alphabet=KTOKEN_ALPHABET, block_size=KTOKEN_BLOCK_SIZE):
+        if len(alphabet) < 2 or len(alphabet) > 256 or len(set(alphabet)) != len(alphabet):
+            raise ValueError("the alphabet must contain between 2 and 256 distinct characters")
+        self.alphabet = alphabet
+        self.block_size = block_size
+
+        # Translation table and rejected bytes.
+        limit = 256 - 256 % len(alphabet)
+        self._table = "".join([ alphabet[i % len(alphabet)] for i in range(256) ])
+        self._rejected = "".join([ chr(i) for i in range(limit, 256) ])
+
+        # Buffer of the characters not used yet, position of the first one and
+        # ID of the process that filled it.
+        self._chars = ""
+        self._pos = 0
+        self._pid = os.getpid()
+
+        self._lock = threading.Lock()
+
+    # Internal: make sure that at least 'nb' characters are available. The
+    # lock must be held.
+    def _fill(self, nb):
+        if self._pid != os.getpid():
+            self._chars = ""
+            self._pos = 0
+            self._pid = os.getpid()
+        available = len(self._chars) - self._pos
+        if available >= nb: return
+        blocks = [ self._chars[self._pos:] ]
+        while available < nb:
+            chars = os.urandom(max(self.block_size, nb - available)).translate(self._table, self._rejected)
+            blocks.append(chars)
+            available += len(chars)
+        self._chars = "".join(blocks)
+        self._pos = 0
+
+    # This method fills the buffer so that at least 'nb' characters can be
+    # handed out without reading the entropy source.
+    def prefetch(self, nb):
+        self._lock.acquire()
+        try:
+            self._fill(nb)
+        finally:
+            self._lock.release()
+
+    # This method returns a token of 'length' characters.
+    def token(self, length):
+        self._lock.acquire()
+        try:
+            self._fill(length)
+            pos = self._pos
+            self._pos = pos + length
+            return self._chars[pos:pos + length]
+        finally:
+            self._lock.release()
+
+    # This method returns a list of 'count' tokens of 'length' characters.
+    def tokens(self, count, length):
+        self._lock.acquire()
+        try:
+            self._fill(count * length)
+            pos = self._pos
+            self._pos = pos + count * length
+            chars = self._chars
+            return [ chars[i:i + length] for i in xrange(pos, pos + count * length, length) ]
+        finally:
+            self._lock.release()
+
+# Generator used by gen_token().
+ktoken_default = TokenGenerator()
+
+# This function returns a token of 'length' lowercase letters and digits.
+def gen_token(length):
+    return ktoken_default.token(length)
+
+
+# non-exhaustive tests
+if __name__ == "__main__":
+    import time, random
+
+    # Chi-square statistic of the counts specified, all values being expected
+    # with the same probability.
+    def chi_square(counts, nb_values):
+        total = sum(counts.values())
+        expected = float(total) / nb_values
+        return sum([ (counts.get(v, 0) - expected) ** 2 / expected for v in range(nb_values) ])
+
+    # Upper bound of the chi-square statistic at p = 0.001, with the
+    # Wilson-Hilferty approximation.
+    def chi_square_limit(df):
+        z = 3.09
+        return df * (1.0 - 2.0 / (9 * df) + z * (2.0 / (9 * df)) ** 0.5) ** 3
+
+    def check(name, counts, nb_values):
+        stat = chi_square(counts, nb_values)
+        limit = chi_square_limit(nb_values - 1)
+        print "%-45s chi2=%8.1f limit=%8.1f %s" % (name, stat, limit, stat < limit and "OK" or "FAILED")
+
+    # Character frequencies, for several alphabet sizes (the sizes that do not
+    # divide 256 need the rejection).
+    for alphabet in (KTOKEN_ALPHABET, "01", "0123456789", string.ascii_letters + string.digits + "+/",
+                     "".join(map(chr, range(200)))):
+        generator = TokenGenerator(alphabet)
+        counts = {}
+        index = dict([ (c, i) for i, c in enumerate(alphabet) ])
+        for c in generator.token(len(alphabet) * 2000): counts[index[c]] = counts.get(index[c], 0) + 1
+        check("characters, alphabet of %i" % (len(alphabet)), counts, len(alphabet))
+
+    # Without the rejection, the first 256 % 36 characters would be 1/7 more
+    # likely than the others: the test must catch it.
+    biased = "".join([ KTOKEN_ALPHABET[ord(c) % 36] for c in os.urandom(36 * 2000) ])
+    counts = {}
+    for c in biased: counts[KTOKEN_ALPHABET.index(c)] = counts.get(KTOKEN_ALPHABET.index(c), 0) + 1
+    check("characters, modulo mapping (must fail)", counts, 36)
+
+    # Characters at each position of the tokens and pairs of consecutive
+    # characters.
+    tokens = ktoken_default.tokens(20000, 20)
+    for pos in (0, 19):
+        counts = {}
+        for t in tokens: counts[KTOKEN_ALPHABET.index(t[pos])] = counts.get(KTOKEN_ALPHABET.index(t[pos]), 0) + 1
+        check("position %i of the tokens" % (pos), counts, 36)
+    counts = {}
+    for t in tokens:
+        for i in range(0, 20, 2):
+            pair = KTOKEN_ALPHABET.index(t[i]) * 36 + KTOKEN_ALPHABET.index(t[i + 1])
+            counts[pair] = counts.get(pair, 0) + 1
+    check("pairs of characters", counts, 36 * 36)
+    assert len(set(tokens)) == len(tokens)
+
+    # Threads and fork.
+    generated = []
+    def worker():
+        for i in range(2000): generated.append(gen_token(20))
+    threads = [ threading.Thread(target=worker) for i in range(8) ]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert len(set(generated)) == len(generated) == 16000
+    ktoken_default.prefetch(1000)
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.write(w, gen_token(20))
+        os._exit(0)
+    os.waitpid(pid, 0)
+    assert os.read(r, 20) != gen_token(20)
+    print "Threads and fork OK."
+
+    # Benchmark against the former kbase.gen_random().
+    def old_gen_random(nb):
+        generator = random.SystemRandom()
+        s = ""
+        for i in range(nb):
+            s += generator.choice(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i', 'j', 'k', 'l', 'm',
+                                   'n', 'o', 'p', 'q', 'r', 's', 't', 'u', 'v', 'w', 'x', 'y', 'z',
+                                   '0', '1', '2', '3', '4', '5', '6', '7', '8', '9'])
+        return s
+
+    for name, func in (("old gen_random(20)", lambda: old_gen_random(20)), ("gen_token(20)", lambda: gen_token(20))):
+        nb = 20000
+        start = time.time()
+        for i in xrange(nb): func()
+        print "%-20s %.2f us" % (name, (time.time() - start) * 1000000.0 / nb)
+
@@ -5,6 +5,8 @@ On steroid value classes
 Includes type checking, validation and filtering of values
 """
 
+import copy
+
 # import modules from kpython lib
 import kdebug # need to import this way - see kdebug
 import koptions
@@ -12,40 +14,46 @@ import kfilter
 
 
 class ValidationTypeException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 class ValidationStringTooLongException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 class ValidationStringTooShortException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 class ValidationIntTooHighException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 class ValidationIntTooLowException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 class KValue(koptions.Options):
     """
     Basic value class
     must use new classes type to be able to use super in sub-classes (KValue(object) instead of KValue)
+    sub-classes declare their own options in options_spec (see koptions)
     """
 
+    # (option name, attribute name, default value, required)
+    options_spec = [
+        ("allow_none", "_allow_none", False, False),
+        ("pre_filter_callables", "_pre_filter_callables", None, False),
+        ("post_filter_callables", "_post_filter_callables", None, False),
+        ("raise_on_exception", "_raise_on_exception", False, False),
+    ]
+
     ## override and super me ##
     def __init__(self, **options):
-        # store options if not already stored by a sub-class
-        self.store_options(options)
+        # store options (if not already stored by a sub-class) and set the declared options attributes
+        self.load_options(options)
 
         # public 
         self.raw_value = None # value without modifications
         self.validation_exceptions = [] # list of validation exceptions
         
         # internal
-        self._allow_none = self.get_option("allow_none", default_value=False)
-        self._pre_filter_callables = self.get_option("pre_filter_callables")
-        self._post_filter_callables = self.get_option("post_filter_callables")
-        self._raise_on_exception = self.get_option("raise_on_exception", default_value=False)
+        self._pipelines = None # compiled filters - see _compile_filters
 
         # all the black magic appends here
         self.set_value(self.get_option("value"))
@@ -62,47 +70,31 @@ class KValue(koptions.Options):
 
     def get_value(self):
         # output debug info
-        kdebug.debug(3, "_get_value: value='%s'" % ( str(self._value) ), "kvalues" )
+        kdebug.debug(3, "_get_value: value='%s'", "kvalues", self._value)
 
         # return current value
         return self._value
     def set_value(self, value):
         # output debug info
-        kdebug.debug(3, "_set_value: value='%s'" % ( str(value) ), "kvalues" )
+        kdebug.debug(3, "_set_value: value='%s'", "kvalues", value)
 
         # Unmodified value
         self.raw_value = value
         self.validation_exceptions = []
 
-        # Make filters list
-        filters = []
-
-        if self._pre_filter_callables:
-            # Custom pre-filters
-            filters += self._pre_filter_callables
+        if self._pipelines == None:
+            self._compile_filters()
 
         if self._allow_none == True and value == None:
             # None value allowed... value is None... bypass other filters
-            pass
-
+            pipeline = self._pipelines[0]
         else:
-            if self._allow_none == False:
-                # None value not allowed... use a special filter for that
-                filters += [kfilter.filter_not_none]
-
-            # Class filter
-            filters += [self.filter]
-
-            if self._post_filter_callables:
-                # Custom post-filters
-                filters += self._post_filter_callables
-
-        kdebug.debug(4, "_set_value: filters='%s'" % ( str(filters) ), "kvalues" )
+            pipeline = self._pipelines[1]
 
         # Run filters
-        kdebug.debug(4, "_set_value: calling run_filters", "kvalues" )
-        fresult = kfilter.run_filters(value, filters)       
-        kdebug.debug(4, "_set_value: filter_result='%s'" % ( str(fresult) ), "kvalues" )
+        kdebug.debug(4, "_set_value: running filters", "kvalues" )
+        fresult = pipeline.run(value)
+        kdebug.debug(4, "_set_value: filter_result='%s'", "kvalues", fresult)
 
         # raise the first exception if exceptions and raise_on_exception
         if self._raise_on_exception != False:
@@ -114,14 +106,69 @@ class KValue(koptions.Options):
         self.validation_exceptions = list(fresult.validation_exceptions) # TEST - make a copy instead of assigning
     value = property(get_value)
 
+    def _compile_filters(self):
+        """
+        Compile the filters run by set_value: the custom pre-filters only (for None values, when allowed)
+        and the complete filters list (for other values)
+        """
+
+        pre_filters = []
+        if self._pre_filter_callables:
+            # Custom pre-filters
+            pre_filters += self._pre_filter_callables
+
+        filters = list(pre_filters)
+        if self._allow_none == False:
+            # None value not allowed... use a special filter for that
+            filters += [kfilter.filter_not_none]
+
+        # Class filter
+        filters += [self.filter]
+
+        if self._post_filter_callables:
+            # Custom post-filters
+            filters += self._post_filter_callables
+
+        kdebug.debug(4, "_compile_filters: filters='%s'", "kvalues", filters)
+        self._pipelines = ( kfilter.FilterPipeline(pre_filters), kfilter.FilterPipeline(filters) )
+
+    def restore_value(self, raw_value, value, validation_exceptions):
+        """
+        Set a value filtered previously, without running the filters again
+        """
+
+        self.raw_value = raw_value
+        self._value = value
+        self.validation_exceptions = list(validation_exceptions)
+
+    def copy(self, **options):
+        """
+        Return a copy of this value, without running the filters again
+        The filter lists can be replaced with the pre_filter_callables and post_filter_callables options
+        (the current value is kept as is).
+        """
+
+        kvalue = copy.copy(self)
+        kvalue.validation_exceptions = list(self.validation_exceptions)
+        kvalue._pipelines = None # the class filter is bound to this object
+        if options.has_key("pre_filter_callables"):
+            kvalue._pre_filter_callables = options.pop("pre_filter_callables")
+        if options.has_key("post_filter_callables"):
+            kvalue._post_filter_callables = options.pop("post_filter_callables")
+        for option in options.keys():
+            raise koptions.BadOption(option)
+        return kvalue
+
     def __str__(self):
         return "<class %s value='%s' valid='%s' validation_exceptions='%s'>" % \
             ( self.__class__.__name__, self.value, str(self.valid), self.validation_exceptions )
 
     ## override me ##
+    # The class filters are decorated with kfilter.fast_filter: they return the value when it is valid.
+    @kfilter.fast_filter
     def filter(self, value):
         # do nothing. return the unaltered value
-        return kfilter.FilterResult(value=value)
+        return value
 
 
 class KBoolValue(KValue):
@@ -133,10 +180,11 @@ class KBoolValue(KValue):
         super(KBoolValue, self).__init__(**options)
 
     # override
+    @kfilter.fast_filter
     def filter(self, value):
         # Convert other types to boolean (except None.. which bypasses filters)
         # Could provide a custom pre-filter if None has to be converted
-        return kfilter.filter_booleanize(value)
+        return kfilter.filter_booleanize.fast(value)
 
 
 class KIntValue(KValue):
@@ -144,38 +192,35 @@ class KIntValue(KValue):
     Int value
     """
 
-    def __init__(self, **options):
-        # store options if not already stored by a sub-class
-        self.store_options(options)
-
-        # internal
-        self._min_value = self.get_option("min_value")
-        self._max_value = self.get_option("max_value")
+    options_spec = [
+        ("min_value", "_min_value", None, False),
+        ("max_value", "_max_value", None, False),
+    ]
 
+    def __init__(self, **options):
         # super!
         super(KIntValue, self).__init__(**options)
 
 
+    @kfilter.fast_filter
     def filter(self, value):
-        kdebug.debug(1, 
-            "KIntValue.filter: value='%s', type='%s'" % ( str(value), type(value) ),
-            "kvalues" )
+        kdebug.debug(1, "KIntValue.filter: value='%s', type='%s'", "kvalues", value, type(value))
 
-        fresult = kfilter.FilterResult(value=value)
+        validation_exceptions = []
 
         if type(value) != int:
-            fresult.validation_exceptions.append(ValidationTypeException(expected_type=str(int), type=str(type(value))))
+            validation_exceptions.append(ValidationTypeException(expected_type=str(int), type=str(type(value))))
         else:
             if self._min_value and int(value) < int(self._min_value):
-                fresult.validation_exceptions.append(ValidationIntTooLowException(min_value=self._min_value, value=value))
+                validation_exceptions.append(ValidationIntTooLowException(min_value=self._min_value, value=value))
             if self._max_value and int(value) > int(self._max_value):
-                fresult.validation_exceptions.append(ValidationIntTooHighException(max_value=self._max_value, value=value))
+                validation_exceptions.append(ValidationIntTooHighException(max_value=self._max_value, value=value))
 
-        kdebug.debug(2,
-            "KIntValue.filter: filter_result='%s'" % ( str(fresult) ),
-            "kvalues" )
-                
-        return fresult
+        kdebug.debug(2, "KIntValue.filter: validation_exceptions='%s'", "kvalues", validation_exceptions)
+
+        if validation_exceptions:
+            return kfilter.FilterResult(value=value, validation_exceptions=validation_exceptions)
+        return value
 
 
 class KStringValue(KValue):
@@ -183,37 +228,34 @@ class KStringValue(KValue):
     String value
     """
 
-    def __init__(self, **options):
-        # store options if not already stored by a sub-class
-        self.store_options(options)
-
-        # internal
-        self._min_length = self.get_option("min_length")
-        self._max_length = self.get_option("max_length")
+    options_spec = [
+        ("min_length", "_min_length", None, False),
+        ("max_length", "_max_length", None, False),
+    ]
 
+    def __init__(self, **options):
         # super!
         super(KStringValue, self).__init__(**options)
 
+    @kfilter.fast_filter
     def filter(self, value):
-        kdebug.debug(1,
-            "KStringValue.filter: value='%s', type='%s'" % ( str(value), type(value) ),
-            "kvalues" )
+        kdebug.debug(1, "KStringValue.filter: value='%s', type='%s'", "kvalues", value, type(value))
 
-        fresult = kfilter.FilterResult(value=value)
+        validation_exceptions = []
 
         if not isinstance(value, basestring):
-            fresult.validation_exceptions.append(ValidationTypeException(expected_type=str(str), type=str(type(value))))
+            validation_exceptions.append(ValidationTypeException(expected_type=str(str), type=str(type(value))))
         else:
             if self._min_length and self._min_length and len(value) < self._min_length:
-                fresult.validation_exceptions.append(ValidationStringTooShortException(min_length=self._min_length, length=len(value)))
+                validation_exceptions.append(ValidationStringTooShortException(min_length=self._min_length, length=len(value)))
             if self._max_length and self._max_length and len(value) > self._max_length:
-                fresult.validation_exceptions.append(ValidationStringTooLongException(max_length=self._max_length, length=len(value)))
+                validation_exceptions.append(ValidationStringTooLongException(max_length=self._max_length, length=len(value)))
 
-        kdebug.debug(2,
-            "KStringValue.filter: filter_result='%s'" % ( str(fresult) ),
-            "kvalues" )
-        
-        return fresult
+        kdebug.debug(2, "KStringValue.filter: validation_exceptions='%s'", "kvalues", validation_exceptions)
+
+        if validation_exceptions:
+            return kfilter.FilterResult(value=value, validation_exceptions=validation_exceptions)
+        return value
 
 
 class KStringListValue(KValue):
@@ -226,9 +268,7 @@ class KStringListValue(KValue):
         super(KStringListValue, self).__init__(**options)
 
     def filter(self, value):
-        kdebug.debug(1,
-            "KStringListValue.filter: value='%s', type='%s'" % ( str(value), type(value) ),
-            "kvalues" )
+        kdebug.debug(1, "KStringListValue.filter: value='%s', type='%s'", "kvalues", value, type(value))
 
         fresult = kfilter.FilterResult(value=value)
 
@@ -240,9 +280,7 @@ class KStringListValue(KValue):
                     fresult.validation_exceptions.append(ValidationTypeException(expected_type="string list", type=str(type(value))))
                     break
 
-        kdebug.debug(2,
-            "KStringListValue.filter: filter_result='%s'" % ( str(fresult) ),
-            "kvalues" )
+        kdebug.debug(2, "KStringListValue.filter: filter_result='%s'", "kvalues", fresult)
         
         return fresult
 
@@ -257,9 +295,7 @@ class KStringDictValue(KValue):
         super(KStringDictValue, self).__init__(**options)
 
     def filter(self, value):
-        kdebug.debug(1,
-            "KStringListValue.filter: value='%s', type='%s'" % ( str(value), type(value) ),
-            "kvalues" )
+        kdebug.debug(1, "KStringListValue.filter: value='%s', type='%s'", "kvalues", value, type(value))
 
         fresult = kfilter.FilterResult(value=value)
 
@@ -271,13 +307,328 @@ class KStringDictValue(KValue):
                     fresult.validation_exceptions.append(ValidationTypeException(expected_type="string dict", type=str(type(value))))
                     break
 
-        kdebug.debug(2,
-            "KStringListValue.filter: filter_result='%s'" % ( str(fresult) ),
-            "kvalues" )
+        kdebug.debug(2, "KStringListValue.filter: filter_result='%s'", "kvalues", fresult)
         
         return fresult
 
 
+class ColumnResult(object):
+    """
+    Result of the validation of a column of values (see validate_column)
+    Attributes:
+        values(list): filtered values, in the same order as the input values
+        errors(dict): list of validation exceptions of each invalid value, by index
+    """
+
+    __slots__ = ( "values", "errors" )
+
+    def __init__(self, values, errors):
+        self.values = values
+        self.errors = errors
+
+    def get_valid(self):
+        # return wheither all values are valid or not
+        return len(self.errors) == 0
+    valid = property(get_valid)
+
+    def __str__(self):
+        return "<ColumnResult values=%i errors='%s'>" % ( len(self.values), str(self.errors) )
+
+
+class KValueSpec(object):
+    """
+    Value specification for the validation of many values at once (see validate_column)
+    value_class is a KValue class and the options are the options of that class (allow_none, min_length,
+    max_value, pre_filter_callables, ...), except "value". The options are checked and the filters are
+    compiled once, when the specification is created.
+
+    KIntValue and KStringValue specifications without custom filters are validated with fast paths that
+    check the whole column at once.
+    """
+
+    def __init__(self, value_class=KValue, **options):
+        if options.has_key("value"):
+            raise koptions.BadOption("value")
+
+        self.value_class = value_class
+        self.options = options
+
+        # prototype value - holds the options and the compiled filters
+        self._prototype = value_class(**options)
+        if self._prototype._pipelines == None:
+            self._prototype._compile_filters()
+
+        # fast paths
+        self._fast_path = None
+        self._value_fast_path = None
+        if not self._prototype._pre_filter_callables and not self._prototype._post_filter_callables:
+            if self._prototype.filter.im_func is KIntValue.filter.im_func:
+                self._fast_path = _validate_int_column
+                self._value_fast_path = _validate_int_value
+            elif self._prototype.filter.im_func is KStringValue.filter.im_func:
+                self._fast_path = _validate_string_column
+                self._value_fast_path = _validate_string_value
+
+    def validate_value(self, value):
+        """
+        Validate a single value
+        Returns:
+            tuple: the filtered value and the list of validation exceptions (empty if the value is valid)
+        """
+
+        if self._value_fast_path:
+            return value, self._value_fast_path(self._prototype, value)
+
+        if self._prototype._allow_none == True and value == None:
+            fresult = self._prototype._pipelines[0].run(value)
+        else:
+            fresult = self._prototype._pipelines[1].run(value)
+        return fresult.value, fresult.validation_exceptions
+
+    def validate(self, values):
+        """
+        Validate a list of values
+        Returns:
+            ColumnResult object
+        """
+
+        if self._fast_path:
+            return self._fast_path(self._prototype, values)
+
+        allow_none = self._prototype._allow_none
+        none_pipeline, pipeline = self._prototype._pipelines
+        filtered = []
+        errors = {}
+        i = 0
+        for value in values:
+            if allow_none == True and value == None:
+                fresult = none_pipeline.run(value)
+            else:
+                fresult = pipeline.run(value)
+            filtered.append(fresult.value)
+            if fresult.validation_exceptions:
+                errors[i] = fresult.validation_exceptions
+            i += 1
+        return ColumnResult(filtered, errors)
+
+
+def validate_column(values, spec):
+    """
+    Validate a list of values (e.g. a column of an imported file) with a value specification (KValueSpec)
+    This is the same as creating a value of the specification class for each value, but much faster.
+    Returns:
+        ColumnResult object
+    """
+
+    return spec.validate(values)
+
+
+def _validate_none_values(kvalue, values, bad_indexes, errors):
+    """
+    Report the None values of a column, for the fast paths
+    Returns the indexes of the values that are not None
+    """
+
+    others = []
+    for i in bad_indexes:
+        if values[i] == None:
+            if kvalue._allow_none == False:
+                errors[i] = [kfilter.ValidationNoneValueException()]
+        else:
+            others.append(i)
+    return others
+
+
+def _validate_int_value(kvalue, value):
+    """
+    Fast path of KValueSpec.validate_value for KIntValue - same checks as KIntValue.filter
+    """
+
+    if type(value) != int:
+        if value == None:
+            if kvalue._allow_none == False:
+                return [kfilter.ValidationNoneValueException()]
+            return []
+        return [ValidationTypeException(expected_type=str(int), type=str(type(value)))]
+
+    validation_exceptions = []
+    if kvalue._min_value and value < int(kvalue._min_value):
+        validation_exceptions.append(ValidationIntTooLowException(min_value=kvalue._min_value, value=value))
+    if kvalue._max_value and value > int(kvalue._max_value):
+        validation_exceptions.append(ValidationIntTooHighException(max_value=kvalue._max_value, value=value))
+    return validation_exceptions
+
+
+def _validate_string_value(kvalue, value):
+    """
+    Fast path of KValueSpec.validate_value for KStringValue - same checks as KStringValue.filter
+    """
+
+    if not isinstance(value, basestring):
+        if value == None:
+            if kvalue._allow_none == False:
+                return [kfilter.ValidationNoneValueException()]
+            return []
+        return [ValidationTypeException(expected_type=str(str), type=str(type(value)))]
+
+    validation_exceptions = []
+    if kvalue._min_length and len(value) < kvalue._min_length:
+        validation_exceptions.append(ValidationStringTooShortException(min_length=kvalue._min_length, length=len(value)))
+    if kvalue._max_length and len(value) > kvalue._max_length:
+        validation_exceptions.append(ValidationStringTooLongException(max_length=kvalue._max_length, length=len(value)))
+    return validation_exceptions
+
+
+def _validate_int_column(kvalue, values):
+    """
+    Fast path of KValueSpec.validate for KIntValue - same checks as KIntValue.filter
+    """
+
+    values = list(values)
+    errors = {}
+
+    # type
+    bad_indexes = [ i for i, value in enumerate(values) if type(value) != int ]
+    for i in _validate_none_values(kvalue, values, bad_indexes, errors):
+        errors[i] = [ValidationTypeException(expected_type=str(int), type=str(type(values[i])))]
+
+    # bounds - only scan the column when its extremes are out of bounds
+    if len(bad_indexes) == 0:
+        ints = values
+    else:
+        ints = [ value for value in values if type(value) == int ]
+    if len(ints):
+        if kvalue._min_value and min(ints) < int(kvalue._min_value):
+            min_value = int(kvalue._min_value)
+            for i, value in enumerate(values):
+                if type(value) == int and value < min_value:
+                    errors[i] = [ValidationIntTooLowException(min_value=kvalue._min_value, value=value)]
+        if kvalue._max_value and max(ints) > int(kvalue._max_value):
+            max_value = int(kvalue._max_value)
+            for i, value in enumerate(values):
+                if type(value) == int and value > max_value:
+                    errors.setdefault(i, []).append(ValidationIntTooHighException(max_value=kvalue._max_value, value=value))
+
+    return ColumnResult(values, errors)
+
+
+def _validate_string_column(kvalue, values):
+    """
+    Fast path of KValueSpec.validate for KStringValue - same checks as KStringValue.filter
+    """
+
+    values = list(values)
+    errors = {}
+
+    # type
+    bad_indexes = [ i for i, value in enumerate(values) if not isinstance(value, basestring) ]
+    for i in _validate_none_values(kvalue, values, bad_indexes, errors):
+        errors[i] = [ValidationTypeException(expected_type=str(str), type=str(type(values[i])))]
+
+    # lengths - only scan the column when its extremes are out of bounds
+    if kvalue._min_length or kvalue._max_length:
+        if len(bad_indexes) == 0:
+            lengths = map(len, values)
+        else:
+            lengths = [ len(value) if isinstance(value, basestring) else None for value in values ]
+        valid_lengths = [ length for length in lengths if length != None ]
+        if len(valid_lengths):
+            if kvalue._min_length and min(valid_lengths) < kvalue._min_length:
+                for i, length in enumerate(lengths):
+                    if length != None and length < kvalue._min_length:
+                        errors[i] = [ValidationStringTooShortException(min_length=kvalue._min_length, length=length)]
+            if kvalue._max_length and max(valid_lengths) > kvalue._max_length:
+                for i, length in enumerate(lengths):
+                    if length != None and length > kvalue._max_length:
+                        errors.setdefault(i, []).append(
+                            ValidationStringTooLongException(max_length=kvalue._max_length, length=length))
+
+    return ColumnResult(values, errors)
+
+
+class KRecordType(type):
+    """
+    Metaclass of the records (see KRecord)
+    It turns the field specifications of a record class into __slots__ and compiles its validator.
+    """
+
+    def __new__(meta, name, bases, d):
+        fields = list(d.get("fields", []))
+        for field_name, spec in fields:
+            if field_name in ( "errors", "fields", "field_names", "valid", "validate" ):
+                raise Exception("Reserved record field name: '%s'" % ( field_name ))
+            if not isinstance(spec, KValueSpec):
+                raise TypeError, "Field '%s' of record '%s' is not a KValueSpec." % ( field_name, name )
+        d["__slots__"] = tuple(d.get("__slots__", ())) + tuple([ field_name for field_name, spec in fields ])
+        d["fields"] = fields
+        cls = type.__new__(meta, name, bases, d)
+
+        # fields of the base record classes first
+        all_fields = []
+        for base in bases:
+            all_fields += getattr(base, "_all_fields", [])
+        cls._all_fields = all_fields + fields
+        cls.field_names = tuple([ field_name for field_name, spec in cls._all_fields ])
+
+        # compiled validator: a tuple of (field name, value validation callable)
+        cls._validators = tuple([ ( field_name, spec.validate_value ) for field_name, spec in cls._all_fields ])
+
+        return cls
+
+
+class KRecord(object):
+    """
+    Declarative record - a group of related values validated together
+    Sub-classes list their fields, with a value specification for each:
+
+    class UserRecord(KRecord):
+        fields = [ ( "name", KValueSpec(KStringValue, min_length=1, max_length=64) ),
+                   ( "uid", KValueSpec(KIntValue, min_value=1) ) ]
+
+    UserRecord.validate(d) validates all the fields of a dictionary in one pass and returns a record with the
+    filtered values as attributes and the validation exceptions in the "errors" dictionary (by field name).
+    Missing fields are validated as None. The instances use __slots__.
+    """
+
+    __metaclass__ = KRecordType
+    __slots__ = ( "errors", )
+
+    def __init__(self, **values):
+        # set values without validation
+        for field_name in self.field_names:
+            setattr(self, field_name, values.pop(field_name, None))
+        for field_name in values.keys():
+            raise AttributeError, field_name
+        self.errors = {}
+
+    @classmethod
+    def validate(cls, values):
+        record = object.__new__(cls)
+        errors = {}
+        get = values.get
+        for field_name, validate_value in cls._validators:
+            value, validation_exceptions = validate_value(get(field_name))
+            setattr(record, field_name, value)
+            if validation_exceptions:
+                errors[field_name] = validation_exceptions
+        record.errors = errors
+        return record
+
+    def get_valid(self):
+        # return wheither all values are valid or not
+        return len(self.errors) == 0
+    valid = property(get_valid)
+
+    def to_dict(self):
+        return dict([ ( field_name, getattr(self, field_name) ) for field_name in self.field_names ])
+
+    def __str__(self):
+        return "<%s %s valid='%s' errors='%s'>" % \
+            ( self.__class__.__name__, " ".join([ "%s='%s'" % ( field_name, getattr(self, field_name) )
+                                                  for field_name in self.field_names ]),
+              str(self.valid), str(self.errors) )
+
+
 if __name__ == "__main__":
     # non-exaustive tests
 
@@ -330,3 +681,64 @@ if __name__ == "__main__":
         print "Failed like expected: exception='%s'" % ( str(e) )
     print
 
+
+    # batch validation - compare with one value object per value
+    import time
+    def describe(exceptions):
+        return [ str(e) for e in exceptions ]
+
+    column = [ "alice", "bob", "", None, 5, "a" * 40 ] + [ "user%i" % ( i ) for i in range(20000) ]
+    int_column = [ 1, 0, -5, 500, None, "12", True ] + range(20000)
+    specs = [ ( column, KStringValue, { "min_length" : 1, "max_length" : 32 } ),
+              ( column, KStringValue, { "allow_none" : True, "max_length" : 32 } ),
+              ( column, KStringValue, { "max_length" : 32, "post_filter_callables" : [kfilter.filter_not_none] } ),
+              ( int_column, KIntValue, { "min_value" : 1, "max_value" : 100 } ),
+              ( int_column, KIntValue, { "allow_none" : True, "min_value" : 1 } ) ]
+    for values, value_class, options in specs:
+        start = time.time()
+        objects = [ value_class(value=value, **options) for value in values ]
+        one_by_one = time.time() - start
+        start = time.time()
+        result = validate_column(values, KValueSpec(value_class, **options))
+        batch = time.time() - start
+
+        assert result.values == [ o.value for o in objects ]
+        assert dict([ ( i, describe(e) ) for i, e in result.errors.items() ]) == \
+               dict([ ( i, describe(o.validation_exceptions) ) for i, o in enumerate(objects) if not o.valid ])
+        spec = KValueSpec(value_class, **options)
+        for i in range(10):
+            value, validation_exceptions = spec.validate_value(values[i])
+            assert value == objects[i].value and describe(validation_exceptions) == describe(objects[i].validation_exceptions)
+        print "%s %s: %i values, %i errors, %.3f seconds one by one, %.3f seconds in batch" % \
+            ( value_class.__name__, str(options.keys()), len(values), len(result.errors), one_by_one, batch )
+
+    # records
+    import sys
+    class UserRecord(KRecord):
+        fields = [ ( "name", KValueSpec(KStringValue, min_length=1, max_length=64) ),
+                   ( "uid", KValueSpec(KIntValue, min_value=1) ),
+                   ( "email", KValueSpec(KStringValue, allow_none=True, max_length=128,
+                                         pre_filter_callables=[kfilter.filter_none_to_empty_str]) ) ]
+
+    class AdminRecord(UserRecord):
+        fields = [ ( "level", KValueSpec(KIntValue, max_value=10) ) ]
+
+    print str(UserRecord.validate({ "name" : "bob", "uid" : 12 }))
+    print str(UserRecord.validate({ "name" : "", "uid" : "12", "email" : 5 }))
+    print str(AdminRecord.validate({ "name" : "root", "uid" : 1, "level" : 11 }))
+
+    nb = 10000
+    rows = [ { "name" : "user%i" % ( i ), "uid" : i + 1, "email" : "user%i@example.com" % ( i ) } for i in range(nb) ]
+    start = time.time()
+    kvalue_rows = [ { "name" : KStringValue(value=row["name"], min_length=1, max_length=64),
+                      "uid" : KIntValue(value=row["uid"], min_value=1),
+                      "email" : KStringValue(value=row["email"], allow_none=True, max_length=128,
+                                             pre_filter_callables=[kfilter.filter_none_to_empty_str]) }
+                    for row in rows ]
+    print "%i rows as KValue dicts: %.3f seconds, %i bytes per row (dict and objects only)" % \
+        ( nb, time.time() - start, sys.getsizeof(kvalue_rows[0]) +
+          sum([ sys.getsizeof(v) + sys.getsizeof(v.__dict__) for v in kvalue_rows[0].values() ]) )
+    start = time.time()
+    records = [ UserRecord.validate(row) for row in rows ]
+    print "%i rows as records: %.3f seconds, %i bytes per row (record and errors)" % \
+        ( nb, time.time() - start, sys.getsizeof(records[0]) + sys.getsizeof(records[0].errors) )
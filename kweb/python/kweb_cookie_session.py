@@ -0,0 +1,289 @@
+# This module contains the client-side session code. The data of a
+# KCookieSession is kept in a cookie, authenticated with an HMAC and optionally
+# encrypted, instead of the session database. Loading and saving such a session
+# costs no database query. When the data grows too large for a cookie, the
+# session transparently falls back to a database session (see KSession in
+# kweb_session): the cookie then only holds the authenticated session ID.
+#
+# Usage, with a KWebFramework object 'k':
+#   session = KCookieSession(secret, fallback=lambda sid=None: ksession_get_session(..., sid=sid))
+#   k.load_cookie_session(session)
+#   k.sd.foo = "bar"
+#   k.save_session()
+
+import pickle, zlib, hmac, hashlib, base64, struct, itertools
+
+# From kpython
+from kbase import *
+import kdebug # need to import this way - see kdebug
+
+# Maximum size of the cookie value, in bytes. Browsers accept about 4096 bytes
+# per cookie, name and attributes included.
+KCOOKIE_SESSION_MAX_SIZE = 3800
+
+# Default name of the session cookie.
+KCOOKIE_SESSION_NAME = "ksession"
+
+# Prefixes of the cookie values: the session data itself, or the ID of a
+# database session.
+KCOOKIE_SESSION_DATA_PREFIX = "c."
+KCOOKIE_SESSION_DB_PREFIX = "d."
+
+# Flags of the session data.
+KCOOKIE_SESSION_COMPRESSED = 1
+KCOOKIE_SESSION_ENCRYPTED = 2
+
+# Size of the nonce used for the encryption, in bytes.
+KCOOKIE_SESSION_NONCE_SIZE = 16
+
+# This function compares two strings in constant time.
+def kcookie_session_compare(a, b):
+    if len(a) != len(b): return False
+    result = 0
+    for x, y in itertools.izip(a, b): result |= ord(x) ^ ord(y)
+    return result == 0
+
+# This function encodes a string in URL-safe base64, without padding.
+def kcookie_session_b64encode(s):
+    return base64.urlsafe_b64encode(s).rstrip("=")
+
+# This function decodes a string encoded by kcookie_session_b64encode().
+def kcookie_session_b64decode(s):
+    return base64.urlsafe_b64decode(s + "=" * (-len(s) % 4))
+
+# This class represents a web session with a user whose data is stored in a
+# cookie. It has the same interface as KSession, so it can be stored in the web
+# framework object with set_session().
+class KCookieSession:
+
+    # This constructor creates an empty session. 'secret' is the server secret
+    # used to derive the authentication and encryption keys. If 'encrypt' is
+    # true, the data is encrypted, otherwise it is only authenticated (the
+    # client can read it). 'max_age' is the maximum age of the session data, in
+    # seconds, or 'None'. 'fallback' is a callable taking an optional session ID
+    # and returning a database session (KSession); without it, saving a
+    # session too large for a cookie raises an exception.
+    def __init__(self, secret, cookie_name=KCOOKIE_SESSION_NAME, encrypt=False,
+                 max_size=KCOOKIE_SESSION_MAX_SIZE, max_age=None, fallback=None):
+        self.cookie_name = cookie_name
+        self.encrypt = encrypt
+        self.max_size = max_size
+        self.max_age = max_age
+        self.fallback = fallback
+
+        # Authentication and encryption keys.
+        self.__mac_key = hmac.new(secret, "kcookie_session mac", hashlib.sha256).digest()
+        self.__enc_key = hmac.new(secret, "kcookie_session enc", hashlib.sha256).digest()
+
+        # Value of the cookie received from the client, if any.
+        self.__loaded_value = None
+
+        # Init session informations and data
+        self.clear()
+
+    # This method (re-)inits session informations and data
+    def clear(self):
+        # Session ID of the database session, if the session fell back to the
+        # database. Cookie sessions have no ID otherwise.
+        self.sid = None
+
+        # Database session, if the session fell back to the database.
+        self.db_session = None
+
+        # Session stamps
+        self.creation_date = None
+        self.last_read = None
+        self.last_update = None
+
+        # Data of the session.
+        self.data = PropStore()
+
+        # Value of the cookie to send to the client, set by save().
+        self.cookie_value = None
+
+    # This method assigns an empty PropStore to the data field.
+    def clear_data(self):
+        # Data of the session.
+        self.data = PropStore()
+
+    # This method check if session is older than X seconds.
+    def is_older(self, seconds):
+        if not self.creation_date or time.time() < (self.creation_date + seconds):
+            return False
+        return True
+
+    # This method loads the session from the cookie value specified. If the
+    # value is invalid, tampered with or expired, 0 is returned and the session
+    # is left empty. Otherwise 1 is returned.
+    def load(self, value):
+        self.clear()
+        self.__loaded_value = value
+        try:
+            if value.startswith(KCOOKIE_SESSION_DB_PREFIX):
+                return self.__load_db(value)
+            if value.startswith(KCOOKIE_SESSION_DATA_PREFIX):
+                return self.__load_data(value)
+        except Exception, e:
+            kdebug.debug(2, "Invalid session cookie: %s", "ksession", e)
+            self.clear()
+        return 0
+
+    # This method saves the session. The data is encoded in the cookie value if
+    # it fits in the cookie, otherwise it is saved in the database session. The
+    # cookie value to send to the client is stored in the cookie_value field.
+    def save(self):
+        now = int(time.time())
+        if self.creation_date == None: self.creation_date = now
+        self.last_update = now
+
+        if self.db_session == None:
+            value = self.__encode_data()
+            if len(value) <= self.max_size:
+                self.cookie_value = value
+                return
+
+            # Fall back to the database.
+            if self.fallback == None:
+                raise Exception("session data is too large for a cookie (%i bytes)" % (len(value)))
+            kdebug.debug(2, "Session data is too large for a cookie (%i bytes), using the database.",
+                         "ksession", len(value))
+            self.db_session = self.fallback()
+
+        self.db_session.data = self.data
+        self.db_session.save()
+        self.sid = self.db_session.sid
+        self.cookie_value = KCOOKIE_SESSION_DB_PREFIX + self.sid + "." + \
+                            kcookie_session_b64encode(self.__mac(KCOOKIE_SESSION_DB_PREFIX + self.sid))
+
+    # This method returns the value of the cookie to send to the client, or
+    # 'None' if the client already has it.
+    def get_cookie_value(self):
+        if self.cookie_value == self.__loaded_value: return None
+        return self.cookie_value
+
+    # This method returns the authentication code of the string specified.
+    def __mac(self, s):
+        return hmac.new(self.__mac_key, s, hashlib.sha256).digest()
+
+    # This method encrypts or decrypts the data specified with the nonce
+    # specified. The key stream is made of HMAC-SHA256 blocks of the nonce and a
+    # counter.
+    def __crypt(self, nonce, data):
+        stream = []
+        for i in range((len(data) + 31) / 32):
+            stream.append(hmac.new(self.__enc_key, nonce + struct.pack("!I", i), hashlib.sha256).digest())
+        return "".join([chr(ord(x) ^ ord(y)) for x, y in itertools.izip(data, "".join(stream))])
+
+    # This method returns the cookie value containing the session data.
+    def __encode_data(self):
+        flags = 0
+        body = pickle.dumps(self.data, pickle.HIGHEST_PROTOCOL)
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            body = compressed
+            flags |= KCOOKIE_SESSION_COMPRESSED
+        if self.encrypt:
+            nonce = os.urandom(KCOOKIE_SESSION_NONCE_SIZE)
+            body = nonce + self.__crypt(nonce, body)
+            flags |= KCOOKIE_SESSION_ENCRYPTED
+        blob = struct.pack("!BII", flags, self.creation_date, self.last_update) + body
+        return KCOOKIE_SESSION_DATA_PREFIX + kcookie_session_b64encode(blob + self.__mac(KCOOKIE_SESSION_DATA_PREFIX + blob))
+
+    # This method loads the session data from the cookie value specified.
+    def __load_data(self, value):
+        raw = kcookie_session_b64decode(value[len(KCOOKIE_SESSION_DATA_PREFIX):])
+        blob, mac = raw[:-32], raw[-32:]
+        if not kcookie_session_compare(mac, self.__mac(KCOOKIE_SESSION_DATA_PREFIX + blob)):
+            raise Exception("bad authentication code")
+
+        header_size = struct.calcsize("!BII")
+        flags, creation_date, last_update = struct.unpack("!BII", blob[:header_size])
+        if self.max_age != None and time.time() > last_update + self.max_age:
+            raise Exception("session expired")
+
+        body = blob[header_size:]
+        if flags & KCOOKIE_SESSION_ENCRYPTED:
+            if not self.encrypt: raise Exception("encrypted session data")
+            nonce = body[:KCOOKIE_SESSION_NONCE_SIZE]
+            body = self.__crypt(nonce, body[KCOOKIE_SESSION_NONCE_SIZE:])
+        elif self.encrypt:
+            raise Exception("unencrypted session data")
+        if flags & KCOOKIE_SESSION_COMPRESSED:
+            body = zlib.decompress(body)
+
+        # The data is only unpickled once it has been authenticated.
+        self.data = pickle.loads(body)
+        self.creation_date = creation_date
+        self.last_update = last_update
+        self.last_read = int(time.time())
+        self.cookie_value = value
+        return 1
+
+    # This method loads the database session whose ID is in the cookie value
+    # specified.
+    def __load_db(self, value):
+        sid, mac = value[len(KCOOKIE_SESSION_DB_PREFIX):].split(".", 1)
+        if not kcookie_session_compare(kcookie_session_b64decode(mac), self.__mac(KCOOKIE_SESSION_DB_PREFIX + sid)):
+            raise Exception("bad authentication code")
+        if self.fallback == None:
+            raise Exception("no database session fallback")
+
+        db_session = self.fallback(sid)
+        if db_session.sid != sid:
+            # The database session no longer exists and a new one was created.
+            return 0
+        self.db_session = db_session
+        self.sid = db_session.sid
+        self.creation_date = db_session.creation_date
+        self.last_read = db_session.last_read
+        self.last_update = db_session.last_update
+        self.data = db_session.data
+        self.cookie_value = value
+        return 1
+
+
+# non-exhaustive tests
+if __name__ == "__main__":
+
+    # Fake database session.
+    class FakeDbSession:
+        sessions = {}
+        def __init__(self, sid=None):
+            self.sid = sid
+            self.creation_date = self.last_read = self.last_update = None
+            self.data = FakeDbSession.sessions.get(sid, PropStore())
+        def save(self):
+            if self.sid == None: self.sid = gen_random(20)
+            FakeDbSession.sessions[self.sid] = self.data
+
+    for encrypt in [False, True]:
+        s = KCookieSession("secret", encrypt=encrypt, fallback=FakeDbSession)
+        s.data.user = "bob"
+        s.save()
+        print "Cookie (%i bytes): %s" % (len(s.cookie_value), s.cookie_value)
+
+        s2 = KCookieSession("secret", encrypt=encrypt, fallback=FakeDbSession)
+        print "Loaded: %i, user: %s" % (s2.load(s.cookie_value), s2.data.user)
+        print "Cookie to send: %s" % (str(s2.get_cookie_value()))
+
+        tampered = s.cookie_value[:-2] + "AA"
+        print "Tampered: %i" % (KCookieSession("secret", encrypt=encrypt).load(tampered))
+        print "Wrong secret: %i" % (KCookieSession("other", encrypt=encrypt).load(s.cookie_value))
+
+        s2.data.big = os.urandom(5000)
+        s2.save()
+        print "Fell back to the database: %s" % (s2.cookie_value)
+        s3 = KCookieSession("secret", encrypt=encrypt, fallback=FakeDbSession)
+        print "Loaded: %i, sid: %s, big: %i bytes" % (s3.load(s2.cookie_value), s3.sid, len(s3.data.big))
+        print
+
+    # Cookie sent by the framework: the session cannot be read by JavaScript.
+    from kweb_wsgi import *
+    def handler(k):
+        k.load_cookie_session(KCookieSession("secret"))
+        k.sd.user = "bob"
+        k.save_session()
+    status, headers, body = kweb_wsgi_call(kweb_wsgi_application(handler))
+    cookie = [ value for key, value in headers if key == 'Set-Cookie' ][0]
+    assert "httponly" in cookie.lower()
+    print "Session cookie: %s" % (cookie)
@@ -0,0 +1,126 @@
+# This module contains the HTML escaping functions used by the web interfaces.
+# Most strings written in a page (identifiers, numbers, plain labels) need no
+# escaping at all, so each function first checks whether the string contains a
+# special character and returns it as-is when it does not. The other strings
+# are escaped with str.replace(), which runs in C.
+#
+# The attribute escaping functions return exactly what xml.sax.saxutils.quoteattr()
+# returns: the escaped value enclosed within double quotes, or within single
+# quotes if the value contains double quotes but no single quotes.
+
+import re
+
+# Characters escaped in free-standing HTML text.
+kweb_escape_text_re = re.compile('[&<>"\']')
+
+# Characters escaped in attribute values (the quotes are handled separately).
+kweb_escape_attribute_re = re.compile('[&<>\n\r\t"]')
+
+# Maximum number of entries of the memo caches. The caches are simply emptied
+# when they are full.
+KWEB_ESCAPE_CACHE_SIZE = 4096
+
+# Memo caches of the escaped strings.
+kweb_escape_text_cache = {}
+kweb_escape_attribute_cache = {}
+
+# This function returns a properly HTML-escaped version of a string for
+# inclusion in free-standing HTML text.
+def kweb_escape_text(s):
+    if not kweb_escape_text_re.search(s): return s
+    return s.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;") \
+            .replace('"', "&quot;").replace("'", "&#39;")
+
+# This function returns a properly HTML-escaped version of the string specified
+# for an HTML attribute, enclosed within quotes.
+def kweb_escape_attribute(s):
+    if not kweb_escape_attribute_re.search(s): return '"' + s + '"'
+    s = s.replace("&", "&amp;").replace(">", "&gt;").replace("<", "&lt;") \
+         .replace("\n", "&#10;").replace("\r", "&#13;").replace("\t", "&#9;")
+    if '"' in s:
+        if "'" in s: return '"' + s.replace('"', "&quot;") + '"'
+        return "'" + s + "'"
+    return '"' + s + '"'
+
+# These functions escape the string specified like the functions above, but
+# remember the result. They are meant for the values written many times, such
+# as the labels of the choices of a form.
+def kweb_escape_text_cached(s):
+    try: return kweb_escape_text_cache[s]
+    except KeyError: pass
+    if len(kweb_escape_text_cache) >= KWEB_ESCAPE_CACHE_SIZE: kweb_escape_text_cache.clear()
+    e = kweb_escape_text_cache[s] = kweb_escape_text(s)
+    return e
+
+def kweb_escape_attribute_cached(s):
+    try: return kweb_escape_attribute_cache[s]
+    except KeyError: pass
+    if len(kweb_escape_attribute_cache) >= KWEB_ESCAPE_CACHE_SIZE: kweb_escape_attribute_cache.clear()
+    e = kweb_escape_attribute_cache[s] = kweb_escape_attribute(s)
+    return e
+
+# These functions return the list of the escaped versions of the strings
+# specified.
+def kweb_escape_texts(l):
+    return map(kweb_escape_text, l)
+
+def kweb_escape_attributes(l):
+    return map(kweb_escape_attribute, l)
+
+# This function returns a list of hidden form fields for the variables of the
+# dictionary specified.
+def kweb_escape_hidden_fields(vars, indent_spaces=0):
+    fmt = " " * indent_spaces + "<input type=\"hidden\" name=%s value=%s />\n"
+    return "".join([fmt % (kweb_escape_attribute(k), kweb_escape_attribute(v)) for k, v in vars.items()])
+
+
+# non-exhaustive tests
+if __name__ == "__main__":
+    import time, xml.sax.saxutils
+
+    # Reference implementations.
+    def old_text_escape(s):
+        table = { "&": "&amp;", '"': "&quot;", "'": "&#39;", ">": "&gt;", "<": "&lt;" }
+        l = []
+        for c in s: l.append(table.get(c, c))
+        return "".join(l)
+
+    def old_hidden_fields(vars, indent_spaces=0):
+        s = ""
+        for k, v in vars.items():
+            s += "%s<input type=\"hidden\" name=%s value=%s />\n" % \
+                 ((" " * indent_spaces), xml.sax.saxutils.quoteattr(k), xml.sax.saxutils.quoteattr(v))
+        return s
+
+    samples = [ "", "user_id", "12345", "John Smith", "R&D", "<script>", "it's", 'say "hi"', 'it\'s "x"',
+                "a\nb\tc\r", u"\xe9t\xe9 & co", "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 20 ]
+    for s in samples:
+        assert kweb_escape_text(s) == old_text_escape(s), s
+        assert kweb_escape_attribute(s) == xml.sax.saxutils.quoteattr(s), s
+        assert kweb_escape_text_cached(s) == old_text_escape(s), s
+        assert kweb_escape_attribute_cached(s) == xml.sax.saxutils.quoteattr(s), s
+    vars = dict([ ("var%i" % (i), s) for i, s in enumerate(samples) ])
+    assert kweb_escape_hidden_fields(vars, 4) == old_hidden_fields(vars, 4)
+    print "Output identical to the reference implementations."
+
+    # Typical page payload: mostly short, clean values, a few values to escape
+    # and a few paragraphs.
+    payload = [ "user%i" % (i) for i in range(200) ] + [ "Group %i & co" % (i) for i in range(50) ] + \
+              [ "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 10 ] * 10
+    hidden_vars = dict([ ("var%i" % (i), "value %i" % (i)) for i in range(50) ])
+
+    def bench(name, func):
+        nb = 200
+        start = time.time()
+        for i in range(nb): func()
+        print "%-40s %.3f ms" % (name, (time.time() - start) * 1000.0 / nb)
+
+    bench("html text (old)", lambda: map(old_text_escape, payload))
+    bench("html text", lambda: kweb_escape_texts(payload))
+    bench("html text (cached)", lambda: map(kweb_escape_text_cached, payload))
+    bench("html attribute (old)", lambda: map(xml.sax.saxutils.quoteattr, payload))
+    bench("html attribute", lambda: kweb_escape_attributes(payload))
+    bench("html attribute (cached)", lambda: map(kweb_escape_attribute_cached, payload))
+    bench("hidden fields (old)", lambda: old_hidden_fields(hidden_vars))
+    bench("hidden fields", lambda: kweb_escape_hidden_fields(hidden_vars))
+
@@ -4,7 +4,7 @@
 Forms helpers
 """
 
-import sys
+import sys, copy
 
 # kpython lib
 from kodict import *
@@ -123,22 +123,59 @@ class Form:
         self.filled = True
         for field in self.fields.values():
             if isinstance(field, RadioButtonField):
-                kdebug.debug(4, "Filling RadioButtonField field '%s' with values '%s'" % ( field.id, input_values ), 
-		    "kweb_forms" )
+                kdebug.debug(4, "Filling RadioButtonField field '%s' with values '%s'", "kweb_forms", field.id, input_values)
                 field.fill(input_values)
             else:
                 if input_values.has_key(field.reference):
-                    kdebug.debug(4, "Filling field '%s' with value '%s'" % ( field.id, input_values[field.reference] ), 
-			"kweb_forms" )
+                    kdebug.debug(4, "Filling field '%s' with value '%s'", "kweb_forms", field.id, input_values[field.reference])
                     field.fill(input_values[field.reference])
                 else:
-                    kdebug.debug(4, "Filling field '%s' with None (not sent)." % ( field.id ), "kweb_forms" )
+                    kdebug.debug(4, "Filling field '%s' with None (not sent).", "kweb_forms", field.id)
                     field.fill(None)
 
-            if isinstance(field, TextField) and field.verification_field_id:
-                if self.fields[field.verification_field_id].value != field.value:
-                    field.add_validation_exception(
-			ValidationVerificationFieldException())
+            self._check_field(field)
+
+    # fill form incrementally
+    # 'state' is a dictionary kept by the caller between calls (e.g. in the session - it can be pickled) that
+    # stores the raw values and the validation results of the fields. Only the fields whose raw value changed
+    # since the last call are filtered again: the filters of the fields must only depend on the raw value.
+    # The checks involving other fields (see _check_field) are always done again.
+    # The password and verification fields are never kept in the state, since the session may be stored on
+    # the client (see kweb_cookie_session): they are filtered on every call.
+    def fill_incremental(self, input_values, state):
+        self.filled = True
+        for field in self.fields.values():
+            raw_value = input_values.get(field.reference)
+
+            if not self._keep_field_state(field):
+                kdebug.debug(4, "Filling field '%s' (not kept in the state).", "kweb_forms", field.id)
+                field.fill(raw_value)
+                if state.has_key(field.id): del state[field.id]
+            elif state.has_key(field.id) and state[field.id][0] == raw_value:
+                kdebug.debug(4, "Field '%s' unchanged, restoring its value.", "kweb_forms", field.id)
+                field.restore(*state[field.id])
+            else:
+                kdebug.debug(4, "Filling field '%s' with value '%s'", "kweb_forms", field.id, raw_value)
+                field.fill(raw_value)
+                state[field.id] = ( copy.copy(raw_value), field.value, list(field.validation_exceptions) )
+
+        for field in self.fields.values():
+            self._check_field(field)
+
+    # returns wheither the raw value of a field can be kept in the state of fill_incremental
+    def _keep_field_state(self, field):
+        if isinstance(field, PasswordTextField):
+            return False
+        if isinstance(field, TextField) and field.verification_field_id:
+            return False
+        return True
+
+    # checks a filled field against the other fields of the form
+    def _check_field(self, field):
+        if isinstance(field, TextField) and field.verification_field_id:
+            if self.fields[field.verification_field_id].value != field.value:
+                field.add_validation_exception(
+                    ValidationVerificationFieldException())
 
     # not used finally
     #def clear(self):
@@ -158,11 +195,75 @@ class Form:
         for field in self.fields.values():
             field.localize_validation_exceptions(d)
 
+    # returns a new, unfilled copy of this form - see FormSchema
+    def _clone(self):
+        form = copy.copy(self)
+        form.notices = []
+        form.confirmations = []
+        form.filled = False
+        form.fields = odict()
+        for id, field in self.fields.items():
+            form.fields[id] = field._clone()
+        return form
+
+class FormSchema:
+    """
+    Compiled form definition
+
+    The form and its fields are built once, when the schema is defined (typically at module level), so
+    the field options are validated at that time. new_form() returns a form for a request by copying the
+    prototype fields, which skips the options processing and the initial value filtering done by the
+    field constructors.
+
+    The field options (choices, classes, filters, ...) are shared by all the forms of a schema and must
+    not be modified; only the values and validation exceptions belong to a form.
+    """
+
+    def __init__(self, id, fields, **form_options):
+        self._prototype = Form(id, **form_options)
+        for field in fields:
+            self._prototype.append_field(field)
+        self.id = self._prototype.id
+
+    def new_form(self):
+        return self._prototype._clone()
+
+class ChoicesHtml:
+    """
+    Escaped HTML of a choice list (see SelectField and RadioButtonField)
+    """
+
+    def __init__(self, choices):
+        # choices the HTML was computed for
+        self.items = choices.items()
+
+        # escaped value and label of each choice
+        self.escaped = []
+
+        # HTML of the options of a select box, with and without the 'selected' attribute
+        self.options = []
+        self.selected_options = []
+
+        # index of the first choice of each value (converted to a string)
+        self.index = {}
+
+        # HTML of all the (unselected) options and offset of each option in it
+        self.offsets = [0]
+
+        for k, v in self.items:
+            value, label = kweb_escape_attribute_cached(k), kweb_escape_text_cached(v)
+            self.index.setdefault(str(k), len(self.escaped))
+            self.escaped.append((value, label))
+            self.options.append('<option value=%s>%s</option>\n' % ( value, label ))
+            self.selected_options.append('<option value=%s selected>%s</option>\n' % ( value, label ))
+            self.offsets.append(self.offsets[-1] + len(self.options[-1]))
+        self.html = "".join(self.options)
+
 class ValidationInvalidChoiceException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 class ValidationVerificationFieldException(kfilter.ValidationException):
-    pass
+    __slots__ = ()
 
 # Form field class
 # override me
@@ -184,12 +285,16 @@ class GenericField(Options):
         # needed for debug (__str__)
         self._data = None
 
-        kdebug.debug(3, "New instance of class '%s'" % ( str(self.__class__.__name__) ), "kweb_forms" )
+        kdebug.debug(3, "New instance of class '%s'", "kweb_forms", self.__class__.__name__)
 
         # FIXME - choose a better name, ...
         # Form.each_field behaves differently if counts is true or false
         self.counts = True
 
+        # static HTML of the field, computed when first rendered
+        # (shared with the clones of the field - see FormSchema)
+        self._html_cache = {}
+
         # store options temporarily
         self.options = options
 
@@ -250,6 +355,13 @@ class GenericField(Options):
             self._data.set_value(value)
         self.validation_exceptions = self._data.validation_exceptions
 
+    # fill the field with a value and exceptions computed previously by fill() - see Form.fill_incremental
+    def restore(self, raw_value, value, validation_exceptions):
+        self.filled = True
+        if not self.force_value:
+            self._data.restore_value(raw_value, value, validation_exceptions)
+        self.validation_exceptions = self._data.validation_exceptions
+
     # set data only.. do not get validation exceptions back
     def set_value(self, value):
         self._data.set_value(value)
@@ -271,14 +383,27 @@ class GenericField(Options):
     def add_validation_exception(self, e):
         self.validation_exceptions += [e]
 
+    # returns an unfilled copy of this field - see FormSchema
+    def _clone(self):
+        field = copy.copy(self)
+        field.filled = False
+        field.validation_exceptions = []
+        field._data = self._copy_data(field)
+        return field
+
+    # returns a copy of the field value for the field clone specified
+    # override me when the value filters are bound to the field
+    def _copy_data(self, field):
+        return self._data.copy()
+
     def localize_validation_exceptions(self, d):
         kdebug.debug(5, "Localizing messages for validation exceptions.", "kweb_forms" )
         for e in self.validation_exceptions:
             if d.has_key(e.classname()):
                 e.message = d[e.classname()]
-                kdebug.debug(6, "Found message id for for exception class '%s: '%s'." % ( e.classname(), d[e.classname()] ), "kweb_forms" )
+                kdebug.debug(6, "Found message id for for exception class '%s: '%s'.", "kweb_forms", e.classname(), d[e.classname()])
             else:
-                kdebug.debug(6, "Could not find local message for exception class '%s'." % ( e.classname() ), "kweb_forms" )
+                kdebug.debug(6, "Could not find local message for exception class '%s'.", "kweb_forms", e.classname())
 
     def clear(self):
         self.set_value("")
@@ -300,18 +425,58 @@ class GenericField(Options):
     def _attr_to_string(self, k, v):
         return ' %s=%s' % ( k, html_attribute_escape(v) )
 
-    def _attributes_string(self, attributes=None):
-        s = ''
+    # returns the static attributes of the field as a string
+    # the string is cached until the options it is made of change
+    def _attributes_string(self):
+        key = self._attributes_key()
+        cached = self._html_cache.get("attributes")
+        if cached == None or cached[0] != key:
+            l = []
+            self._attributes(l.append)
+            cached = self._html_cache["attributes"] = ( key, "".join(l) )
+        return cached[1]
+
+    # returns the options the static attributes are made of
+    # override and super me
+    def _attributes_key(self):
+        other_attributes = None
+        if self.other_attributes:
+            other_attributes = tuple(self.other_attributes.items())
+        return ( self.classes and tuple(self.classes), other_attributes )
+
+    # writes the static attributes of the field
+    # override and super me
+    def _attributes(self, write):
         if self.classes and len(self.classes):
-            s += self._attr_to_string("class", ' '.join(self.classes))
+            write(self._attr_to_string("class", ' '.join(self.classes)))
         if self.other_attributes and len(self.other_attributes):
-            for k, v in self.other_attributes:
-                s += self._attr_to_string(k, v)
-        return s
-        
+            for k, v in self.other_attributes.items():
+                write(self._attr_to_string(k, v))
+
+    # returns the escaped HTML of the field choices
+    # the HTML is cached until the choices change
+    def _get_choices_html(self):
+        choices_html = self._html_cache.get("choices")
+        if choices_html == None or choices_html.items != self.choices.items():
+            choices_html = self._html_cache["choices"] = ChoicesHtml(self.choices)
+        return choices_html
+
+    def html_output(self):
+        l = []
+        self.render(l.append)
+        return "".join(l)
+
+    # writes the HTML of the field, in fragments, with the 'write' callable
+    # (list.append, the out() method of the web framework, ...)
+    # override me
+    def render(self, write):
+        raise NotImplementedError
+
 
-        
 class TextField(GenericField):
+    # type of the input element
+    input_type = "text"
+
     def __init__(self, id, **options):
         # store options if not already stored by a sub-class
         self.store_options(options)
@@ -330,7 +495,7 @@ class TextField(GenericField):
         # super!
         super(TextField, self).__init__(id, **options)
 
-        kdebug.debug(1, "allow none: %s, required: %s" % ( str((not self.required)), str(self.required) ), "kweb_forms" )
+        kdebug.debug(1, "allow none: %s, required: %s", "kweb_forms", (not self.required), self.required)
 
         self._data = KStringValue(value=self.get_option("value"),
                                     allow_none=(not self.required), raise_on_exception=False,
@@ -338,33 +503,26 @@ class TextField(GenericField):
                                     pre_filter_callables=[filter_none_to_empty_str] + self.pre_filter_callables,
                                     post_filter_callables=self.post_filter_callables)
 
-    def html_output(self):
-        return '<input type="text" id=%s name=%s%s value=%s />' % \
-            ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id),
-              self._attributes_string(), html_attribute_escape(self.str_value) )
+    def render(self, write):
+        write('<input type="%s" id=%s name=%s%s value=%s />' % \
+            ( self.input_type, html_attribute_escape(self.fid_html), html_attribute_escape(self.id),
+              self._attributes_string(), html_attribute_escape(self.str_value) ))
 
 class PasswordTextField(TextField):
+    input_type = "password"
+
     def __init__(self, id, **options):
         # super!
         super(PasswordTextField, self).__init__(id, **options)
 
-    def html_output(self):
-        return '<input type="password" id=%s name=%s%s value=%s />' % \
-            ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id),
-              self._attributes_string(), html_attribute_escape(self.str_value) )
-
 class HiddenTextField(TextField):
+    input_type = "hidden"
+
     def __init__(self, id, **options):
         # super!
         super(HiddenTextField, self).__init__(id, **options)
         self.hidden = True
 
-
-    def html_output(self):
-        return '<input type="hidden" id=%s name=%s%s value=%s />' % \
-            ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id),
-              self._attributes_string(), html_attribute_escape(self.str_value) )
-
 class TextAreaField(TextField):
     def __init__(self, id, **options):
         # store options if not already stored by a sub-class
@@ -387,18 +545,20 @@ class TextAreaField(TextField):
                                     pre_filter_callables=[filter_none_to_empty_str] + self.pre_filter_callables,
                                     post_filter_callables=self.post_filter_callables)
 
-    def _attributes_string(self):
-        s = super(TextAreaField, self)._attributes_string()
+    def _attributes_key(self):
+        return super(TextAreaField, self)._attributes_key() + ( self.cols, self.rows )
+
+    def _attributes(self, write):
+        super(TextAreaField, self)._attributes(write)
         if self.cols:
-            s += self._attr_to_string("cols", self.cols)
+            write(self._attr_to_string("cols", str(self.cols)))
         if self.rows:
-            s ++ self._attr_to_string("rows", self.rows)
-        return s
+            write(self._attr_to_string("rows", str(self.rows)))
 
-    def html_output(self):
-        return '<textarea id=%s name=%s%s>%s</textarea>' % \
+    def render(self, write):
+        write('<textarea id=%s name=%s%s>%s</textarea>' % \
                 ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), 
-                  self._attributes_string(), html_attribute_escape(self.str_value) )
+                  self._attributes_string(), html_text_escape(self.str_value) ))
 
 class SelectField(GenericField):
     def __init__(self, id, **options):
@@ -420,25 +580,31 @@ class SelectField(GenericField):
 
     # FIXME
     def filter_choices(self, value):
-        kdebug.debug(4, "filter_choices: input value='%s'" % ( str(value) ), "kweb_forms" )
+        kdebug.debug(4, "filter_choices: input value='%s'", "kweb_forms", value)
 
         if not value in self.choices.keys():
             return FilterResult(value=value, validation_exceptions=[ValidationInvalidChoiceException()], continue_filtering=False)
 
         return FilterResult(value=value)
 
-    def html_output(self):
-       s = '<select id=%s name=%s%s>\n' % \
-                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() )
-       for k, v in self.choices.items():
-           kdebug.debug(1, "DEBUG: '%s' -- '%s'" % ( str(self._data.value), str(k) ), "kweb_forms" )
-           if str(self._data.value) == str(k):
-               s += '<option value=%s selected>%s</option>\n' % ( html_attribute_escape(k), html_text_escape(v) )
-           else:
-               s += '<option value=%s>%s</option>\n' % ( html_attribute_escape(k), html_text_escape(v) )
-
-       s += "</option>\n"
-       return s
+    # bind the choices filter to the clone
+    def _copy_data(self, field):
+        return self._data.copy(post_filter_callables=[field.filter_choices] + self.post_filter_callables)
+
+    # the options are escaped once per choice list (see ChoicesHtml), then
+    # written around the selected option
+    def render(self, write):
+        write('<select id=%s name=%s%s>\n' % \
+                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() ))
+        choices_html = self._get_choices_html()
+        i = choices_html.index.get(str(self._data.value))
+        if i == None:
+            write(choices_html.html)
+        else:
+            write(choices_html.html[:choices_html.offsets[i]])
+            write(choices_html.selected_options[i])
+            write(choices_html.html[choices_html.offsets[i + 1]:])
+        write("</select>\n")
 
 class CheckBoxField(GenericField):
     def __init__(self, id, **options):
@@ -456,13 +622,13 @@ class CheckBoxField(GenericField):
                                     pre_filter_callables=[kfilter.filter_booleanize_none] + self.pre_filter_callables,
                                     post_filter_callables=self.post_filter_callables)
 
-    def html_output(self):
+    def render(self, write):
         if self.value:
-            return '<input type="checkbox" id=%s name=%s%s checked />' % \
-                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() )
+            write('<input type="checkbox" id=%s name=%s%s checked />' % \
+                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() ))
         else:
-            return '<input type="checkbox" id=%s name=%s%s />' % \
-                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() )
+            write('<input type="checkbox" id=%s name=%s%s />' % \
+                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() ))
 
 class RadioButtonField(GenericField):
     def __init__(self, id, **options):
@@ -474,7 +640,7 @@ class RadioButtonField(GenericField):
         self.choices = KStringDictValue(value=self.get_option("choices"), allow_none=False).value
 
         # separater between choices
-        self.choices_separator = KStringValue(value=self.get_option("choices", default_value="<br />")).value
+        self.choices_separator = KStringValue(value=self.get_option("choices_separator", default_value="<br />")).value
 
         # super!
         super(RadioButtonField, self).__init__(id, **options)
@@ -486,28 +652,29 @@ class RadioButtonField(GenericField):
 
     # FIXME
     def filter_choices(self, value):
-        kdebug.debug(4, "filter_choices: input value='%s'" % ( str(value) ), "kweb_forms" )
+        kdebug.debug(4, "filter_choices: input value='%s'", "kweb_forms", value)
 
         if not value in self.choices.keys():
             return FilterResult(value=value, validation_exceptions=[ValidationInvalidChoiceException()], continue_filtering=False)
 
         return FilterResult(value=value)
 
-    def html_output(self):
-        i = 0
-        l = len(self.choices)
-        for k, v in self.choices.items():
-            i += 1
-            if l >= 1 and (i == 1 or i == l - 1):
-                s += self.choices_separator
-            if self.value == k:
-                s += '<input type="radio"id=%s name=%s%s value=%s checked /> %s' % \
-                        ( html_attribute_escape(self.fid_html), html_attribute_escape(k), html_text_escape(v) )
+    # bind the choices filter to the clone
+    def _copy_data(self, field):
+        return self._data.copy(post_filter_callables=[field.filter_choices] + self.post_filter_callables)
+
+    def render(self, write):
+        start = '<input type="radio" id=%s name=%s%s value=' % \
+                ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id), self._attributes_string() )
+        choices_html = self._get_choices_html()
+        l = []
+        for i in range(len(choices_html.items)):
+            value, label = choices_html.escaped[i]
+            if self.value == choices_html.items[i][0]:
+                l.append('%s%s checked /> %s' % ( start, value, label ))
             else:
-                s += '<input type="radio"id=%s name=%s%s value=%s /> %s' % \
-                        ( html_attribute_escape(self.fid_html), html_attribute_escape(self.id),
-                          html_attribute_escape(k), html_text_escape(v) )
-        return s
+                l.append('%s%s /> %s' % ( start, value, label ))
+        write(self.choices_separator.join(l))
 
 
 # non-exhaustive tests
@@ -568,3 +735,83 @@ if __name__ == "__main__":
     print "\n"
 
 
+    # compiled schema
+    import time
+    def build_fields():
+        return [ TextField("username", reference="username", required=True, min_length=3, max_length=20),
+                 PasswordTextField("password", reference="password", required=True),
+                 PasswordTextField("password2", reference="password2", required=True, verification_field_id="password"),
+                 SelectField("lang", reference="lang", choices={"en" : "English", "fr" : "French"}, value="en"),
+                 CheckBoxField("remember", reference="remember") ]
+
+    schema = FormSchema("login", build_fields())
+    form1 = schema.new_form()
+    form2 = schema.new_form()
+    form1.fill({"username" : "bob", "password" : "x", "password2" : "y", "lang" : "de"})
+    form2.fill({"username" : "alice", "password" : "x", "password2" : "x", "lang" : "fr"})
+    print "form1 valid: %s, form2 valid: %s" % ( str(form1.valid()), str(form2.valid()) )
+    for field in form1.each_field():
+        print str(field)
+    print "new form valid: %s, value: %s" % ( str(schema.new_form().fields["lang"].valid), schema.new_form().fields["lang"].value )
+
+    nb = 2000
+    start = time.time()
+    for i in range(nb):
+        form = Form("login")
+        for field in build_fields(): form.append_field(field)
+    built = time.time() - start
+    start = time.time()
+    for i in range(nb):
+        form = schema.new_form()
+    cloned = time.time() - start
+    print "%i forms: built in %.3f seconds, from the schema in %.3f seconds" % ( nb, built, cloned )
+
+    # rendering
+    field = TextAreaField("comment", reference="comment", cols=40, rows=4, classes=["wide"], value="<b>hi</b>")
+    print field.html_output()
+    field = RadioButtonField("color", reference="color", choices=odict([("r", "Red"), ("g", "Green & co")]),
+        choices_separator=" | ")
+    field.set_value("g")
+    print field.html_output()
+
+    choices = odict()
+    for i in range(5000): choices[str(i)] = "User <%i>" % ( i )
+    field = SelectField("user", reference="user", choices=choices, value="2500")
+    out = []
+    field.render(out.append)
+    print "".join(out)[:200]
+    nb = 100
+    start = time.time()
+    for i in range(nb):
+        out = []
+        field.render(out.append)
+    print "%i renders of a %i options select box in %.3f seconds" % ( nb, len(choices), time.time() - start )
+
+    # incremental fill
+    import pickle
+    calls = []
+    def filter_count(value):
+        calls.append(value)
+        return FilterResult(value=value)
+    schema = FormSchema("signup", [ TextField("username", reference="username", required=True, min_length=3,
+                                              pre_filter_callables=[filter_count]),
+                                    PasswordTextField("password", reference="password", required=True,
+                                                      pre_filter_callables=[filter_count]),
+                                    PasswordTextField("password2", reference="password2", required=True,
+                                                      verification_field_id="password",
+                                                      pre_filter_callables=[filter_count]),
+                                    RadioButtonField("plan", reference="plan", choices=odict([("f", "Free"), ("p", "Pro")]),
+                                                     pre_filter_callables=[filter_count]) ])
+    state = {}
+    for input_values in [ {"username" : "al", "password" : "x", "password2" : "x", "plan" : "f"},
+                          {"username" : "alice", "password" : "x", "password2" : "x", "plan" : "f"},
+                          {"username" : "alice", "password" : "y", "password2" : "x", "plan" : "p"} ]:
+        del calls[:]
+        form = schema.new_form()
+        form.fill_incremental(input_values, state)
+        state = pickle.loads(pickle.dumps(state, pickle.HIGHEST_PROTOCOL))
+        print "filtered: %s, valid: %s" % ( str(calls), str(form.valid()) )
+        assert not state.has_key("password") and not state.has_key("password2")
+        for field in form.each_field():
+            print "  " + str(field)
+
@@ -0,0 +1,1052 @@
+# This module contains the server-independent part of the web framework
+# wrapper. The wrapper is designed to be as generic as possible: the code that
+# talks to the web server lives in the subclasses of KWebFramework, currently
+# MpFramework (kweb_mp, mod_python) and WsgiFramework (kweb_wsgi, WSGI).
+from __future__ import with_statement
+import cgi, bisect, threading, zlib, hashlib, email.utils
+from kodict import *
+from kweb_lib import *
+import kdebug # need to import this way - see kdebug
+
+# Names of the request phases timed by the framework when profiling is enabled.
+# The phases handled by the application itself (rendering, for instance) can be
+# timed with KWebFramework.span().
+KWEB_PHASE_PARSE = "parse"
+KWEB_PHASE_SESSION_LOAD = "session_load"
+KWEB_PHASE_HANDLER = "handler"
+KWEB_PHASE_RENDER = "render"
+KWEB_PHASE_SESSION_SAVE = "session_save"
+KWEB_PHASE_WRITE = "write"
+
+# This class times a phase of a request. It is used with the 'with' statement:
+#   with k.span(KWEB_PHASE_RENDER):
+#       ...
+# Spans can be nested. The name of a nested span is prefixed by the names of
+# its parents, e.g. 'handler.render'.
+class KWebSpan(object):
+    def __init__(self, framework, name):
+        self.framework = framework
+        self.name = name
+        self.start = None
+        self.duration = None
+
+    def __enter__(self):
+        self.framework._begin_span(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.framework._end_span(self)
+        return False
+
+# This class is returned by KWebFramework.span() when profiling is disabled.
+class KWebNullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+kweb_null_span = KWebNullSpan()
+
+# This class is an histogram of the durations of a request phase.
+class KWebTimingHistogram(object):
+
+    # Upper bounds of the buckets, in milliseconds. The last bucket has no
+    # upper bound.
+    bounds = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    # This method adds a duration, in milliseconds, to the histogram.
+    def add(self, ms):
+        self.buckets[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        if self.min == None or ms < self.min: self.min = ms
+        if self.max == None or ms > self.max: self.max = ms
+
+    def __str__(self):
+        if not self.count: return "<%s count=0>" % ( self.__class__.__name__ )
+        return "<%s count=%i avg=%.3f min=%.3f max=%.3f buckets=%s>" % \
+            ( self.__class__.__name__, self.count, self.total / self.count, self.min, self.max, str(self.buckets) )
+
+# Timing histograms of the profiled requests handled by this process, indexed
+# by handler name, then by phase name.
+kweb_timing_histograms = {}
+kweb_timing_lock = threading.Lock()
+
+# This function returns a copy of the timing histograms dictionary.
+def kweb_get_timing_histograms():
+    kweb_timing_lock.acquire()
+    try:
+        d = {}
+        for handler, phases in kweb_timing_histograms.items(): d[handler] = phases.copy()
+        return d
+    finally:
+        kweb_timing_lock.release()
+
+# This function clears the timing histograms.
+def kweb_reset_timing_histograms():
+    kweb_timing_lock.acquire()
+    try: kweb_timing_histograms.clear()
+    finally: kweb_timing_lock.release()
+
+# Minimum size of a buffered response body for it to be compressed, in bytes.
+KWEB_COMPRESS_MIN_SIZE = 1024
+
+# Default compression level.
+KWEB_COMPRESS_LEVEL = 6
+
+# Prefixes of the content types that are already compressed. Responses of these
+# types are never compressed, except for the types listed in
+# KWEB_COMPRESSIBLE_CONTENT_TYPES.
+KWEB_COMPRESSED_CONTENT_TYPES = ["image/", "audio/", "video/", "application/zip", "application/gzip",
+                                 "application/x-gzip", "application/x-compress", "application/x-bzip2",
+                                 "application/x-7z-compressed", "application/x-rar-compressed"]
+KWEB_COMPRESSIBLE_CONTENT_TYPES = ["image/svg+xml", "image/bmp", "image/x-icon"]
+
+# Maximum total size of the compressed bodies kept in kweb_compression_cache, in
+# bytes.
+KWEB_COMPRESSION_CACHE_SIZE = 4 * 1024 * 1024
+
+# This function returns true if the responses of the content type specified are
+# worth compressing.
+def kweb_is_compressible(content_type):
+    if not content_type: return False
+    content_type = content_type.split(";")[0].strip().lower()
+    if content_type in KWEB_COMPRESSIBLE_CONTENT_TYPES: return True
+    for prefix in KWEB_COMPRESSED_CONTENT_TYPES:
+        if content_type.startswith(prefix): return False
+    return True
+
+# This function returns the content coding to use for a client that sent the
+# Accept-Encoding header specified: 'gzip', 'deflate' or 'None'. Gzip is
+# preferred when both are equally acceptable.
+def kweb_negotiate_encoding(accept_encoding):
+    if not accept_encoding: return None
+
+    # Get the quality value of each coding.
+    qvalues = {}
+    for item in accept_encoding.split(","):
+        params = item.split(";")
+        coding = params[0].strip().lower()
+        q = 1.0
+        for param in params[1:]:
+            param = param.strip()
+            if param.startswith("q="):
+                try: q = float(param[2:])
+                except ValueError: q = 0.0
+        qvalues[coding] = q
+
+    default_q = qvalues.get("*", 0.0)
+    gzip_q = qvalues.get("gzip", qvalues.get("x-gzip", default_q))
+    deflate_q = qvalues.get("deflate", default_q)
+    if gzip_q > 0 and gzip_q >= deflate_q: return "gzip"
+    if deflate_q > 0: return "deflate"
+    return None
+
+# This function returns a zlib compression object producing the content coding
+# specified.
+def kweb_compressor(encoding, level=KWEB_COMPRESS_LEVEL):
+    if encoding == "gzip": return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS)
+
+# This function compresses the data specified with the content coding specified.
+def kweb_compress(data, encoding, level=KWEB_COMPRESS_LEVEL):
+    compressor = kweb_compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+# This function returns true if the entity tag specified matches one of the
+# entity tags of the If-None-Match header specified. The weak comparison is
+# used, as required for If-None-Match.
+def kweb_etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*": return True
+    if etag.startswith("W/"): etag = etag[2:]
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"): tag = tag[2:]
+        if tag == etag: return True
+    return False
+
+# This function returns the timestamp corresponding to the HTTP date specified,
+# or 'None' if the date is invalid.
+def kweb_parse_http_date(s):
+    t = email.utils.parsedate_tz(s)
+    if t == None: return None
+    return email.utils.mktime_tz(t)
+
+# This function returns the HTTP date corresponding to the timestamp specified.
+def kweb_format_http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+# This class is a size-bounded cache of compressed response bodies. The least
+# recently used entries are dropped first.
+class KWebCompressionCache(object):
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = odict()
+        self.lock = threading.Lock()
+
+    # This method returns the data cached under the key specified, or 'None'.
+    def get(self, key):
+        self.lock.acquire()
+        try:
+            if not self.entries.has_key(key): return None
+            data = self.entries[key]
+
+            # Move the entry to the end of the list.
+            del self.entries[key]
+            self.entries[key] = data
+            return data
+        finally:
+            self.lock.release()
+
+    # This method caches the data specified under the key specified.
+    def put(self, key, data):
+        if len(data) > self.max_size: return
+        self.lock.acquire()
+        try:
+            if self.entries.has_key(key):
+                self.size -= len(self.entries[key])
+                del self.entries[key]
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                oldest_key, oldest_data = self.entries.popitem(last=False)
+                self.size -= len(oldest_data)
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.entries.clear()
+            self.size = 0
+        finally:
+            self.lock.release()
+
+# Compressed bodies of the responses tagged as cacheable.
+kweb_compression_cache = KWebCompressionCache(KWEB_COMPRESSION_CACHE_SIZE)
+
+# This class represents a file uploaded by the user. The 'name' field contains
+# the name of the file provided by the browser of the user. The 'file' field
+# contains an opened file-like object containing the data of the file.
+class KWebFile(object):
+    def __init__(self, filename, file):
+        self.filename = filename
+        self.file = file
+
+    def __str__(self):
+        return "<%s filename='%s'>" % ( self.__class__.__name__, self.filename )
+
+# This function returns the name of an uploaded file as it should be presented
+# to the application.
+def kweb_upload_filename(filename):
+    # Some browsers give a full path instead of a file name. Some
+    # browsers give an encoded file name. Plan for those cases.
+    # FIXME: is the explanation above and the code below correct?
+    filename = urllib.unquote_plus(filename) # unquote filename (it should be encoded like an url)
+    filename = re.sub(r'\\+', '/', filename) # some OS use "\" for paths... replace '\' in '/'
+    filename = os.path.basename(filename) # some browsers (IE) send full path.. rip path part and just get file name
+    return filename
+
+# Web framework wrapper. The methods marked "override me" interact with the web
+# server and must be implemented by the subclasses.
+class KWebFramework(object):
+
+    # Constructor of the framework object. The subclasses must call it once
+    # their own state has been set up.
+    def __init__(self):
+
+        # Debugging level:
+        # 0: debugging disabled.
+        # 1: log only critical information.
+        # 2: log informational messages.
+        self.debug_level = 0
+
+        # True if profiling is enabled. Enabling profiling also enables
+        # debugging.
+        self.profile_flag = False
+
+        # Reference to the session.
+        self.session = None
+
+        # Reference to self.session.data, for ease of access.
+        self.sd = None
+
+        # If this value is not 'None', it overrides the HTTP connection type
+        # value supplied by the user's browser.
+        self.conn_type_override = None
+
+        # Variables which are "global" to the request are stored in this
+        # property store.
+        self.gd = PropStore()
+
+        # List of GET and POST variables extracted from the client's request. It
+        # is legal to modify those variables as needed. This is 'None' until the
+        # request has been parsed.
+        self.__vars = None
+
+        # List of files uploaded by the client. This is 'None' until the request
+        # has been parsed.
+        self.__files = None
+
+        # Dictionary of HTTP headers extracted from the client's request. This
+        # is 'None' until the headers are first accessed.
+        self.__headers_in = None
+
+        # Ordered dictionary of HTTP headers to send to the client.
+        self.__headers_out = odict()
+
+        # Dictionary of cookies extracted from the client's request. This is
+        # 'None' until the cookies are first accessed.
+        self.__cookies_in = None
+
+        # Ordered dictionary of HTTP cookies to send to the client.
+        self.__cookies_out = odict()
+
+        # HTTP status to send to the client.
+        self.__http_status = None
+
+        # Content type to send to the client.
+        self.__content_type = None
+
+        # Buffered data to send to the client, as a list of chunks joined at the
+        # end of the request.
+        self.__buf_chunks = []
+
+        # True if the user has already written data to the client. In that case,
+        # any buffered data or headers will not be written at the end of the
+        # request.
+        self.__data_written = False
+
+        # Compression of the response. See set_compression() and
+        # set_cacheable().
+        self.__compress_flag = False
+        self.__compress_min_size = KWEB_COMPRESS_MIN_SIZE
+        self.__compress_level = KWEB_COMPRESS_LEVEL
+        self.__cacheable = False
+        self.__cache_key = None
+
+        # Compression object of the streamed output, if it is compressed.
+        self.__compressor = None
+
+        # Validators of the response. See set_etag(), set_last_modified() and
+        # not_modified(). The entity tag is computed from the buffered body when
+        # __etag_flag is true and no entity tag was supplied.
+        self.__etag_flag = False
+        self.__etag = None
+        self.__last_modified = None
+
+        # True if the client's cached copy is valid and a 304 response is sent.
+        self.__not_modified = False
+
+        # Spans currently open, innermost last, and spans completed, as
+        # (name, duration in milliseconds) tuples. Spans are only recorded when
+        # profiling is enabled.
+        self.__span_stack = []
+        self.__spans = []
+
+        # If a redirect has been requested, this field contains the URL to
+        # redirect to.
+        self.__redirect_url = None
+
+        # Set the default status and content type.
+        self.setStatus(KWEB_LIB_STATUS_OK)
+        self.setContentType("text/html")
+
+    # HTTP status property (read/write).
+    def getStatus(self):
+        return self.__http_status
+    def setStatus(self, x):
+        self.__http_status = x
+    status = property(getStatus, setStatus)
+
+    # Content type property (read/write).
+    def getContentType(self):
+        return self.__content_type
+    def setContentType(self, x):
+        self.__content_type = x
+    content_type = property(getContentType, setContentType)
+
+    # Input headers property (read/write). The headers are obtained from the
+    # web server on first access.
+    def getHeadersIn(self):
+        if self.__headers_in == None:
+            self.__headers_in = self._read_headers_in()
+        return self.__headers_in
+    def setHeadersIn(self, x):
+        self.__headers_in = x
+    headers_in = property(getHeadersIn, setHeadersIn)
+
+    # Output headers property (read/write).
+    def getHeadersOut(self):
+        return self.__headers_out
+    def setHeadersOut(self, x):
+        self.__headers_out = x
+    def appendHeadersOut(self, key, value):
+        # flush current value if any (needed so appened data is always last... (this is an odict and not a regular dict)
+        if self.__headers_out.has_key(key):
+            del self.__headers_out[key]
+        # append new value
+        self.__headers_out[key] = value
+    headers_out = property(getHeadersOut, setHeadersOut)
+
+    # Output cookies perperty (read/write)
+    def getCookiesOut(self):
+        return self.__cookies_out
+    def setCookiesOut(self, x):
+        self.__cookies_out = x
+    def appendCookiesOut(self, key, value):
+         # flush current value if any (needed so appened data is always last... (this is an odict and not a regular dict)
+        if self.__cookies_out.has_key(key):
+            del self.__cookies_out[key]
+        # append new value
+        self.__cookies_out[key] = value
+
+    # Environment property (read-only). This is the environment returned by
+    # the web server.
+    def getEnv(self):
+        return self._read_env()
+    def setEnv(self, x):
+        pass
+    env = property(getEnv, setEnv)
+
+    # This function must be called to process the client's request. 'func' is
+    # the application callback function that will be called to process the
+    # client's request. The value returned is the one expected by the web
+    # server; see _end_request().
+    def use_handler(self, func):
+
+        try:
+            if self.profile_flag:
+                self.profile("start of app handler")
+
+            # Call the application callback function. If it fails, log the
+            # events recorded by the kdebug flight recorder, if any, and clear
+            # them so that they are not logged again by the next failures. The
+            # exceptions used by the web server wrapper to end the request,
+            # for redirects, are not failures.
+            with self.span(KWEB_PHASE_HANDLER):
+                try:
+                    func(self)
+                except Exception, e:
+                    if not self._is_end_of_request(e): kdebug.dump_recorder(output=self.error, clear=True)
+                    raise
+
+            if self.profile_flag:
+                self.profile("end of app handler")
+
+            # If a redirect has been requested, redirect now.
+            if self.__redirect_url != None: self._send_redirect(self.__redirect_url)
+
+            # If no data has been written to the client yet, write any buffered
+            # headers and data.
+            if not self.__data_written:
+                with self.span(KWEB_PHASE_WRITE):
+                    body = self.__get_body()
+                    if self.__content_type: self._send_content_type(self.__content_type)
+                    self.__write_headers()
+                    self.__write_cookies()
+                    self._send_body(body)
+
+            # Terminate the compressed stream, if any.
+            elif self.__compressor != None:
+                with self.span(KWEB_PHASE_WRITE):
+                    self._send_chunk(self.__compressor.flush())
+                    self.__compressor = None
+
+            if self.profile_flag:
+                self.profile("end of handler")
+
+        finally:
+            # Record the timings, including when the handler redirected.
+            if self.profile_flag: self.__record_timings(func)
+
+        # Tell the web server the request has been handled.
+        return self._end_request()
+
+    # This function used to initialize the state of this object from the web
+    # server. The variables, files, headers and cookies of the request are
+    # now parsed lazily on first access, so this function does nothing. It is
+    # kept for the existing handlers that call it.
+    def init(self):
+        pass
+
+    # This method parses the GET and POST variables and the uploaded files of
+    # the request. It is called on the first access to the variables or the
+    # files; the results are kept for the rest of the request.
+    def __parse_fields(self):
+        if self.__vars != None: return
+        with self.span(KWEB_PHASE_PARSE):
+            self.__vars = odict()
+            self.__files = {}
+            self._parse_fields(self.__vars, self.__files)
+
+    # This method returns the cookies sent by the client's browser. They are
+    # parsed on first access.
+    def __get_cookies_in(self):
+        if self.__cookies_in == None:
+            self.__cookies_in = self._read_cookies_in()
+        return self.__cookies_in
+
+    # This method enables or disables debugging.
+    def set_debug(self, level):
+        self.debug_level = level
+
+    # This method enables or disables profiling. It should be called before
+    # use_handler() for the handler phase to be timed.
+    def set_profile(self, enable_flag):
+        self.profile_flag = enable_flag
+
+        # Remember the time at which the request started.
+        if enable_flag: self.__profile_startstamp = time.time()
+
+    # This method stores the session specified in this object.
+    def set_session(self, session):
+        self.session = session
+        self.sd = session.data
+
+    # This method calls the session loader specified with the arguments
+    # specified, e.g. ksession_get_session, and stores the session returned.
+    # The call is timed as the session load phase.
+    def load_session(self, loader, *args, **kwargs):
+        with self.span(KWEB_PHASE_SESSION_LOAD):
+            self.set_session(loader(*args, **kwargs))
+        return self.session
+
+    # This method loads the client-side session specified (see KCookieSession in
+    # kweb_cookie_session) from the cookie sent by the client's browser, then
+    # stores it in this object. If the session is saved before the headers are
+    # written, its cookie is sent back to the client when it has changed.
+    def load_cookie_session(self, session):
+        with self.span(KWEB_PHASE_SESSION_LOAD):
+            cookie = self.get_cookie_var(session.cookie_name)
+            if cookie != None: session.load(cookie.value)
+            self.set_session(session)
+        return session
+
+    # This method saves the current session. The call is timed as the session
+    # save phase.
+    def save_session(self):
+        with self.span(KWEB_PHASE_SESSION_SAVE):
+            self.session.save()
+
+    # This method clears data from session without clearing the session
+    def clear_session_data(self):
+        self.session.clear_data()
+        self.sd = self.session.data
+
+    # This method calls debug() with a string indicating the time elapsed
+    # since the query was started. The query is only decoded from the
+    # variables if they have already been parsed; otherwise the raw query
+    # string is shown, so that profiling does not parse the request.
+    def profile(self, comment):
+        if self.profile_flag:
+            t = time.time()
+            if self.__vars != None: query = str(self.cur_query())
+            else: query = self.env.get("QUERY_STRING", "")
+            self.debug(1, "profiling: %s (now: %f, elapsed: %f, query='%s')" \
+                          % (comment, t, t - self.__profile_startstamp, query))
+
+    # This method returns a span timing the phase specified. When profiling is
+    # disabled, the span returned does nothing.
+    def span(self, name):
+        if not self.profile_flag: return kweb_null_span
+        return KWebSpan(self, name)
+
+    # This method is called when a span is entered.
+    def _begin_span(self, span):
+        if len(self.__span_stack):
+            span.name = self.__span_stack[-1].name + "." + span.name
+        self.__span_stack.append(span)
+        span.start = time.time()
+
+    # This method is called when a span is exited.
+    def _end_span(self, span):
+        span.duration = (time.time() - span.start) * 1000.0
+        if len(self.__span_stack) and self.__span_stack[-1] is span:
+            self.__span_stack.pop()
+        self.__spans.append((span.name, span.duration))
+
+    # This method returns the durations of the spans completed so far, summed
+    # by name, as an ordered dictionary. The 'total' entry is the time elapsed
+    # since profiling was enabled.
+    def get_timings(self):
+        timings = odict()
+        for name, duration in self.__spans:
+            if timings.has_key(name): timings[name] += duration
+            else: timings[name] = duration
+        if self.profile_flag:
+            timings["total"] = (time.time() - self.__profile_startstamp) * 1000.0
+        return timings
+
+    # This method returns the value of the Server-Timing header of the
+    # response.
+    def get_server_timing(self):
+        return ", ".join(["%s;dur=%.3f" % (name, duration) for name, duration in self.get_timings().items()])
+
+    # This method adds the timings of this request to the histograms of the
+    # handler specified.
+    def __record_timings(self, func):
+        handler = "%s.%s" % (getattr(func, "__module__", None), getattr(func, "__name__", str(func)))
+        timings = self.get_timings()
+        self.debug(1, "profiling: handler='%s', timings: %s" % (handler, self.get_server_timing()))
+
+        kweb_timing_lock.acquire()
+        try:
+            if not kweb_timing_histograms.has_key(handler): kweb_timing_histograms[handler] = {}
+            phases = kweb_timing_histograms[handler]
+            for name, duration in timings.items():
+                if not phases.has_key(name): phases[name] = KWebTimingHistogram()
+                phases[name].add(duration)
+        finally:
+            kweb_timing_lock.release()
+
+    # This method stores the data specified in the output buffer. The output
+    # buffer will be written at the end of the request. Since the buffer is a
+    # list of chunks, this method can be passed as the 'write' callable of the
+    # render() methods of the form fields.
+    def out(self, data, drop_existing=False):
+        if drop_existing: del self.__buf_chunks[:]
+        self.__buf_chunks.append(str(data))
+
+    # This method logs the message specified in the server logs if the level
+    # specified is lower or equal to the debugging level.
+    def debug(self, level, msg):
+        if level <= self.debug_level: self._log("=DEBUG=> " + msg)
+
+    # This method logs the message specified in the server logs
+    def error(self, msg):
+        self._log("=ERROR=> " + msg)
+
+    # This method logs the message specified in the server logs
+    def log(self, msg):
+        self._log(msg)
+
+    # This method writes the data specified to the client without buffering.
+    # If the output is compressed, each write is flushed so that the client
+    # receives the data right away.
+    def write(self, data):
+        with self.span(KWEB_PHASE_WRITE):
+            if not self.__data_written:
+                self.__data_written = True
+                encoding = self.__get_encoding(None)
+                if encoding:
+                    self.__compressor = kweb_compressor(encoding, self.__compress_level)
+                    self.appendHeadersOut("Content-Encoding", encoding)
+                if self.__content_type: self._send_content_type(self.__content_type)
+                self.__write_headers()
+                self.__write_cookies()
+            if self.__compressor != None:
+                data = self.__compressor.compress(str(data)) + self.__compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._send_chunk(data)
+
+    # This method enables or disables the compression of the response, for the
+    # clients that accept it. Buffered responses smaller than 'min_size' bytes
+    # are sent uncompressed; streamed responses are always compressed when
+    # compression is enabled.
+    def set_compression(self, enable_flag, min_size=KWEB_COMPRESS_MIN_SIZE, level=KWEB_COMPRESS_LEVEL):
+        self.__compress_flag = enable_flag
+        self.__compress_min_size = min_size
+        self.__compress_level = level
+
+    # This method tags the buffered response as cacheable: its compressed body is
+    # kept in kweb_compression_cache and reused for the identical responses that
+    # follow. 'key' identifies the content of the response; by default, a hash
+    # of the body is used.
+    def set_cacheable(self, enable_flag=True, key=None):
+        self.__cacheable = enable_flag
+        self.__cache_key = key
+
+    # This method enables the ETag header of the response. If 'etag' is
+    # specified, it is used as the entity tag of the response; otherwise the
+    # entity tag is a hash of the buffered body. Clients sending back the entity
+    # tag in If-None-Match get a 304 response without a body.
+    def set_etag(self, etag=None):
+        if etag != None and not etag.endswith('"'): etag = '"%s"' % (etag)
+        self.__etag_flag = True
+        self.__etag = etag
+
+    # This method sets the Last-Modified header of the response to the
+    # timestamp specified. Clients sending a later or equal If-Modified-Since
+    # date get a 304 response without a body.
+    def set_last_modified(self, timestamp):
+        self.__last_modified = int(timestamp)
+
+    # This method sets the validators specified, then returns true if the copy
+    # of the response cached by the client is still valid. In that case, a 304
+    # response is sent at the end of the request, so the handler can return
+    # right away without rendering the page:
+    #   if k.not_modified(etag=str(config_version)): return
+    # The size of the body is not known yet, so the content coding suffix of the
+    # entity tag reflects the negotiation only: a body later sent uncompressed
+    # because it is smaller than the compression minimum size gets its entity
+    # tag fixed when it is written, and is revalidated at that point.
+    def not_modified(self, etag=None, last_modified=None):
+        if etag != None: self.set_etag(etag)
+        if last_modified != None: self.set_last_modified(last_modified)
+        if self.__etag == None and self.__last_modified == None: return False
+
+        if self.__is_fresh(self.__set_validators(self.__etag)):
+            self.__not_modified = True
+            self.status = KWEB_LIB_STATUS_NOT_MODIFIED
+        return self.__not_modified
+
+    # This method adds the validators of the response to the output headers.
+    # The entity tag specified, if any, is suffixed with the content coding of
+    # the response since the compressed and uncompressed representations
+    # differ. 'size' is the size of the body, or 'None' if it is not known yet.
+    # The final entity tag is returned.
+    def __set_validators(self, etag, size=None):
+        if etag != None:
+            encoding = self.__get_encoding(size)
+            if encoding: etag = etag[:-1] + "-" + encoding + '"'
+            self.appendHeadersOut("ETag", etag)
+        if self.__last_modified != None:
+            self.appendHeadersOut("Last-Modified", kweb_format_http_date(self.__last_modified))
+        return etag
+
+    # This method returns true if the conditional headers of the request show
+    # that the client's copy matches the validators specified.
+    def __is_fresh(self, etag):
+        if self.__http_status != KWEB_LIB_STATUS_OK: return False
+        if self.method() != "GET" and self.method() != "HEAD": return False
+
+        # If-None-Match takes precedence over If-Modified-Since.
+        if_none_match = self.get_header_in("If-None-Match")
+        if if_none_match != None:
+            return etag != None and kweb_etag_matches(if_none_match, etag)
+
+        if_modified_since = self.get_header_in("If-Modified-Since")
+        if if_modified_since != None and self.__last_modified != None:
+            t = kweb_parse_http_date(if_modified_since)
+            return t != None and self.__last_modified <= t
+
+        return False
+
+    # This method returns the buffered body to send to the client, after
+    # handling the validators and the compression.
+    def __get_body(self):
+        if self.__not_modified: return ""
+        body = "".join(self.__buf_chunks)
+
+        if self.__etag_flag or self.__last_modified != None:
+            etag = self.__etag
+            if self.__etag_flag and etag == None: etag = '"%s"' % (hashlib.sha1(body).hexdigest())
+            if self.__is_fresh(self.__set_validators(etag, len(body))):
+                self.__not_modified = True
+                self.status = KWEB_LIB_STATUS_NOT_MODIFIED
+                return ""
+
+        return self.__encode_body(body)
+
+    # This method returns the value of the request header specified, or 'None'.
+    # The header name is not case-sensitive.
+    def get_header_in(self, key):
+        headers_in = self.getHeadersIn()
+        if headers_in.has_key(key): return headers_in[key]
+        key = key.lower()
+        for name, value in headers_in.items():
+            if name.lower() == key: return value
+        return None
+
+    # This method returns the content coding to apply to the response, or
+    # 'None'. 'size' is the size of the body, or 'None' for streamed output.
+    def __get_encoding(self, size):
+        if not self.__compress_flag: return None
+        if not kweb_is_compressible(self.__content_type): return None
+        if self.__headers_out.has_key("Content-Encoding"): return None
+
+        # The response depends on the Accept-Encoding header from now on.
+        if not self.__headers_out.has_key("Vary"):
+            self.__headers_out["Vary"] = "Accept-Encoding"
+        elif self.__headers_out["Vary"].lower().find("accept-encoding") == -1:
+            self.__headers_out["Vary"] += ", Accept-Encoding"
+
+        if size != None and size < self.__compress_min_size: return None
+        return kweb_negotiate_encoding(self.get_header_in("Accept-Encoding"))
+
+    # This method returns the buffered body specified, compressed if the
+    # response should be compressed.
+    def __encode_body(self, data):
+        encoding = self.__get_encoding(len(data))
+        if encoding == None: return data
+        self.appendHeadersOut("Content-Encoding", encoding)
+
+        if not self.__cacheable:
+            return kweb_compress(data, encoding, self.__compress_level)
+
+        key = self.__cache_key
+        if key == None: key = hashlib.sha1(data).digest()
+        key = (key, encoding, self.__compress_level)
+        compressed = kweb_compression_cache.get(key)
+        if compressed == None:
+            compressed = kweb_compress(data, encoding, self.__compress_level)
+            kweb_compression_cache.put(key, compressed)
+        return compressed
+
+    # This method adds a header to the output header list.
+    def append_header_out(self, key, value):
+        self.__headers_out[key] = value
+
+    # This method writes the buffered headers to the client.
+    def __write_headers(self):
+        if self.profile_flag: self.appendHeadersOut("Server-Timing", self.get_server_timing())
+        self.debug(2, "Output headers:")
+        for key in self.__headers_out:
+            self.debug(2, "Outputing header: %s ==> %s." % (key, self.__headers_out[key]))
+            self._send_header(key, self.__headers_out[key])
+
+    # This method writes the buffered cookies to the client.
+    def __write_cookies(self):
+        # Add the cookie of the client-side session, if it changed. The cookie
+        # holds the whole session: it is not made readable by JavaScript.
+        if self.session != None and hasattr(self.session, "get_cookie_value"):
+            value = self.session.get_cookie_value()
+            if value != None:
+                attributes = { "path" : "/", "httponly" : True }
+                if self._is_secure(): attributes["secure"] = True
+                self.appendCookiesOut(self.session.cookie_name,
+                                      self.make_cookie(self.session.cookie_name, value, **attributes))
+
+        self.debug(2, "Output cookies:")
+        for key in self.__cookies_out:
+            self.debug(2, "Outputing cookie: %s ==> %s." % (key, self.__cookies_out[key]))
+            self._send_cookie(self.__cookies_out[key])
+
+    # This method redirects to a URL.
+    def redirect(self, url, twice=False):
+        if twice:
+            # Redirecting twice can possibly fix some problems. FIXME.
+            self.sd.redirect_twice = 1
+        self.debug(2, "Redirecting from '%s' to '%s'." % ( self.build_url(), url ) )
+        self.__write_headers()
+        self.__write_cookies()
+        self.profile("redirect: url='%s', twice='%s'" % (url, str(twice)))
+        self._send_redirect(url)
+
+    # This method redirects to the current page.
+    def redirect_self(self, twice=False):
+        self.redirect(self.build_url(), twice)
+
+    # This method redirects to a built URL.
+    def redirect_build(self, **params):
+        self.redirect(self.build_url(**params))
+
+    # This method builds a new URL based on current URL and the provided
+    # parameters.
+    def build_url(self, conn_type=None, conn_hostname=None, conn_port=None, path=None, query=None):
+        s = ''
+
+        # Connection string: (http|https)://host[:port]
+        if conn_type == None: conn_type = self.conn_type()
+        s += conn_type + '://'
+
+        if conn_hostname == None: conn_hostname = self.host()
+        s += conn_hostname
+
+        if conn_port == None: conn_port = self.port()
+        if conn_port: s += ":" + str(conn_port)
+
+        # Path.
+        if path == None: path = self.path()
+        if path:
+            s += path
+        else:
+            s += "/"
+
+        # GET query.
+        if query == None: query = str(self.cur_query())
+        if query: s += '?' + query
+
+        return s
+
+    # This method returns the current GET query, optionally with the session ID
+    # appended.
+    def cur_query(self, include_sid=True):
+        # FIXME.
+        #q = KWebVarEncoder(cgi.parse_qsl(self.env["QUERY_STRING"]))
+        q = KWebVarEncoder(self.get_vars())
+        if include_sid and self.session != None and self.session.sid != None: q["sid"] = self.session.sid
+        return q
+
+    # This method returns the value of the GET or POST variable specified. If
+    # the variable does not exist, 'None' is returned. Files are not retrieved
+    # with this method.
+    def get_var(self, key):
+        self.__parse_fields()
+        if self.__vars.has_key(key):
+            return self.__vars[key]
+        return None
+
+    # This method sets the value of a variable. This can be used to simulate the
+    # effect of a variable sent by the client's browser.
+    def set_var(self, key, value):
+        self.__parse_fields()
+        self.__vars[key] = value
+
+    # This method deletes the value of a variable. This can be used to simulate the
+    # effect of a variable not being sent by the client's browser
+    def del_var(self, key):
+        self.__parse_fields()
+        del self.__vars[key]
+
+    # This method returns the dictionary containing the GET and POST variables.
+    def get_vars(self):
+        self.__parse_fields()
+        return self.__vars
+
+    # This method returns the file object representing a file uploaded by the
+    # client's browser, or 'None'.
+    def get_file(self, key):
+        self.__parse_fields()
+        if self.__files.has_key(key):
+            return self.__files[key]
+        return None
+
+    # This method returns the dictionary containing the files uploaded by the
+    # client's browser.
+    def get_files(self):
+        self.__parse_fields()
+        return self.__files
+
+    # This method retrieves the value specified in the cookie sent by the
+    # client's browser, or 'None'.
+    def get_cookie_var(self, key):
+        cookies_in = self.__get_cookies_in()
+        if cookies_in.has_key(key):
+            return cookies_in[key]
+        return None
+
+    # This method returns the browser's connection type, either 'http' or
+    # 'https'.
+    def conn_type(self):
+        # Use overriden value.
+        if self.conn_type_override != None: return self.conn_type_override
+
+        if self._is_secure():
+            return 'https'
+        else:
+            return 'http'
+
+    # This method returns the session ID if it exists, otherwise this method
+    # throws an exception.
+    def get_sid(self):
+        if self.session and self.session.sid != None: return self.session.sid
+        raise Exception("no session ID currently exist")
+
+    # This function returns a string defining the hidden input control containing
+    # the session ID.
+    def sid_input(self):
+        return "<input id='sid' type='hidden' name='sid' value='%s'>\n" % (self.get_sid())
+
+    ## override me ##
+    # This method returns the server host.
+    def host(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns a cookie object suitable for appendCookiesOut(). The
+    # attributes are the cookie attributes, e.g. path='/'.
+    def make_cookie(self, name, value, **attributes):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns the HTTP method of the request.
+    def method(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns the port specified in the request URL, or 'None'.
+    def port(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns the URL path.
+    def path(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method parses the GET and POST variables of the request in the
+    # ordered dictionary 'vars' and the uploaded files in the dictionary
+    # 'files', as KWebFile objects.
+    def _parse_fields(self, vars, files):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns a dictionary of the HTTP headers of the request.
+    def _read_headers_in(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns a dictionary of the cookies of the request, indexed
+    # by name. The cookie objects have a 'value' attribute.
+    def _read_cookies_in(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns the environment of the request.
+    def _read_env(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method returns true if the request was made over SSL.
+    def _is_secure(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method sets the content type sent to the client.
+    def _send_content_type(self, content_type):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method sets an HTTP header sent to the client.
+    def _send_header(self, key, value):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method adds a cookie sent to the client.
+    def _send_cookie(self, cookie):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method sends the buffered body of the response at the end of the
+    # request.
+    def _send_body(self, data):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method sends data to the client without buffering. The headers have
+    # already been set when this method is called.
+    def _send_chunk(self, data):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method redirects the client to the URL specified. It must not
+    # return.
+    def _send_redirect(self, url):
+        raise NotImplementedError
+
+    # This method returns true if the exception specified is raised by the web
+    # server wrapper to end the request, e.g. by _send_redirect(), rather
+    # than by an error.
+    def _is_end_of_request(self, exception):
+        return False
+
+    ## override me ##
+    # This method is called at the end of use_handler(). Its return value (or
+    # exception) is passed back to the web server.
+    def _end_request(self):
+        raise NotImplementedError
+
+    ## override me ##
+    # This method logs the message specified in the server logs.
+    def _log(self, msg):
+        raise NotImplementedError
@@ -16,8 +16,8 @@ import kgetstrings
 # If <allow_basic_html> is True, will allow some html tags to pass through: <b>, </b>, <p>, </p>, <i>, </i>,
 # <nbsp> (which is not a real html tag by the way).
 def get_html_escaped_string(strings, key, app=None, none_if_missing=False, allow_basic_html=False):
-    kdebug.debug(1, "set_strings(key='%s', app='%s', none_if_missing='%s', allow_basic_html='%s'" % \
-        ( key, str(app), str(none_if_missing), str(allow_basic_html) ), "kweb_getstrings" )
+    kdebug.debug(1, "set_strings(key='%s', app='%s', none_if_missing='%s', allow_basic_html='%s'",
+        "kweb_getstrings", key, app, none_if_missing, allow_basic_html)
 
     # get the string
     tmpstr = kgetstrings.get_string(strings, key, app=app, none_if_missing=none_if_missing)
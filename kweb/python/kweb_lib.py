@@ -1,13 +1,16 @@
 # This module contains some web-related code common to all web interfaces.
 
-import urllib, xml.sax.saxutils
+import urllib
 
 # From kpython
 import kodict
 from kbase import *
 
+from kweb_escape import *
+
 # HTTP status codes to return to the user when his request has been processed.
 KWEB_LIB_STATUS_OK = 200
+KWEB_LIB_STATUS_NOT_MODIFIED = 304
 KWEB_LIB_STATUS_MOVED_TEMPORARILY = 307
 KWEB_LIB_STATUS_INTERNAL_ERROR = 500
 
@@ -22,18 +25,14 @@ class KWebVarEncoder(kodict.odict):
                 
 # This function returns a properly HTML-escaped version of the string specified
 # for an HTML input field. Note that the string returned is enclosed within
-# single quotes.
+# quotes. See kweb_escape.
 def html_attribute_escape(s):
-    return xml.sax.saxutils.quoteattr(s)
+    return kweb_escape_attribute(s)
     
 # This function returns a properly HTML-escaped version of a string for
-# inclusion in free-standing HTML text.
+# inclusion in free-standing HTML text. See kweb_escape.
 def html_text_escape(s):
-    l=[]
-    # If the attribute is recognized, replace it, otherwise include it as-is.
-    for c in s:
-        l.append(html_text_escape_table.get(c, c))
-    return "".join(l)
+    return kweb_escape_text(s)
 
 html_text_escape_table = {
     "&": "&amp;",
@@ -56,8 +55,5 @@ class ErrorMsg(Exception):
 
 # This function transforms a dict and returns a list of hidden form fields
 def vars_to_hidden_fields(vars, indent_spaces=0):
-    s = ""
-    for k, v in vars.items():
-        s += "%s<input type=\"hidden\" name=%s value=%s />\n" % ( (" " * indent_spaces), html_attribute_escape(k), html_attribute_escape(v) )
-    return s
+    return kweb_escape_hidden_fields(vars, indent_spaces)
 
@@ -180,18 +180,18 @@ def ksession_get_session(db_name, db_host, db_port, db_user, db_pwd,
     # The session possibly exists. Try to load it.
     if sid != None:
         if s.load(sid):
-            kdebug.debug(2, "Session with ID %s loaded successfully." % (sid), "ksession")
+            kdebug.debug(2, "Session with ID %s loaded successfully.", "ksession", sid)
             return s
             
         else:
-            kdebug.debug(2, "Session with ID %s was not found in database." % (sid), "ksession")
+            kdebug.debug(2, "Session with ID %s was not found in database.", "ksession", sid)
      
     # We would have to create a new session, but we're not allowed to.
     if not create_as_needed: raise Exception("the user session does not exist")
     
     # Save and return the session.
     s.save()
-    kdebug.debug(2, "Created new session with ID %s." % (s.sid), "ksession")
+    kdebug.debug(2, "Created new session with ID %s.", "ksession", s.sid)
     return s
 
 # Cached Postgres connection.
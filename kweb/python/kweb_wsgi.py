@@ -0,0 +1,296 @@
+# This module contains a WSGI implementation of the web framework wrapper. The
+# handlers written for MpFramework run unchanged with WsgiFramework, so they can
+# be served by any WSGI server (threaded or not) or called in-process.
+#
+# Usage:
+#   def handler(k):
+#       k.out("Hello %s" % (html_text_escape(k.get_var("name") or "")))
+#   application = kweb_wsgi_application(handler)
+import sys, cgi, Cookie, httplib, StringIO
+from kweb_framework import *
+
+# This exception is used internally to abort the application handler when a
+# redirect is requested, as util.redirect() does with mod_python.
+class WsgiRedirect(Exception):
+    pass
+
+# WSGI framework wrapper.
+class WsgiFramework(KWebFramework):
+
+    # Constructor of the WSGI framework object. It must be passed the WSGI
+    # environment and the start_response callable of the request.
+    def __init__(self, environ, start_response):
+
+        # WSGI environment of the request.
+        self.__environ = environ
+
+        # WSGI start_response callable.
+        self.__start_response = start_response
+
+        # FieldStorage instance of the request. It is kept for the same reason
+        # as in MpFramework: the file objects of the uploaded files belong to
+        # it.
+        self.__field_storage = None
+
+        # Content type, headers and cookies set for the response.
+        self.__response_content_type = None
+        self.__response_headers = odict()
+        self.__response_cookies = []
+
+        # Write callable returned by start_response(), once it has been called.
+        self.__wsgi_write = None
+
+        # Body of the response, returned to the WSGI server.
+        self.__body = []
+
+        KWebFramework.__init__(self)
+
+    # This function must be called to process the client's request. 'func' is
+    # the application callback function that will be called to process the
+    # client's request. The value returned must be returned by the WSGI
+    # application.
+    def use_handler(self, func):
+        try:
+            return KWebFramework.use_handler(self, func)
+        except WsgiRedirect:
+            return self._end_request()
+
+    # This method returns the server host.
+    def host(self):
+        if self.__environ.has_key('HTTP_HOST'):
+            return self.__environ['HTTP_HOST'].split(':')[0]
+        return self.__environ['SERVER_NAME']
+
+    # This method returns the port specified in the Host header, if any.
+    def port(self):
+        if self.__environ.has_key('HTTP_HOST'):
+            host = self.__environ['HTTP_HOST'].split(':')
+            if len(host) > 1: return host[1]
+        return None
+
+    # This method returns the URL path.
+    def path(self):
+        return self.__environ.get('SCRIPT_NAME', '') + self.__environ.get('PATH_INFO', '')
+
+    # This method returns the HTTP method of the request.
+    def method(self):
+        return self.__environ['REQUEST_METHOD']
+
+    # This method returns a cookie morsel.
+    def make_cookie(self, name, value, **attributes):
+        cookie = Cookie.SimpleCookie()
+        cookie[name] = value
+        for key, attr_value in attributes.items():
+            cookie[name][key.replace('_', '-')] = attr_value
+        return cookie[name]
+
+    # This method returns the status line of the response.
+    def get_status_line(self, status=None):
+        if status == None: status = self.status
+        return "%i %s" % (status, httplib.responses.get(status, ""))
+
+    # This method parses the WSGI request for variables and files.
+    def _parse_fields(self, vars, files):
+        self.__field_storage = cgi.FieldStorage(fp=self.__environ.get('wsgi.input'), environ=self.__environ,
+                                                keep_blank_values=1)
+
+        # The body of the request is not a form.
+        if self.__field_storage.list == None: return
+
+        for field in self.__field_storage.list:
+
+            # This is a normal variable.
+            if field.filename == None:
+                vars[field.name] = field.value
+
+            # This is a file.
+            else:
+                files[field.name] = KWebFile(kweb_upload_filename(field.filename), field.file)
+
+    # This method extracts the HTTP headers of the request from the WSGI
+    # environment.
+    def _read_headers_in(self):
+        headers_in = {}
+        for key, value in self.__environ.items():
+            if key.startswith('HTTP_'):
+                key = key[5:]
+            elif key != 'CONTENT_TYPE' and key != 'CONTENT_LENGTH':
+                continue
+            headers_in[key.replace('_', '-').title()] = value
+        return headers_in
+
+    # This method parses the cookies of the request.
+    def _read_cookies_in(self):
+        cookies_in = {}
+        try: cookie = Cookie.SimpleCookie(self.__environ.get('HTTP_COOKIE', ''))
+        except Cookie.CookieError: return cookies_in
+        for key, morsel in cookie.items():
+            cookies_in[key] = morsel
+        return cookies_in
+
+    # This method returns the WSGI environment.
+    def _read_env(self):
+        return self.__environ
+
+    # This method returns true if the request was made over SSL.
+    def _is_secure(self):
+        return self.__environ.get('wsgi.url_scheme') == 'https'
+
+    def _send_content_type(self, content_type):
+        self.__response_content_type = content_type
+
+    def _send_header(self, key, value):
+        self.__response_headers[key] = value
+
+    # Morsels from the Cookie module and mod_python-style cookie objects are
+    # accepted; the latter are converted with str().
+    def _send_cookie(self, cookie):
+        if isinstance(cookie, Cookie.Morsel):
+            self.__response_cookies.append(cookie.OutputString())
+        else:
+            self.__response_cookies.append(str(cookie))
+
+    def _send_body(self, data):
+        self.__start_response_once()
+        self.__body.append(data)
+
+    def _send_chunk(self, data):
+        self.__start_response_once()
+        self.__wsgi_write(data)
+
+    # The client is redirected with a 302 status, like util.redirect() does.
+    def _send_redirect(self, url):
+        self.status = 302
+        self.__response_headers['Location'] = url
+        self.__response_content_type = "text/html"
+        self.__body = ['<p>The document has moved <a href=%s>here</a>.</p>\n' % (html_attribute_escape(url))]
+        raise WsgiRedirect()
+
+    def _is_end_of_request(self, exception):
+        return isinstance(exception, WsgiRedirect)
+
+    # This method returns the body of the response to the WSGI server.
+    def _end_request(self):
+        self.__start_response_once()
+        return self.__body
+
+    def _log(self, msg):
+        self.__environ['wsgi.errors'].write(msg + "\n")
+
+    # This method calls start_response() if it has not been called yet.
+    def __start_response_once(self):
+        if self.__wsgi_write != None: return
+        headers = []
+        if self.__response_content_type:
+            headers.append(('Content-Type', self.__response_content_type))
+        for key, value in self.__response_headers.items():
+            headers.append((key, str(value)))
+        for cookie in self.__response_cookies:
+            headers.append(('Set-Cookie', cookie))
+        self.__wsgi_write = self.__start_response(self.get_status_line(), headers)
+
+# This function returns a WSGI application that processes each request with the
+# handler specified, which receives a WsgiFramework object.
+def kweb_wsgi_application(handler):
+    def application(environ, start_response):
+        return WsgiFramework(environ, start_response).use_handler(handler)
+    return application
+
+# This function calls the WSGI application specified in-process and returns the
+# status line, the headers and the body of the response. It is meant for tests
+# and benchmarks.
+def kweb_wsgi_call(application, path='/', query='', method='GET', body='', headers=None, environ=None):
+    from wsgiref.util import setup_testing_defaults
+
+    env = {
+        'REQUEST_METHOD' : method,
+        'PATH_INFO' : path,
+        'QUERY_STRING' : query,
+        'CONTENT_LENGTH' : str(len(body)),
+        'wsgi.input' : StringIO.StringIO(body),
+        'wsgi.errors' : StringIO.StringIO()
+    }
+    if method == 'POST':
+        env['CONTENT_TYPE'] = 'application/x-www-form-urlencoded'
+    if headers:
+        for key, value in headers.items():
+            env['HTTP_' + key.upper().replace('-', '_')] = value
+    if environ:
+        env.update(environ)
+    setup_testing_defaults(env)
+
+    response = {}
+    chunks = []
+    def start_response(status, response_headers, exc_info=None):
+        response['status'] = status
+        response['headers'] = response_headers
+        return chunks.append
+
+    result = application(env, start_response)
+    try:
+        for data in result: chunks.append(data)
+    finally:
+        if hasattr(result, 'close'): result.close()
+
+    return response['status'], response['headers'], "".join(chunks)
+
+
+# non-exhaustive tests
+if __name__ == "__main__":
+    import time
+
+    def handler(k):
+        k.out("<p>Hello %s</p>\n" % (html_text_escape(k.get_var("name") or "world")))
+        if k.get_var("go"): k.redirect(k.build_url(query=""))
+
+    app = kweb_wsgi_application(handler)
+
+    print kweb_wsgi_call(app, query="name=<bob>")
+    print kweb_wsgi_call(app, method='POST', body="name=alice")
+    print kweb_wsgi_call(app, query="go=1")
+
+    def stream_handler(k):
+        k.write("streamed 1\n")
+        k.write("streamed 2\n")
+
+    print kweb_wsgi_call(kweb_wsgi_application(stream_handler))
+
+    # The content coding suffix of the entity tag matches the coding actually
+    # applied: small bodies are sent uncompressed and their entity tag has no
+    # suffix, even when the validators are set before the body is written.
+    def etag_handler(k):
+        k.set_compression(True)
+        if k.get_var("early") and k.not_modified(etag="v1"): return
+        if not k.get_var("early"): k.set_etag("v1")
+        k.out("x" * int(k.get_var("size")))
+    gzip_headers = { 'Accept-Encoding' : 'gzip' }
+    for early in ("", "1"):
+        for size, etag, encoding in [ (10, '"v1"', None), (5000, '"v1-gzip"', "gzip") ]:
+            query = "early=%s&size=%i" % (early, size)
+            status, headers, body = kweb_wsgi_call(kweb_wsgi_application(etag_handler), query=query, headers=gzip_headers)
+            headers = dict(headers)
+            assert headers["ETag"] == etag and headers.get("Content-Encoding") == encoding
+            status, headers, body = kweb_wsgi_call(kweb_wsgi_application(etag_handler), query=query,
+                                                   headers=dict(gzip_headers, **{ 'If-None-Match' : etag }))
+            assert status.startswith("304") and body == ""
+
+    # The flight recorder is logged when a handler fails, but not on
+    # redirects, and the events logged are not logged again.
+    kdebug.set_record_level(1, "wsgi_test")
+    def failing_handler(k):
+        kdebug.debug(1, "handling %s", "wsgi_test", k.path())
+        if k.get_var("go"): k.redirect(k.build_url(query=""))
+        raise ValueError("failure")
+    for query, dumped in [ ("go=1", 0), ("", 2), ("go=1", 0), ("", 2) ]:
+        errors = StringIO.StringIO()
+        try: kweb_wsgi_call(kweb_wsgi_application(failing_handler), query=query, environ={'wsgi.errors' : errors})
+        except ValueError: pass
+        assert errors.getvalue().count("handling /") == dumped
+    kdebug.set_record_level(0, "wsgi_test")
+
+    # Benchmark.
+    nb = 5000
+    start = time.time()
+    for i in range(nb): kweb_wsgi_call(app, query="name=bench")
+    elapsed = time.time() - start
+    print "%i requests in %.3f seconds (%.1f requests/second)" % (nb, elapsed, nb / elapsed)